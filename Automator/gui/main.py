@@ -1,12 +1,11 @@
+import importlib
 from PyQt6.QtCore import Qt
 from logging import getLogger
 
-from PyQt6.QtWidgets import QMainWindow, QLabel, QVBoxLayout, QWidget, QPushButton
+from PyQt6.QtWidgets import QApplication, QMainWindow, QLabel, QVBoxLayout, QWidget, QPushButton
 
 from Automator import __name__, __version__
-from Automator.gui.rescuecommands import RescueCommandsWindow
-from Automator.gui.sysinfo import SysInfoWindow
-from Automator.misc.update_check import run_update_check
+from Automator.misc.update_check import UpdateChecker, show_update_dialog, show_update_ready_dialog
 
 
 class MainWindow(QMainWindow):
@@ -25,9 +24,12 @@ class MainWindow(QMainWindow):
         layout.addWidget(title)
         layout.setAlignment(title, Qt.AlignmentFlag.AlignHCenter)
 
+        # The dialogs (and everything they need, like WMI) are only imported once they're first opened
         button_data = [
-            ('SFC / DISM / CHKDSK scans', 'rescuecommands', lambda: RescueCommandsWindow(self).exec()),
-            ('MSInfo32 Report (Sysinfo)', 'sysinfo', lambda: SysInfoWindow(self).exec()),
+            ('SFC / DISM / CHKDSK scans', 'rescuecommands',
+             lambda: self._open_dialog('Automator.gui.rescuecommands', 'RescueCommandsWindow')),
+            ('MSInfo32 Report (Sysinfo)', 'sysinfo',
+             lambda: self._open_dialog('Automator.gui.sysinfo', 'SysInfoWindow')),
             ('Check for updates', 'updates', None),
             ('Flash ISOs', 'isoflash', None),
             ('Enter safe mode', 'safemode', None),
@@ -47,9 +49,53 @@ class MainWindow(QMainWindow):
             layout.setAlignment(button, Qt.AlignmentFlag.AlignHCenter)
         layout.addStretch()
 
-        run_update_check(self)
+        # The result only arrives once the window is already up, so a slow or missing connection doesn't hold it back
+        self.update_checker = UpdateChecker(parent=self)
+        # noinspection PyUnresolvedReferences
+        self.update_checker.updateAvailable.connect(self._update_available)
+        self.update_checker.start()
 
         main_widget.setLayout(layout)
         self.setWindowTitle('24HS-Automator')
         self.setMinimumSize(500, 300)
         self.setCentralWidget(main_widget)
+
+    def handle_instance_message(self, message: str):
+        """
+        Handles a request forwarded by another launch of the Automator
+        """
+        self.logger.info('Got "{}" from another instance'.format(message))
+        # If one of the tools is already open, bring that to the front instead of stacking another one on top
+        modal_widget = QApplication.activeModalWidget()
+        if modal_widget:
+            modal_widget.raise_()
+            modal_widget.activateWindow()
+            return
+        self.showNormal()
+        self.raise_()
+        self.activateWindow()
+        command, _, argument = message.partition(' ')
+        if command == 'open':
+            button = self.findChild(QPushButton, argument)
+            if button and button.isEnabled():
+                button.click()
+            else:
+                self.logger.warning('There is no tool called "{}"'.format(argument))
+
+    def _open_dialog(self, module_name: str, class_name: str):
+        dialog_class = getattr(importlib.import_module(module_name), class_name)
+        dialog_class(self).exec()
+
+    def _update_available(self, release_data: dict):
+        from Automator.misc.updater import UpdateDownloader, is_onefile_build
+        # When running from source there's no single binary to replace, so just point to the download like before
+        if not is_onefile_build():
+            show_update_dialog(self)
+            return
+        self.logger.info('Downloading update {} in the background'.format(release_data['tag_name']))
+        self.update_downloader = UpdateDownloader(release_data, parent=self)
+        # noinspection PyUnresolvedReferences
+        self.update_downloader.downloadFinished.connect(lambda new_version: show_update_ready_dialog(self, new_version))
+        # noinspection PyUnresolvedReferences
+        self.update_downloader.downloadFailed.connect(lambda _: show_update_dialog(self))
+        self.update_downloader.start()
@@ -0,0 +1,116 @@
+from typing import Callable, Iterable, List, Optional
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from PyQt6.QtWidgets import QPlainTextEdit, QProgressBar
+
+from Automator.misc.progress_parsers import ProgressEvent, ProgressParser, StageEvent
+
+
+class OutputView(QPlainTextEdit):
+    """
+    Read-only plain text view that only keeps the last `max_lines` lines around
+    """
+    def __init__(self, max_lines: int = 10000, *args, **kwargs):
+        super(OutputView, self).__init__(*args, **kwargs)
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(max_lines)
+
+
+class BufferedOutput(QObject):
+    """
+    Collects lines and writes them into an `OutputView` in one go, at most `fps` times per second.
+    Adding a line on its own is cheap, the view is only touched when the timer fires
+    """
+    # Emitted with the number of lines that were just written into the view
+    flushed = pyqtSignal(int)
+
+    def __init__(self, view: OutputView, fps: int = 30, *args, **kwargs):
+        super(BufferedOutput, self).__init__(*args, **kwargs)
+        self.view = view
+        self._lines = []
+        self._timer = QTimer(self)
+        self._timer.setInterval(1000 // fps)
+        # noinspection PyUnresolvedReferences
+        self._timer.timeout.connect(self.flush)
+
+    def append(self, line: str):
+        self._lines.append(line)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def extend(self, lines: Iterable[str]):
+        self._lines.extend(lines)
+        if self._lines and not self._timer.isActive():
+            self._timer.start()
+
+    def pending(self) -> int:
+        """
+        Returns how many lines are waiting for the next flush
+        """
+        return len(self._lines)
+
+    def flush(self):
+        self._timer.stop()
+        if not self._lines:
+            return
+        # Lines older than the view's limit would be thrown out right away, so don't bother adding them
+        max_lines = self.view.maximumBlockCount()
+        count = len(self._lines)
+        lines = self._lines[-max_lines:] if max_lines > 0 else self._lines
+        self._lines = []
+        self.view.appendPlainText('\n'.join(lines))
+        # noinspection PyUnresolvedReferences
+        self.flushed.emit(count)
+
+    def clear(self):
+        self._timer.stop()
+        self._lines = []
+        self.view.clear()
+
+
+class ProgressTracker:
+    """
+    Keeps the highest progress value seen and only touches the progress bar when that value changes.
+    `on_change` is called with every new value
+    """
+    def __init__(self, progress_bar: QProgressBar, on_change: Optional[Callable[[int], None]] = None):
+        self.progress_bar = progress_bar
+        self.on_change = on_change
+        self.value = 0
+
+    def update(self, value: int) -> bool:
+        if value <= self.value:
+            return False
+        self.value = min(value, self.progress_bar.maximum())
+        self.progress_bar.setValue(self.value)
+        if self.on_change:
+            self.on_change(self.value)
+        return True
+
+    def reset(self):
+        self.value = 0
+        self.progress_bar.setValue(0)
+
+
+class ScanOutput:
+    """
+    Runs the output of a scan through its progress parser. Progress ends up in the progress bar, everything else in
+    the output view, with `prefix` in front if several scans share the view
+    """
+    def __init__(self, output: BufferedOutput, progress: ProgressTracker, parser: Optional[ProgressParser] = None,
+                 prefix: str = ''):
+        self.output = output
+        self.progress = progress
+        self.parser = parser
+        self.prefix = prefix
+        # The last stage the tool reported, if any
+        self.stage: Optional[int] = None
+
+    def feed(self, lines: List[str]):
+        for event in self.parser.parse(lines):
+            if isinstance(event, ProgressEvent):
+                self.progress.update(int(event.percent))
+            else:
+                if isinstance(event, StageEvent):
+                    self.stage = event.stage
+                self.output.append(self.prefix + event.line)
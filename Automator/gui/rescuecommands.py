@@ -1,17 +1,31 @@
 import logging
 import subprocess
-import wmi
+import threading
 import os
 import time
-
-from PyQt6.QtCore import QObject, pyqtSignal
-from PyQt6.QtGui import QPaintEvent, QCloseEvent
-from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QGroupBox, QHBoxLayout, QTextEdit, QProgressBar, \
-    QMessageBox, QAbstractButton
-from watchdog.observers import Observer
-from watchdog.events import PatternMatchingEventHandler
-
-from Automator.misc.cmd import silent_run_as_admin
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from PyQt6.QtGui import QCloseEvent
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QPushButton, QGroupBox, QHBoxLayout, QProgressBar, QMessageBox, \
+    QAbstractButton, QGridLayout, QLabel, QFileDialog
+
+from Automator.gui.output import BufferedOutput, OutputView, ProgressTracker, ScanOutput
+from Automator.misc.broker import BrokerError, BrokerNotStarted, connected_broker, get_broker
+from Automator.misc.capture import PushCapture, create_capture
+from Automator.misc.disk_check import CLEAN, REPAIR_QUEUED, REPAIRED, REPAIRING, SCANNING, DiskCheckJob, \
+    DiskCheckPlan
+from Automator.misc.log_analyzer import LogAnalysis, log_offsets, summarize
+from Automator.misc.paths import get_data_path
+from Automator.misc.pipeline import DONE, EXIT_RESTART_REQUIRED, RUNNING, Pipeline, PipelineTask, cancel_resume, \
+    maintenance_tasks, schedule_resume
+from Automator.misc.process import ExitWatcher, ProcessHandle, ResourceUsage, Win32ProcessHandle, format_usage
+from Automator.misc.progress_parsers import MessageEvent, get_parser
+from Automator.misc.repair_sources import RepairSourceImporter, with_repair_source
+from Automator.misc.scan_history import EtaEstimator, ScanHistory, ScanKey, ScanTimeline, format_eta
+from Automator.misc.transcript import TranscriptRecorder
+from Automator.misc.volumes import Volume, get_system_volume, get_volumes
 
 
 class RestartDialog(QMessageBox):
@@ -33,139 +47,251 @@ class RestartDialog(QMessageBox):
             subprocess.Popen(['shutdown', '/r', '/t', '0'])
 
 
+class ResumeDialog(QMessageBox):
+    """
+    Asks whether an interrupted maintenance run should continue, since that needs admin rights and starts scans
+    """
+    CONTINUE = 0
+    LATER = 1
+    DISCARD = 2
+
+    def __init__(self, *args, **kwargs):
+        super(ResumeDialog, self).__init__(
+            QMessageBox.Icon.Question,
+            'Continue maintenance?',
+            'A maintenance run was interrupted before it finished. Do you want to continue it now?',
+            *args, **kwargs
+        )
+        self.continue_button = self.addButton('Continue', QMessageBox.ButtonRole.AcceptRole)
+        self.later_button = self.addButton('Ask me later', QMessageBox.ButtonRole.RejectRole)
+        self.discard_button = self.addButton('Discard', QMessageBox.ButtonRole.DestructiveRole)
+        self.setDefaultButton(self.continue_button)
+
+    def ask(self) -> int:
+        self.exec()
+        if self.clickedButton() is self.continue_button:
+            return self.CONTINUE
+        if self.clickedButton() is self.discard_button:
+            return self.DISCARD
+        return self.LATER
+
+
+class BrokerConnector(QObject):
+    """
+    Starts the elevated broker on a background thread, since that waits for the UAC prompt and for the broker to
+    connect back
+    """
+    brokerConnected = pyqtSignal()
+    # The error, and whether the broker couldn't be started at all (usually because the UAC prompt was declined)
+    brokerFailed = pyqtSignal(str, bool)
+
+    def _run(self):
+        try:
+            get_broker()
+        except BrokerNotStarted as e:
+            # noinspection PyUnresolvedReferences
+            self.brokerFailed.emit(str(e), True)
+            return
+        except (BrokerError, OSError) as e:
+            # noinspection PyUnresolvedReferences
+            self.brokerFailed.emit(str(e), False)
+            return
+        # noinspection PyUnresolvedReferences
+        self.brokerConnected.emit()
+
+    def start(self):
+        threading.Thread(target=self._run, name='BrokerConnector', daemon=True).start()
+
+
 class ProcessWatcher(QObject):
     """
-    Spawns a process as admin and sends signals if new stdout/stderr data is available or the process is closed
+    Spawns a process as admin and sends signals if new stdout/stderr data is available or the process is closed.
+
+    With the 'broker' capture mode (the default), the process is run by the elevated broker, so there's only one UAC
+    prompt per session. The broker has to be connected already (see BrokerConnector), otherwise this falls back to
+    'pipe'. 'pipe' and 'file' start it through its own elevated cmd instead. `answer` is typed into the
+    process once it has started, e.g. 'Y' to confirm something
     """
     processFinished = pyqtSignal()
     newData = pyqtSignal(str)
+    # Same as newData, but with all lines that arrived at once. Much cheaper for the receiving end
+    newLines = pyqtSignal(list)
 
-    def __init__(self, process: str, encoding: str, skip_last_line: bool = True, *args, **kwargs):
+    def __init__(self, process: str, encoding: str, skip_last_line: bool = True, capture_mode: str = 'broker',
+                 answer: Optional[str] = None, *args, **kwargs):
         super(ProcessWatcher, self).__init__(*args, **kwargs)
         self.process = process
         self.encoding = encoding
         self.skip_last_line = skip_last_line
-        self.lines_to_skip = 0
+        self.capture_mode = capture_mode
+        self.answer = answer
         process_name = process.split(' ')[0]
-        # This is only used to check if the process is still running, so it's easier to append the '.exe' here
-        self.process_name = process_name + '.exe'
-        self.cmd_proc = None
-        self.logger = logging.getLogger('ProcessWatcher ' + self.process_name)
-        self.filename = process_name + str(round(time.time())) + '.log'
-        self.observer = Observer()
-
-    def _setup_events(self) -> PatternMatchingEventHandler:
-        self.logger.debug('Setting up events...')
-        self.logger.debug('File name is {}'.format(self.filename))
-        event_handler = PatternMatchingEventHandler(patterns=[self.filename])
-        self.observer = Observer()
-        self.observer.schedule(event_handler, os.path.expandvars('%TEMP%'), recursive=False)
-        event_handler.on_modified = lambda e: self._file_modified()
-        return event_handler
-
-    def _file_modified(self):
-        log_file = os.path.join(os.path.expandvars('%TEMP%'), self.filename)
-        with open(log_file, encoding=self.encoding) as f:
-            lines = f.readlines()
-        if self.skip_last_line:
-            lines.pop(-1)
-        self.logger.debug('File was modified. Got {} new lines'.format(len(lines[self.lines_to_skip:])))
-        for line in lines[self.lines_to_skip:]:
-            line = line.replace('\n', '')
-            if line:
-                # noinspection PyUnresolvedReferences
-                self.newData.emit(line)
-        self.lines_to_skip = len(lines)
-        potential_sfc_proc = wmi.WMI().Win32_Process(name=self.process_name)
-        if not potential_sfc_proc:
-            self._finish()
+        self.logger = logging.getLogger('ProcessWatcher ' + process_name)
+        self.capture_name = process_name + str(round(time.time()))
+        self.capture = None
+        self.handle: Optional[ProcessHandle] = None
+        self.exit_watcher: Optional[ExitWatcher] = None
+        # Only known once the process has finished, None if it was still running when we gave up on it
+        self.exit_code: Optional[int] = None
+        # What the process cost. Only the broker can measure more than the wall time
+        self.usage: Optional[ResourceUsage] = None
+        self._started: Optional[float] = None
+        self._finished = False
+        self._finish_lock = threading.Lock()
+        self.recorder: Optional[TranscriptRecorder] = None
+
+    def _new_lines(self, lines: List[str]):
+        lines = [line for line in lines if line]
+        self.logger.debug('Got {} new lines'.format(len(lines)))
+        if not lines:
+            return
+        if self.recorder:
+            self.recorder.record(lines)
+        # noinspection PyUnresolvedReferences
+        self.newLines.emit(lines)
+        for line in lines:
+            # noinspection PyUnresolvedReferences
+            self.newData.emit(line)
+
+    def _process_exited(self, exit_code: Optional[int]):
+        self.logger.debug('Process exited with code {}'.format(exit_code))
+        self._finish()
 
     def _finish(self):
-        self.observer.stop()
-        self.observer = None
-        log_file = os.path.join(os.path.expandvars('%TEMP%'), self.filename)
-        os.remove(log_file)
-        self.cmd_proc.terminate()
-        os.remove(log_file[:-4] + '.bat')
+        with self._finish_lock:
+            if self._finished:
+                return
+            self._finished = True
+        self.exit_watcher.cancel()
+        self.capture.stop()
+        self.exit_code = self.handle.poll()
+        self.usage = self.handle.usage or ResourceUsage(time.monotonic() - self._started)
+        self.logger.info('Process finished, {}'.format(format_usage(self.usage)))
+        self.handle.close()
+        if self.recorder:
+            self.recorder.close()
         # noinspection PyUnresolvedReferences
         self.processFinished.emit()
 
-    def start(self):
-        self.logger.debug('Starting process...')
-        self._setup_events()
+    def _start_in_broker(self):
+        # Connecting waits for the UAC prompt, that's not something to do on the GUI thread
+        broker = connected_broker()
+        if broker is None:
+            raise BrokerError('Broker is not connected')
+        self.capture = PushCapture(self.encoding, self._new_lines, keep_partial_line=not self.skip_last_line)
+        stdin = (self.answer + '\r\n').encode() if self.answer is not None else None
+        job = broker.run(self.process, self.capture.feed, stdin)
+        job.started.wait(10)
+        return job
+
+    def _start_elevated(self):
+        # Imported here since it needs pywin32, benchmarks/replay.py uses this class elsewhere too
+        from Automator.misc.cmd import silent_run_as_admin
+        self.capture = create_capture(
+            self.capture_mode, self.capture_name, self.encoding, self._new_lines,
+            keep_partial_line=not self.skip_last_line
+        )
+        self.capture.start()
+        command = self.process
+        if self.answer is not None:
+            command = 'echo {}|{}'.format(self.answer, command)
         # Display the UAC prompt
-        log_file = os.path.join(os.path.expandvars('%TEMP%'), self.filename)
-        proc_or_false = silent_run_as_admin(self.process + ' 1>{} 2>&1'.format(log_file))
+        proc_or_false = silent_run_as_admin(self.capture.redirect(command))
         if not proc_or_false:
+            self.capture.stop()
             raise RuntimeError('User has not accepted the UAC prompt')
-        # Wait for the program to start
-        while True:
-            try:
-                wmi.WMI().Win32_Process(name=self.process_name)
-            # AttributeError is normal if the process doesn't exist yet
-            except AttributeError:
-                pass
-            else:
-                break
-        self.observer.start()
-        # For... reasons, Windows doesn't check if a file has changed unless it's actually read out.
-        # So here we construct a small batch file to read out the file continuously
-        bat_name = self.filename[:-4] + '.bat'
-        with open(os.path.join(os.path.expandvars('%TEMP%'), bat_name), 'w') as f:
-            f.write('''
-            @echo off\n
-            :start\n
-            timeout /nobreak /t 2 >nul\n
-            type "{}" 1>nul 2>&1\n
-            goto start\n
-            '''.format(log_file))
-        startupinfo = subprocess.STARTUPINFO()
-        startupinfo.dwFlags = subprocess.STARTF_USESHOWWINDOW
-        startupinfo.wShowWindow = 0
-        self.cmd_proc = subprocess.Popen(
-            ['cmd', '/c', os.path.join(os.path.expandvars('%TEMP%'), bat_name)],
-            startupinfo=startupinfo
-        )
+        return Win32ProcessHandle(proc_or_false['hProcess'])
 
-    def cancel(self):
-        potential_sfc_proc = wmi.WMI().Win32_Process(name=self.process_name)
-        if not potential_sfc_proc:
-            raise RuntimeError('Process could not be found')
-        # Once we end the process, the file will be written to one last time. This will then run _file_modified(),
-        # which in turn will then run _finished (again), and that will then fail because the process isn't running
-        # anymore. With this, we don't get the last bit of % / messages, but I doubt that's gonna matter when the user
-        # cancels it anyways
-        self.observer.unschedule_all()
-        # Send the terminate signal to the process
-        # FIXME: This will target the first process that is found. With something like SFC this is fine, but if we
-        #        only run CMD for example, we will end other processes not "belonging" to us
-        potential_sfc_proc[0].Terminate()
-        # Wait for it to close
-        while True:
-            potential_sfc_proc = wmi.WMI().Win32_Process(name=self.process_name)
-            if not potential_sfc_proc:
-                break
+    def start(self):
+        self.logger.debug('Starting process...')
+        self._started = time.monotonic()
+        # Transcripts of real scans are what benchmarks/replay.py runs on
+        if os.environ.get('AUTOMATOR_RECORD_TRANSCRIPTS'):
+            transcript_dir = get_data_path('transcripts')
+            if not os.path.isdir(transcript_dir):
+                os.mkdir(transcript_dir)
+            transcript_path = os.path.join(transcript_dir, self.capture_name + '.jsonl')
+            self.logger.info('Recording transcript to {}'.format(transcript_path))
+            self.recorder = TranscriptRecorder(transcript_path, self.process, self.encoding)
+        if self.capture_mode == 'broker':
+            try:
+                self.handle = self._start_in_broker()
+            except BrokerError as e:
+                self.logger.warning('Could not run the process in the broker, falling back to a pipe: {}'.format(e))
+                self.capture_mode = 'pipe'
+        if self.handle is None:
+            self.handle = self._start_elevated()
+        self.logger.debug('Capturing output with {}'.format(type(self.capture).__name__))
+        self.logger.debug('Process started with PID {}'.format(self.handle.pid))
+        self.exit_watcher = ExitWatcher(self.handle, self._process_exited)
+        self.exit_watcher.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until the process has exited or `timeout` seconds have passed. Returns whether the process exited
+        """
+        if self.handle is None:
+            return True
+        return self.has_finished() or self.handle.wait(timeout)
+
+    def cancel(self, timeout: Optional[float] = 10) -> bool:
+        """
+        Ends the process and returns whether it exited. Cancel buttons race with the process finishing on its own, so
+        a process that's already done is fine too, that just returns False
+        """
+        if self.has_finished():
+            self.logger.debug('Process has already finished, nothing to cancel')
+            return False
+        self.handle.terminate()
+        exited = self.handle.wait(timeout)
+        if not exited:
+            self.logger.warning('Process did not exit within {} seconds after being terminated'.format(timeout))
+        # The exit watcher will also try to finish us up once it notices the exit. _finish() only ever runs once, so
+        # calling it here as well is fine
         self._finish()
+        return exited
 
     def has_finished(self) -> bool:
-        return not wmi.WMI().Win32_Process(name=self.process_name)
+        return self._finished or self.handle is None or self.handle.poll() is not None
 
 
 class RescueCommandsWindow(QDialog):
+    # How many lines of output are kept in the dialog, older ones are dropped
+    max_output_lines = 10000
+
     def __init__(self, *args, **kwargs):
         super(RescueCommandsWindow, self).__init__(*args, **kwargs)
         self.layout = QVBoxLayout()
 
         self.logger = logging.getLogger('Rescuecommands')
-        self.sfc_watcher: ProcessWatcher
-        self.dism_watcher: ProcessWatcher
+        self.sfc_watcher: Optional[ProcessWatcher] = None
+        self.dism_watcher: Optional[ProcessWatcher] = None
+        self.chkdsk_watchers: Dict[str, ProcessWatcher] = {}
+        self.disk_check: Optional[DiskCheckPlan] = None
+        self.volume_progress: Dict[str, Tuple[ProgressTracker, QLabel]] = {}
+        self.pipeline: Optional[Pipeline] = None
+        self.pipeline_watcher: Optional[ProcessWatcher] = None
+        # Set once a scan reports that it needs a restart to finish up
+        self.restart_required = False
+        # Sizes of CBS.log and dism.log when the current scan started
+        self.log_offsets: Dict[str, int] = {}
+        # Timelines of the running scans, 'main' for the one on the big progress bar, otherwise the drive letter
+        self.scan_history = ScanHistory(get_data_path('scan_history.bin'))
+        self.timelines: Dict[str, Tuple[ScanTimeline, EtaEstimator]] = {}
+        self._system_volume: Optional[Volume] = None
+        # The scan that waits for the broker to connect, and whether the broker couldn't be connected to
+        self.broker_connector: Optional[BrokerConnector] = None
+        self._broker_pending: Optional[Callable[[], None]] = None
+        self.broker_unavailable = False
 
         group_box = QGroupBox(self)
         self.button_layout = QHBoxLayout()
         button_data = [
             ('Start SFC scan', self.sfc_start),
             ('Start DISM scan', self.dism_start),
-            ('Start CHKDSK scan', self.chkdsk_start)
+            ('Start CHKDSK scan', self.chkdsk_start),
+            ('Run full maintenance', self.pipeline_start),
+            ('Add repair source', self.add_repair_source)
         ]
         for button_text, callback in button_data:
             button = QPushButton(button_text, self)
@@ -180,32 +306,53 @@ class RescueCommandsWindow(QDialog):
         self.progress_bar = QProgressBar(self)
         self.progress_bar.setMinimum(0)
         self.progress_bar.setMaximum(100)
-        self.progress_bar_value = 0
         # Start with a value of 0 since the empty space looks weird otherwise
         self.progress_bar.setValue(0)
-        self.layout.addWidget(self.progress_bar)
+        self.progress = ProgressTracker(self.progress_bar, lambda value: self._scan_progress('main', value))
+        self.eta_label = QLabel(self)
+        progress_layout = QHBoxLayout()
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.eta_label)
+        self.layout.addLayout(progress_layout)
+        # Counts the ETA down between progress updates
+        self.eta_timer = QTimer(self)
+        self.eta_timer.setInterval(1000)
+        # noinspection PyUnresolvedReferences
+        self.eta_timer.timeout.connect(self._update_eta)
+
+        # Per-volume progress of CHKDSK, only shown while that runs
+        self.volume_box = QGroupBox('Volumes', self)
+        self.volume_layout = QGridLayout()
+        self.volume_box.setLayout(self.volume_layout)
+        self.volume_box.hide()
+        self.layout.addWidget(self.volume_box)
 
-        self.text_area = QTextEdit(self)
+        self.text_area = OutputView(self.max_output_lines, self)
         self.text_area.setPlaceholderText('Click a button to start testing')
-        self.text_area.setReadOnly(True)
         self.layout.addWidget(self.text_area)
+        # Scans can print a whole lot of lines very quickly, so they're added in batches instead of one by one
+        self.output = BufferedOutput(self.text_area, parent=self)
+        self.scan_output = ScanOutput(self.output, self.progress)
 
         self.setWindowTitle('SFC / DISM / CHKDSK scans')
         self.setMinimumSize(500, 300)
         self.setLayout(self.layout)
 
-    def paintEvent(self, a0: QPaintEvent) -> None:
-        self.progress_bar.setValue(self.progress_bar_value)
+        # A maintenance run that was interrupted (usually by the restart it asked for) continues where it left off
+        pipeline = Pipeline.load(maintenance_tasks(), get_data_path('pipeline.json'))
+        if pipeline:
+            QTimer.singleShot(0, lambda: self._offer_resume(pipeline))
 
     def closeEvent(self, a0: QCloseEvent) -> None:
-        if hasattr(self, 'sfc_watcher'):
-            if not self.sfc_watcher.has_finished():
-                self.sfc_watcher.cancel()
-        if hasattr(self, 'dism_watcher'):
-            if not self.dism_watcher.has_finished():
-                self.dism_watcher.cancel()
-        if hasattr(self, 'sfc_watcher') and hasattr(self, 'dism_watcher'):
-            RestartDialog('To finish up the SFC and DISM scans, you\'ll have to restart').exec()
+        if self.pipeline_watcher and not self.pipeline_watcher.has_finished():
+            self.pipeline_cancel()
+        if any(not watcher.has_finished() for watcher in self.chkdsk_watchers.values()):
+            self.chkdsk_cancel()
+        for watcher in [self.sfc_watcher, self.dism_watcher]:
+            if watcher and not watcher.has_finished():
+                watcher.cancel()
+        if self.restart_required:
+            RestartDialog('To finish up the scans, you\'ll have to restart').exec()
 
     def _for_each_button(self, enable=False, ignore_button=-1, ignore_button_text=None, click_connect=None):
         for i in range(self.button_layout.count()):
@@ -221,37 +368,139 @@ class RescueCommandsWindow(QDialog):
             else:
                 button_widget.setEnabled(enable)
 
+    def _connect_broker(self, then: Callable[[], None]) -> bool:
+        """
+        Starts the broker in the background if it isn't connected yet, and calls `then` once it is. Returns whether
+        the caller has to wait for that
+        """
+        if self.broker_unavailable or connected_broker() is not None:
+            return False
+        if self.broker_connector is None:
+            self._for_each_button()
+            self.output.append('Waiting for admin rights...')
+            self.broker_connector = BrokerConnector(parent=self)
+            # noinspection PyUnresolvedReferences
+            self.broker_connector.brokerConnected.connect(self._broker_connected)
+            # noinspection PyUnresolvedReferences
+            self.broker_connector.brokerFailed.connect(self._broker_failed)
+            self.broker_connector.start()
+        self._broker_pending = then
+        return True
+
+    def _broker_connected(self):
+        then, self._broker_pending, self.broker_connector = self._broker_pending, None, None
+        self._for_each_button(enable=True)
+        # Nothing is started behind the back of a closed window
+        if then and self.isVisible():
+            then()
+
+    def _broker_failed(self, error: str, not_started: bool):
+        then, self._broker_pending, self.broker_connector = self._broker_pending, None, None
+        self._for_each_button(enable=True)
+        if not_started:
+            self.logger.info('Broker was not started: {}'.format(error))
+            self.output.append('Admin rights were not granted')
+            return
+        # Every scan asks for admin rights on its own then, like before the broker
+        self.logger.warning('Could not connect to the broker: {}'.format(error))
+        self.broker_unavailable = True
+        if then and self.isVisible():
+            then()
+
     def _setup_scan(self, scan_name: str):
-        self.progress_bar_value = 0
-        self.text_area.clear()
-        self.text_area.append('Starting {} scan...\n'.format(scan_name))
+        self.progress.reset()
+        self.output.clear()
+        self.output.extend(['Starting {} scan...'.format(scan_name), ''])
         self.logger.info('Starting {} scan'.format(scan_name))
 
     def _cancel_scan(self, scan_name: str):
-        self.text_area.append('{} scan cancelled'.format(scan_name))
+        self.output.append('{} scan cancelled'.format(scan_name))
         self.logger.info('{} scan cancelled'.format(scan_name))
 
+    def _scan_succeeded(self, watcher: ProcessWatcher) -> bool:
+        return self.progress.value == self.progress_bar.maximum() and watcher.exit_code in (0, EXIT_RESTART_REQUIRED)
+
     def _check_scan(self, scan_name: str):
-        if self.progress_bar_value != self.progress_bar.maximum():
+        if self.progress.value != self.progress_bar.maximum():
             self.logger.warning('{} scan did not finish successfully!'.format(scan_name))
-            self.text_area.append('{} scan did not finish successfully!'.format(scan_name))
+            self.output.append('{} scan did not finish successfully!'.format(scan_name))
         else:
             self.logger.info('{} scan finished'.format(scan_name))
-            self.text_area.append('\n{} scan finished'.format(scan_name))
+            self.output.extend(['', '{} scan finished'.format(scan_name)])
+
+    def _get_system_volume(self) -> Optional[Volume]:
+        if self._system_volume is None:
+            try:
+                self._system_volume = get_system_volume()
+            except Exception as e:
+                self.logger.warning('Could not look up the system volume: {}'.format(e))
+        return self._system_volume
+
+    def _track_scan(self, scan_id: str, tool: str, volume: Optional[Volume]):
+        """
+        Starts timing a scan, its ETA is estimated from earlier scans of the same tool on similar volumes
+        """
+        key = ScanKey(tool, volume.size, volume.media_type) if volume else ScanKey(tool, 0)
+        self.timelines[scan_id] = (ScanTimeline(key), EtaEstimator(self.scan_history.similar(key)))
+        self.eta_timer.start()
+        self._update_eta()
+
+    def _scan_progress(self, scan_id: str, percent: int):
+        if scan_id in self.timelines:
+            self.timelines[scan_id][0].update(percent)
+            self._update_eta()
+
+    def _stop_tracking(self, scan_id: str, succeeded: bool):
+        """
+        Only scans that went all the way through end up in the history, anything else would throw off the estimates
+        """
+        timeline, _ = self.timelines.pop(scan_id, (None, None))
+        if timeline and succeeded:
+            try:
+                self.scan_history.add(timeline.finish())
+            except OSError as e:
+                self.logger.warning('Could not save the scan history: {}'.format(e))
+        if not self.timelines:
+            self.eta_timer.stop()
+        self._update_eta()
+
+    def _update_eta(self):
+        # With several scans at once (CHKDSK), we're done once the slowest is
+        estimates = [timeline.remaining(estimator) for timeline, estimator in self.timelines.values()]
+        estimates = [estimate for estimate in estimates if estimate is not None]
+        self.eta_label.setText(format_eta(max(estimates)) if estimates else '')
+
+    def _analyze_logs(self, scan_name: str, offsets: Dict[str, int]):
+        """
+        Reads what the scan wrote to CBS.log / dism.log in the background and adds a summary to the output
+        """
+        analysis = LogAnalysis(offsets, parent=self)
+        # noinspection PyUnresolvedReferences
+        analysis.analysisFinished.connect(lambda findings: self.output.extend(
+            ['', '{} results from the logs:'.format(scan_name)] + ['    ' + line for line in summarize(findings)]
+        ))
+        analysis.start()
 
     def sfc_start(self):
+        if self._connect_broker(self.sfc_start):
+            return
         self._setup_scan('SFC')
+        self.scan_output.parser = get_parser('sfc')
+        # Only what SFC writes to the logs from now on is of interest
+        self.log_offsets = log_offsets()
 
         # noinspection PyAttributeOutsideInit
         self.sfc_watcher = ProcessWatcher('sfc /scannow', 'utf_16_le')
         # noinspection PyUnresolvedReferences
         self.sfc_watcher.processFinished.connect(self.sfc_done)
         # noinspection PyUnresolvedReferences
-        self.sfc_watcher.newData.connect(self.sfc_update)
+        self.sfc_watcher.newLines.connect(self.scan_output.feed)
+        self._track_scan('main', 'sfc', self._get_system_volume())
         try:
             self.sfc_watcher.start()
         except RuntimeError:
             self.logger.info('SFC scan aborted')
+            self._stop_tracking('main', False)
             return
 
         self._for_each_button(
@@ -262,37 +511,36 @@ class RescueCommandsWindow(QDialog):
         self.sfc_watcher.cancel()
         self._cancel_scan('SFC')
 
-    def sfc_update(self, line: str):
-        # If the line has a % in it, update the progress bar and don't display it in the main log
-        percent_index = line.find('%')
-        if percent_index != -1:
-            percent_part = next(x for x in line.split(' ') if '%' in x)
-            percent = int(percent_part.replace('%', ''))
-            if percent > self.progress_bar_value:
-                self.progress_bar_value = percent
-        else:
-            self.text_area.append(line)
-
-        self.update()
-
     def sfc_done(self):
         self._for_each_button(
             enable=True, ignore_button=0, ignore_button_text='Start SFC scan', click_connect=self.sfc_start
         )
         self._check_scan('SFC')
+        self._stop_tracking('main', self._scan_succeeded(self.sfc_watcher))
+        self.output.append('SFC ' + format_usage(self.sfc_watcher.usage))
+        self._analyze_logs('SFC', self.log_offsets)
+        if self.sfc_watcher.exit_code == EXIT_RESTART_REQUIRED:
+            self.restart_required = True
 
     def dism_start(self):
+        if self._connect_broker(self.dism_start):
+            return
         self._setup_scan('DISM')
+        self.scan_output.parser = get_parser('dism')
+        self.log_offsets = log_offsets()
+        # Repairs from a cached Windows image if there's one for this build, instead of from Windows Update
         # noinspection PyAttributeOutsideInit
-        self.dism_watcher = ProcessWatcher('DISM /Online /Cleanup-Image /RestoreHealth', 'utf_8')
+        self.dism_watcher = ProcessWatcher(with_repair_source('DISM /Online /Cleanup-Image /RestoreHealth'), 'utf_8')
         # noinspection PyUnresolvedReferences
         self.dism_watcher.processFinished.connect(self.dism_done)
         # noinspection PyUnresolvedReferences
-        self.dism_watcher.newData.connect(self.dism_update)
+        self.dism_watcher.newLines.connect(self.scan_output.feed)
+        self._track_scan('main', 'dism', self._get_system_volume())
         try:
             self.dism_watcher.start()
         except RuntimeError:
             self.logger.info('DISM scan aborted')
+            self._stop_tracking('main', False)
             return
 
         self._for_each_button(
@@ -303,71 +551,256 @@ class RescueCommandsWindow(QDialog):
         self.dism_watcher.cancel()
         self._cancel_scan('DISM')
 
-    def dism_update(self, line: str):
-        percent_index = line.find('%')
-        if percent_index != -1:
-            percent = line[percent_index-5:percent_index-2]
-            percent = percent.replace('=', '').replace(' ', '')
-            percent = int(percent)
-            if percent > self.progress_bar_value:
-                self.progress_bar_value = percent
-        else:
-            self.text_area.append(line)
-
-        self.update()
-
     def dism_done(self):
         self._for_each_button(
             enable=True, ignore_button=1, ignore_button_text='Start DISM scan', click_connect=self.dism_start
         )
 
         self._check_scan('DISM')
+        self._stop_tracking('main', self._scan_succeeded(self.dism_watcher))
+        self.output.append('DISM ' + format_usage(self.dism_watcher.usage))
+        self._analyze_logs('DISM', self.log_offsets)
+        if self.dism_watcher.exit_code == EXIT_RESTART_REQUIRED:
+            self.restart_required = True
 
     def chkdsk_start(self):
+        if self._connect_broker(self.chkdsk_start):
+            return
         self._setup_scan('CHKDSK')
+        try:
+            volumes = get_volumes()
+        except Exception as e:
+            self.logger.warning('Could not list volumes, only checking the system drive: {}'.format(e))
+            volumes = [Volume(os.environ.get('SystemDrive', 'C:'), '', 'NTFS', 0, (0,), True)]
+        self.disk_check = DiskCheckPlan(volumes)
+        self.logger.info('Checking volumes {}'.format(', '.join(volume.letter for volume in volumes)))
+
+        # Every volume gets its own progress bar, the big one shows the average
+        while self.volume_layout.count():
+            self.volume_layout.takeAt(0).widget().deleteLater()
+        self.volume_progress = {}
+        for row, volume in enumerate(volumes):
+            description = '{} {}({:.0f} GB, {})'.format(
+                volume.letter, volume.label + ' ' if volume.label else '', volume.size / 1000 ** 3, volume.file_system
+            )
+            progress_bar = QProgressBar(self)
+            progress_bar.setMaximum(100)
+            progress_bar.setValue(0)
+            tracker = ProgressTracker(
+                progress_bar, lambda value, letter=volume.letter: self._scan_progress(letter, value)
+            )
+            state_label = QLabel(self.disk_check.states[volume.letter], self)
+            self.volume_layout.addWidget(QLabel(description, self), row, 0)
+            self.volume_layout.addWidget(progress_bar, row, 1)
+            self.volume_layout.addWidget(state_label, row, 2)
+            self.volume_progress[volume.letter] = (tracker, state_label)
+        self.volume_box.show()
 
-        with open(os.path.join(os.path.expandvars('%TEMP%'), 'chkdsk_temp.bat'), 'w') as f:
-            f.write("""
-            @echo off\n
-            cd "%TEMP%"\n
-            chkdsk C: /r /x < chkdsk_y.txt\n
-            echo 1 >done.txt
-            """)
+        self._for_each_button(
+            ignore_button=2, ignore_button_text='Cancel CHKDSK scan', click_connect=self.chkdsk_cancel
+        )
+        self._chkdsk_next()
+
+    def _chkdsk_next(self):
+        for job in self.disk_check.next_jobs():
+            letter = job.volume.letter
+            tracker, state_label = self.volume_progress[letter]
+            tracker.reset()
+            state_label.setText(self.disk_check.states[letter])
+            self.output.append('[{}] Starting {}'.format(letter, job.command))
+            scan_output = ScanOutput(
+                self.output, tracker, get_parser('chkdsk', job.command), prefix='[{}] '.format(letter)
+            )
+
+            watcher = ProcessWatcher(job.command, 'utf-8', skip_last_line=False, answer=job.answer)
+            # noinspection PyUnresolvedReferences
+            watcher.newLines.connect(lambda lines, output=scan_output: self._chkdsk_feed(output, lines))
+            # noinspection PyUnresolvedReferences
+            watcher.processFinished.connect(
+                lambda finished_job=job, output=scan_output: self._chkdsk_job_done(finished_job, output)
+            )
+            self._track_scan(letter, 'chkdsk/r' if job.repair else 'chkdsk', job.volume)
+            try:
+                watcher.start()
+            except RuntimeError:
+                self.logger.info('CHKDSK scan aborted')
+                self._stop_tracking(letter, False)
+                self.disk_check.cancel()
+                break
+            self.chkdsk_watchers[letter] = watcher
+        # Anything left waits for a disk that's still busy, so once nothing runs anymore, we're done
+        if not self.chkdsk_watchers:
+            self.chkdsk_done()
+
+    def _chkdsk_feed(self, scan_output: ScanOutput, lines: List[str]):
+        scan_output.feed(lines)
+        trackers = [tracker for tracker, _ in self.volume_progress.values()]
+        self.progress.update(sum(tracker.value for tracker in trackers) // len(trackers))
+
+    def _chkdsk_job_done(self, job: DiskCheckJob, scan_output: ScanOutput):
+        letter = job.volume.letter
+        watcher = self.chkdsk_watchers.pop(letter)
+        state = None
+        if self.disk_check.states[letter] in (SCANNING, REPAIRING):
+            # Without a single stage, CHKDSK only asked to check the volume during the next boot (and got a 'Y')
+            state = self.disk_check.job_finished(job, watcher.exit_code, checked=scan_output.stage is not None)
+            self.logger.info('CHKDSK on {} finished with exit code {}: {}'.format(letter, watcher.exit_code, state))
+            self.output.append('[{}] {}, {}'.format(letter, state, format_usage(watcher.usage)))
+        # A repair that only scheduled itself says nothing about how long repairs take
+        self._stop_tracking(letter, state in (CLEAN, REPAIR_QUEUED, REPAIRED))
+        self.volume_progress[letter][1].setText(self.disk_check.states[letter])
+        self._chkdsk_next()
+
+    def chkdsk_cancel(self):
+        self.disk_check.cancel()
+        for watcher in list(self.chkdsk_watchers.values()):
+            if not watcher.has_finished():
+                watcher.cancel()
+        self._cancel_scan('CHKDSK')
 
-        with open(os.path.join(os.path.expandvars('%TEMP%'), 'chkdsk_y.txt'), 'w') as f:
-            f.write('Y\n')
+    def chkdsk_done(self):
+        self.logger.info('CHKDSK scan done')
+        self._for_each_button(
+            enable=True, ignore_button=2, ignore_button_text='Start CHKDSK scan', click_connect=self.chkdsk_start
+        )
+        self.output.append('')
+        for volume in self.disk_check.volumes:
+            self.output.append('{}: {}'.format(volume.letter, self.disk_check.states[volume.letter]))
+
+        if self.disk_check.restart_required():
+            volumes = ', '.join(self.disk_check.scheduled_volumes())
+            RestartDialog('To repair {}, CHKDSK has to run during a restart'.format(volumes)).exec()
+
+    def pipeline_start(self):
+        self.progress.reset()
+        self.output.clear()
+        self.logger.info('Starting full maintenance')
+        self._pipeline_resume(Pipeline(maintenance_tasks(), get_data_path('pipeline.json')))
+
+    def _offer_resume(self, pipeline: Pipeline):
+        # Showing the results of what ran during the restart doesn't start anything
+        if pipeline.has_pending_tasks():
+            answer = ResumeDialog(self).ask()
+            if answer == ResumeDialog.LATER:
+                self.logger.info('Maintenance is resumed later')
+                return
+            if answer == ResumeDialog.DISCARD:
+                self.logger.info('Interrupted maintenance discarded')
+                pipeline.delete()
+                cancel_resume()
+                return
+        self._pipeline_resume(pipeline)
+
+    def _pipeline_resume(self, pipeline: Pipeline):
+        if pipeline.has_pending_tasks() and self._connect_broker(lambda: self._pipeline_resume(pipeline)):
+            return
+        self.pipeline = pipeline
+        if pipeline.started is not None:
+            self.logger.info('Resuming maintenance')
+            self.output.append('Resuming maintenance...')
+        self._for_each_button(
+            ignore_button=3, ignore_button_text='Cancel maintenance', click_connect=self.pipeline_cancel
+        )
+        self._pipeline_next()
 
-        if os.path.exists(os.path.join(os.path.expandvars('%TEMP%'), 'done.txt')):
-            os.remove(os.path.join(os.path.expandvars('%TEMP%'), 'done.txt'))
+    def _pipeline_next(self):
+        task = self.pipeline.next_task()
+        if task is None:
+            self._pipeline_done()
+            return
+        self.progress.reset()
+        self.output.extend(['', 'Starting {} scan...'.format(task.name), ''])
+        self.logger.info('Starting {} scan'.format(task.name))
+        self.scan_output.parser = get_parser(task.tool, task.command)
+        # The last few messages of every task end up in its results, progress lines are left out
+        result_parser = get_parser(task.tool, task.command)
+        last_lines = deque(maxlen=5)
 
         # noinspection PyAttributeOutsideInit
-        self.chkdsk_watcher = ProcessWatcher(
-            'cmd /c %TEMP%\\chkdsk_temp.bat', 'utf-8', skip_last_line=False
+        self.pipeline_watcher = ProcessWatcher(
+            with_repair_source(task.command), task.encoding, skip_last_line=task.skip_last_line, answer=task.answer
         )
         # noinspection PyUnresolvedReferences
-        self.chkdsk_watcher.processFinished.connect(self.chkdsk_done)
+        self.pipeline_watcher.newLines.connect(self.scan_output.feed)
         # noinspection PyUnresolvedReferences
-        self.chkdsk_watcher.newData.connect(self.text_area.append)
-        self.chkdsk_watcher.start()
-
+        self.pipeline_watcher.newLines.connect(lambda lines: last_lines.extend(
+            event.line for event in result_parser.parse(lines) if isinstance(event, MessageEvent)
+        ))
+        # noinspection PyUnresolvedReferences
+        self.pipeline_watcher.processFinished.connect(lambda: self._pipeline_task_done(task, list(last_lines)))
+        self.pipeline.start_task(task)
+        self.log_offsets = log_offsets()
+        self._track_scan('main', task.tool, self._get_system_volume())
+        try:
+            self.pipeline_watcher.start()
+        except RuntimeError:
+            self.logger.info('Maintenance aborted')
+            self._stop_tracking('main', False)
+            self.pipeline.cancel()
+            self._pipeline_done()
+
+    def _pipeline_task_done(self, task: PipelineTask, last_lines: List[str]):
+        # A cancelled task has already been marked as skipped
+        if self.pipeline.status(task.id) == RUNNING:
+            self.pipeline.finish_task(
+                task, self.pipeline_watcher.exit_code, self.progress.value, last_lines, self.pipeline_watcher.usage
+            )
+            self.logger.info('{} finished with status {}'.format(task.name, self.pipeline.status(task.id)))
+            if task.tool in ('sfc', 'dism'):
+                self._analyze_logs(task.name, self.log_offsets)
+        self._stop_tracking('main', self.pipeline.status(task.id) == DONE)
+        self._pipeline_next()
+
+    def pipeline_cancel(self):
+        self.pipeline.cancel()
+        if not self.pipeline_watcher.has_finished():
+            self.pipeline_watcher.cancel()
+        self._cancel_scan('Maintenance')
+
+    def _pipeline_done(self):
+        self._for_each_button(
+            enable=True, ignore_button=3, ignore_button_text='Run full maintenance', click_connect=self.pipeline_start
+        )
+        self.output.extend(['', 'Maintenance results:'] + self.pipeline.summary())
+        self.restart_required = self.pipeline.restart_required()
+        if self.pipeline.is_finished():
+            self.logger.info('Maintenance finished')
+            self.pipeline.delete()
+            cancel_resume()
+            return
+        if self.pipeline.waiting_for_restart():
+            # The rest happens during the restart, after which we pick up the results
+            schedule_resume()
+            self.output.append('The maintenance continues after the restart')
+            self.restart_required = False
+            RestartDialog('To finish the maintenance, you\'ll have to restart').exec()
+
+    def add_repair_source(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, 'Select the install.wim / install.esd (in the sources folder of a Windows ISO)', '',
+            'Windows images (*.wim *.esd)'
+        )
+        if not path:
+            return
+        self.output.append('Adding repair source {}...'.format(path))
+        self.progress.reset()
         self._for_each_button()
+        # noinspection PyAttributeOutsideInit
+        self.repair_source_importer = RepairSourceImporter(path, parent=self)
+        # noinspection PyUnresolvedReferences
+        self.repair_source_importer.importProgress.connect(self.progress.update)
+        # noinspection PyUnresolvedReferences
+        self.repair_source_importer.importFinished.connect(self._repair_source_added)
+        # noinspection PyUnresolvedReferences
+        self.repair_source_importer.importFailed.connect(self._repair_source_failed)
+        self.repair_source_importer.start()
 
-        while True:
-            if os.path.exists(os.path.join(os.path.expandvars('%TEMP%'), 'done.txt')):
-                break
-        time.sleep(0.5)
-        # noinspection PyProtectedMember
-        self.chkdsk_watcher._finish()
-
-    def chkdsk_done(self):
-        self.logger.info('CHKDSK scan done')
-
-        # Remove all temporary files created
-        temp_path = os.path.expandvars('%TEMP%')
-        for filename in ['chkdsk_temp.bat', 'chkdsk_y.txt', 'done.txt']:
-            os.remove(os.path.join(temp_path, filename))
-
-        # Re-enable buttons
+    def _repair_source_added(self, sources: list):
         self._for_each_button(enable=True)
+        self.output.append('Added repair source for build {}: {}'.format(
+            sources[0].build, ', '.join(source.name for source in sources)
+        ))
 
-        RestartDialog('To run the CHKDSK scan, you will have to restart your computer').exec()
+    def _repair_source_failed(self, error: str):
+        self._for_each_button(enable=True)
+        self.output.append('Could not add repair source: {}'.format(error))
@@ -1,17 +1,29 @@
 import logging
 import os.path
 import shutil
-from typing import Union
+import threading
+import time
+from typing import List, Optional, Union
 # noinspection PyUnresolvedReferences
 from win32com.shell import shell, shellcon
 
-import wmi
-from PyQt6.QtCore import pyqtSignal, Qt, QProcess, QMimeData, QUrl
-from PyQt6.QtGui import QMouseEvent, QCloseEvent, QGuiApplication
+from PyQt6.QtCore import pyqtSignal, Qt, QObject, QProcess, QMimeData, QUrl, QTimer
+from PyQt6.QtGui import QMouseEvent, QGuiApplication
 from PyQt6.QtWidgets import QDialog, QHBoxLayout, QGroupBox, QGridLayout, QLabel, QSpacerItem, QSizePolicy, \
-    QButtonGroup, QRadioButton, QVBoxLayout, QWidget, QLineEdit, QPushButton, QMessageBox
+    QButtonGroup, QRadioButton, QVBoxLayout, QWidget, QLineEdit, QPushButton, QMessageBox, QProgressBar
 
-from Automator.misc.platform_info import is_laptop
+from Automator.misc.hardware_cache import cached_hardware_info
+from Automator.misc.msinfo_report import DEFAULT_PROFILE, REPORT_PROFILES, ReportProfile
+from Automator.misc.platform_info import HardwareInfo, is_laptop
+from Automator.misc.report_export import EXTENSIONS, FORMAT_JSONL, ReportExporter
+from Automator.misc.sysinfo_collector import DONE, CategoryResult, SysInfoCollector, default_providers, write_report
+from Automator.misc.wmi_session import close_session
+
+REPORT_PATH = os.path.join(os.path.expandvars('%ProgramData%'), '24HS-Automator', 'Sysinfo.txt')
+# A fraction of the size of the report, so it fits through upload limits
+COMPRESSED_REPORT_PATH = os.path.splitext(REPORT_PATH)[0] + EXTENSIONS[FORMAT_JSONL]
+# How long a finished report waits for the hardware detection, before it's exported without it
+HARDWARE_DETECTION_TIMEOUT = 30
 
 
 class WrappingLabel(QLabel):
@@ -43,12 +55,116 @@ class WrappingRadioButton(QWidget):
         self.setLayout(self._layout)
 
 
+class HardwareDetection(QObject):
+    """
+    Runs `cached_hardware_info()` on a background thread, since asking WMI can take a few seconds
+    """
+    # The HardwareInfo, or None if it couldn't be detected
+    detected = pyqtSignal(object)
+
+    def _run(self):
+        try:
+            info = cached_hardware_info()
+        except Exception as e:
+            logging.getLogger('SysInfo').warning('Could not detect the hardware: {}'.format(e))
+            info = None
+        finally:
+            close_session()
+        # noinspection PyUnresolvedReferences
+        self.detected.emit(info)
+
+    def start(self):
+        threading.Thread(target=self._run, name='HardwareDetection', daemon=True).start()
+
+
+class NativeReport(QObject):
+    """
+    Creates the report with SysInfoCollector instead of msinfo32, on a background thread. Every run writes to a file
+    of its own, which only replaces the report once the window has accepted it, so a run that was given up on can't
+    overwrite a newer report
+    """
+    # Category, whether it could be collected, how many categories are done and how many there are
+    categoryCollected = pyqtSignal(str, bool, int, int)
+    # The path of the finished report
+    reportFinished = pyqtSignal(str)
+    # The path it would have had, and why it failed
+    reportFailed = pyqtSignal(str, str)
+
+    _runs = 0
+
+    def __init__(self, *args, **kwargs):
+        super(NativeReport, self).__init__(*args, **kwargs)
+        NativeReport._runs += 1
+        self.path = '{}.{}.native'.format(REPORT_PATH, NativeReport._runs)
+        self.cancelled = False
+        self.collector: Optional[SysInfoCollector] = None
+
+    def _run(self):
+        providers = default_providers()
+        done = 0
+
+        def on_progress(result: CategoryResult):
+            nonlocal done
+            done += 1
+            # noinspection PyUnresolvedReferences
+            self.categoryCollected.emit(result.category, result.status == DONE, done, len(providers))
+
+        self.collector = SysInfoCollector(providers, on_progress=on_progress)
+        if self.cancelled:
+            return
+        results = self.collector.collect()
+        if self.cancelled:
+            return
+        try:
+            write_report(self.path, results)
+        except OSError as e:
+            logging.getLogger('SysInfo').error('Could not write the report: {}'.format(e))
+            # noinspection PyUnresolvedReferences
+            self.reportFailed.emit(self.path, str(e))
+            return
+        # noinspection PyUnresolvedReferences
+        self.reportFinished.emit(self.path)
+
+    def start(self):
+        threading.Thread(target=self._run, name='NativeReport', daemon=True).start()
+
+    def cancel(self):
+        """
+        Stops starting categories and throws away the result. Categories that are already being collected can't be
+        interrupted, they finish in the background
+        """
+        self.cancelled = True
+        if self.collector is not None:
+            self.collector.cancel()
+        # noinspection PyUnresolvedReferences
+        self.categoryCollected.disconnect()
+        # noinspection PyUnresolvedReferences
+        self.reportFinished.disconnect()
+        # noinspection PyUnresolvedReferences
+        self.reportFailed.disconnect()
+
+
 class SysInfoWindow(QDialog):
+    """
+    The questionnaire for the msinfo32 report. The report is already created while the questions are answered, and
+    with a different profile as soon as another one is picked. Finish only adds the answers to it
+    """
     def __init__(self, *args, **kwargs):
         super(SysInfoWindow, self).__init__(*args, **kwargs)
         self.logger = logging.getLogger('SysInfo')
-        self.msinfo_proc = QProcess()
-        self.msinfo_proc.finished.connect(self.msinfo_finished)
+        self.msinfo_proc: Optional[QProcess] = None
+        self.native_report: Optional[NativeReport] = None
+        # The profile the current report is (being) created with
+        self.report_profile: Optional[ReportProfile] = None
+        self.report_ready = False
+        self.report_started = 0.0
+        # Once Finish was clicked, the answers are added as soon as the report is ready
+        self.finish_requested = False
+        self.exporting = False
+        self.hardware_info: Optional[HardwareInfo] = None
+        self.hardware_detecting = True
+        # The report is ready, but the hardware detection isn't done yet
+        self.waiting_for_hardware = False
 
         self.layout = QHBoxLayout()
         self._layout = QVBoxLayout()
@@ -133,18 +249,15 @@ class SysInfoWindow(QDialog):
         ), 10, 0, 1, 2)
 
         self.platform_buttons = QButtonGroup()
-        platform_button_desktop = QRadioButton('Desktop')
-        platform_button_desktop.clicked.connect(lambda: self.desktop_group.setEnabled(True))
-        self.platform_buttons.addButton(platform_button_desktop, 1)
-        general_group_layout.addWidget(platform_button_desktop, 11, 0)
-        platform_button_laptop = QRadioButton('Laptop')
-        platform_button_laptop.clicked.connect(lambda: self.desktop_group.setEnabled(False))
-        self.platform_buttons.addButton(platform_button_laptop, 2)
-        if is_laptop():
-            platform_button_laptop.click()
-        else:
-            platform_button_desktop.click()
-        general_group_layout.addWidget(platform_button_laptop, 11, 1)
+        self.platform_button_desktop = QRadioButton('Desktop')
+        self.platform_button_desktop.clicked.connect(lambda: self.desktop_group.setEnabled(True))
+        self.platform_buttons.addButton(self.platform_button_desktop, 1)
+        general_group_layout.addWidget(self.platform_button_desktop, 11, 0)
+        self.platform_button_laptop = QRadioButton('Laptop')
+        self.platform_button_laptop.clicked.connect(lambda: self.desktop_group.setEnabled(False))
+        self.platform_buttons.addButton(self.platform_button_laptop, 2)
+        # Preselected once the hardware detection is done
+        general_group_layout.addWidget(self.platform_button_laptop, 11, 1)
 
         general_group_layout.addItem(
             QSpacerItem(
@@ -240,48 +353,230 @@ class SysInfoWindow(QDialog):
         self.desktop_group.setLayout(desktop_group_layout)
         self.layout.addWidget(self.desktop_group)
         self._layout.addLayout(self.layout)
-        finish_button = QPushButton('Finish')
-        finish_button.clicked.connect(self.finish)
-        finish_button.setMinimumWidth(200)
-        self._layout.addWidget(finish_button, 0, Qt.AlignmentFlag.AlignRight)
+
+        # How much msinfo32 should collect, smaller reports are done a lot quicker
+        self.profile_group = QGroupBox('Report size')
+        profile_group_layout = QHBoxLayout()
+        self.profile_buttons = QButtonGroup()
+        for profile_id, profile in enumerate(REPORT_PROFILES, 1):
+            profile_widget = WrappingRadioButton('{}: {}. Takes {}'.format(
+                profile.name, profile.description, profile.expected_time
+            ))
+            self.profile_buttons.addButton(profile_widget.button, profile_id)
+            if profile.id == DEFAULT_PROFILE:
+                profile_widget.button.setChecked(True)
+            profile_group_layout.addWidget(profile_widget)
+        # noinspection PyUnresolvedReferences
+        self.profile_buttons.idClicked.connect(self.profile_changed)
+        self.profile_group.setLayout(profile_group_layout)
+        self._layout.addWidget(self.profile_group)
+
+        report_progress_layout = QHBoxLayout()
+        self.report_status = QLabel()
+        report_progress_layout.addWidget(self.report_status)
+        self.report_progress = QProgressBar(self)
+        self.report_progress.setMaximumWidth(400)
+        report_progress_layout.addWidget(self.report_progress)
+        self._layout.addLayout(report_progress_layout)
+
+        self.finish_button = QPushButton('Finish')
+        self.finish_button.clicked.connect(self.finish)
+        self.finish_button.setMinimumWidth(200)
+        self._layout.addWidget(self.finish_button, 0, Qt.AlignmentFlag.AlignRight)
 
         self.setWindowTitle('MSInfo32 Report')
         self.setMinimumSize(1200, 500)
         self.setLayout(self._layout)
 
-    def closeEvent(self, a0: QCloseEvent) -> None:
-        if self.msinfo_proc.state() != QProcess.ProcessState.NotRunning:
-            a0.ignore()
+        # Users take minutes for the questions, which is plenty of time to get all of this done in the background
+        self.hardware_detection = HardwareDetection(self)
+        # noinspection PyUnresolvedReferences
+        self.hardware_detection.detected.connect(self.hardware_detected)
+        self.hardware_detection.start()
+        self._start_report(self.selected_profile())
+
+    def _report_running(self) -> bool:
+        # Until its result has been handled
+        if self.native_report is not None:
+            return True
+        return self.msinfo_proc is not None and self.msinfo_proc.state() != QProcess.ProcessState.NotRunning
+
+    def _stop_report(self):
+        if not self._report_running():
+            return
+        if self.native_report is not None:
+            self.native_report.cancel()
+            self.native_report = None
+            return
+        # The report of a killed msinfo32 is useless, so don't hear about it finishing
+        self.msinfo_proc.finished.disconnect()
+        self.msinfo_proc.kill()
+        self.msinfo_proc.waitForFinished(3000)
+
+    def _start_report(self, profile: ReportProfile):
+        self._stop_report()
+        self.logger.info('Creating a {} report'.format(profile.id))
+        self.report_profile = profile
+        self.report_ready = False
+        self.report_started = time.monotonic()
+        if profile.native:
+            self.report_status.setText('Collecting system info')
+            self.report_progress.setRange(0, 1)
+            self.report_progress.setValue(0)
+            self.native_report = NativeReport(self)
+            # noinspection PyUnresolvedReferences
+            self.native_report.categoryCollected.connect(self.category_collected)
+            # noinspection PyUnresolvedReferences
+            self.native_report.reportFinished.connect(self.native_report_finished)
+            # noinspection PyUnresolvedReferences
+            self.native_report.reportFailed.connect(self.native_report_failed)
+            self.native_report.start()
+            return
+        # msinfo32 doesn't tell how far it is
+        self.report_status.setText('MsInfo32 is creating the report')
+        self.report_progress.setRange(0, 0)
+        self.msinfo_proc = QProcess(self)
+        self.msinfo_proc.finished.connect(self.msinfo_finished)
+        self.msinfo_proc.start('msinfo32', ['/report', REPORT_PATH] + profile.arguments())
+
+    def hardware_detected(self, info: Optional[HardwareInfo]):
+        if not self.hardware_detecting:
+            # Too late, the report was exported without it
+            return
+        self.hardware_detecting = False
+        self.hardware_info = info
+        if self.waiting_for_hardware:
+            self.waiting_for_hardware = False
+            self.export_report()
+            return
+        # Unless the user was quicker
+        if info is None or self.platform_buttons.checkedId() != -1:
+            return
+        if is_laptop(info):
+            self.platform_button_laptop.click()
         else:
-            a0.accept()
+            self.platform_button_desktop.click()
+
+    def hardware_detection_timed_out(self):
+        if not self.waiting_for_hardware:
+            return
+        self.logger.warning('No hardware info after {} seconds, exporting without it'.format(
+            HARDWARE_DETECTION_TIMEOUT
+        ))
+        self.hardware_detecting = False
+        self.waiting_for_hardware = False
+        self.export_report()
+
+    def profile_changed(self, _profile_id: int):
+        if self.selected_profile() != self.report_profile:
+            self._start_report(self.selected_profile())
+
+    def done(self, a0: int) -> None:
+        # Closing the window, Esc and accept() all end up here (Esc without a closeEvent). The dialog outlives this,
+        # so whatever still runs in the background has to be stopped now
+        if (self.finish_requested and self._report_running()) or self.waiting_for_hardware or self.exporting:
+            return
+        # Nobody is waiting for a report that's only created in advance
+        self._stop_report()
+        super(SysInfoWindow, self).done(a0)
 
     def finish(self):
         self.logger.info('User pressed finish button')
         for i in range(self.layout.count()):
             widget = self.layout.itemAt(i).widget()
             widget.setEnabled(False)
-        finish_button = self._layout.itemAt(1).widget()
-        finish_button.setEnabled(False)
-        self.msinfo_proc.start(
-            'msinfo32',
-            ['/report', os.path.join(os.path.expandvars('%ProgramData%'), '24HS-Automator', 'Sysinfo.txt')],
-        )
-
-    def msinfo_finished(self):
-        self.logger.info('MsInfo32 finished')
+        self.profile_group.setEnabled(False)
+        self.finish_button.setEnabled(False)
+        self.finish_requested = True
+        if self.report_ready:
+            self.export_report()
+        elif self._report_running():
+            self.logger.info('Waiting for the report to finish')
+        else:
+            # The report made in advance failed, so give it another try
+            self._start_report(self.selected_profile())
 
-        file_path = os.path.join(os.path.expandvars('%ProgramData%'), '24HS-Automator', 'Sysinfo.txt')
+    def selected_profile(self) -> ReportProfile:
+        return REPORT_PROFILES[self.profile_buttons.checkedId() - 1]
 
-        # Re-enable widgets
+    def _enable_widgets(self):
         general_section = self.layout.itemAt(0).widget()
         general_section.setEnabled(True)
         desktop_section = self.layout.itemAt(1).widget()
         desktop_section.setEnabled(False if self.platform_buttons.checkedId() != 2 else True)
-        finish_button = self._layout.itemAt(1).widget()
-        finish_button.setEnabled(True)
-
-        # Add our own info
+        self.profile_group.setEnabled(True)
+        self.finish_button.setEnabled(True)
+
+    def category_collected(self, category: str, collected: bool, done: int, total: int):
+        self.report_status.setText('{} {} ({} of {})'.format(
+            'Collected' if collected else 'Could not collect', category, done, total
+        ))
+        self.report_progress.setRange(0, total)
+        self.report_progress.setValue(done)
+
+    def _is_current_report(self, path: str) -> bool:
+        # A result of a run that was given up on can still be on its way
+        if self.native_report is None or self.native_report.path != path:
+            return False
+        self.native_report = None
+        return True
+
+    def native_report_finished(self, path: str):
+        if not self._is_current_report(path):
+            if os.path.isfile(path):
+                os.remove(path)
+            return
+        try:
+            os.replace(path, REPORT_PATH)
+        except OSError as e:
+            self.logger.error('Could not move the report into place: {}'.format(e))
+            self._report_finished(False, 'The report could not be saved, please try again')
+            return
+        self._report_finished(True)
+
+    def native_report_failed(self, path: str, error: str):
+        if not self._is_current_report(path):
+            return
+        self._report_finished(False, 'The report could not be saved ({}), please try again'.format(error))
+
+    def msinfo_finished(self, exit_code: int, exit_status: QProcess.ExitStatus):
+        ready = exit_status == QProcess.ExitStatus.NormalExit and os.path.isfile(REPORT_PATH)
+        if not ready:
+            self.logger.error('MsInfo32 failed with exit code {}'.format(exit_code))
+        self._report_finished(ready, 'MsInfo32 could not create the report, please try again')
+
+    def _report_finished(self, ready: bool, error: str = ''):
+        self.report_ready = ready
+        self.report_progress.setRange(0, 1)
+        self.report_progress.setValue(1 if ready else 0)
+        self.report_status.setText('The report is ready' if ready else error)
+        if not self.report_ready:
+            if self.finish_requested:
+                self.finish_requested = False
+                self._enable_widgets()
+                QMessageBox(QMessageBox.Icon.Warning, 'System info could not be exported', error).exec()
+            return
+        self.logger.info('The {} report finished after {:.0f} seconds and has {:.1f} MB'.format(
+            self.report_profile.id, time.monotonic() - self.report_started, os.path.getsize(REPORT_PATH) / 1024 ** 2
+        ))
+        if self.finish_requested:
+            self.export_report()
+
+    def export_report(self):
+        file_path = REPORT_PATH
+
+        # Add our own info. Normally the detection is long done by now, asking WMI here would freeze the dialog
+        if self.hardware_detecting:
+            self.logger.info('Waiting for the hardware detection to finish')
+            self.waiting_for_hardware = True
+            QTimer.singleShot(HARDWARE_DETECTION_TIMEOUT * 1000, self.hardware_detection_timed_out)
+            return
+        hardware_info = self.hardware_info
         no_info_text = 'NoInfoGiven'
+        if hardware_info is None:
+            detected_system_type = 'Unknown'
+        else:
+            detected_system_type = 'Laptop' if is_laptop(hardware_info) else 'Desktop'
         with open(file_path, 'a', encoding='utf_16_le') as f:
             f.write('\n')
             f.write('[Automator_additionalInfo]\n')
@@ -290,8 +585,8 @@ class SysInfoWindow(QDialog):
             f.write('Overclocks\t{}\t\n'.format(get_button_text(self.overclock_buttons, no_info_text)))
             f.write('InstallMethod\t{}\t\n'.format(get_button_id(self.install_method, no_info_text)))
             f.write('ModifiedWindows\t{}\t\n'.format(get_button_text(self.tweak_buttons, no_info_text)))
-            f.write('UserSpecifiedSystemType\t{}\t\n'.format(get_button_text(self.platform_buttons)))
-            f.write('AutodetectedSystemType\t{}\t\n'.format('Laptop' if is_laptop() else 'Desktop'))
+            f.write('UserSpecifiedSystemType\t{}\t\n'.format(get_button_text(self.platform_buttons, no_info_text)))
+            f.write('AutodetectedSystemType\t{}\t\n'.format(detected_system_type))
             f.write('PSUModel\t{}\t\n'.format(self.psu_model.text() if self.psu_model.text() else no_info_text))
             f.write('GPUConnectionMethod\t{}\t\n'.format(get_button_text(self.pcie_riser_buttons, no_info_text)))
             f.write('PSUCables\t{}\t\n'.format(self.psu_cables.text() if self.psu_cables.text() else no_info_text))
@@ -301,36 +596,67 @@ class SysInfoWindow(QDialog):
             f.write('[Automator_ramInfo]\n')
             f.write('\n')
             f.write('Name\tSpeed\tDeviceLocator\tPartNumber\tManufacturer\t\n')
-            for ram_stick in wmi.WMI().Win32_PhysicalMemory():
+            for ram_stick in hardware_info.ram_sticks if hardware_info else []:
                 f.write('{}\t{}\t{}\t{}\t{}\t\n'.format(
                     ram_stick.Name, ram_stick.Speed, ram_stick.DeviceLocator, ram_stick.PartNumber, ram_stick.Manufacturer
                 ))
 
+        # Compressing a large report takes a few seconds, so that happens in the background
+        self.exporting = True
+        exporter = ReportExporter(file_path, COMPRESSED_REPORT_PATH, parent=self)
+        # noinspection PyUnresolvedReferences
+        exporter.exportFinished.connect(self.export_finished)
+        # noinspection PyUnresolvedReferences
+        exporter.exportFailed.connect(self.export_failed)
+        exporter.start()
+
+    def export_finished(self, compressed_path: str):
+        self.deliver_report([compressed_path, REPORT_PATH])
+
+    def export_failed(self, _error: str):
+        # The raw report works too, it's just larger
+        self.deliver_report([REPORT_PATH])
+
+    def deliver_report(self, file_paths: List[str]):
+        """
+        Puts the first file on the clipboard and copies all of them to the Desktop (or Downloads)
+        """
+        self.exporting = False
+        # Re-enable widgets
+        self._enable_widgets()
+
         # Copy file to clipboard
         clipboard = QGuiApplication.clipboard()
         file = QMimeData()
-        file.setUrls([QUrl.fromLocalFile(file_path)])
+        file.setUrls([QUrl.fromLocalFile(file_paths[0])])
         clipboard.setMimeData(file)
 
-        # Try to copy the file to the desktop
+        # Try to copy the files to the desktop
         desktop_folder_path = shell.SHGetKnownFolderPath(shellcon.FOLDERID_Desktop, 0, 0)
         try:
-            shutil.copyfile(file_path, os.path.join(desktop_folder_path, os.path.basename(file_path)))
+            for file_path in file_paths:
+                shutil.copyfile(file_path, os.path.join(desktop_folder_path, os.path.basename(file_path)))
         except PermissionError:
             self.logger.warning('Could not copy file to Desktop, trying Downloads instead')
-            shutil.copyfile(
-                file_path,
-                os.path.join(os.path.expandvars('%USERPROFILE%'), 'Downloads', os.path.basename(file_path))
-            )
+            for file_path in file_paths:
+                shutil.copyfile(
+                    file_path,
+                    os.path.join(os.path.expandvars('%USERPROFILE%'), 'Downloads', os.path.basename(file_path))
+                )
             file_location = 'in your Downloads folder'
         else:
             file_location = 'onto your Desktop'
 
         # Prompt the user that their system info is ready
+        message = f'Your system info was saved {file_location}'
+        if len(file_paths) > 1:
+            message += ' as {} (compressed, please send this one) and {}'.format(
+                *[os.path.basename(file_path) for file_path in file_paths]
+            )
         QMessageBox(
             QMessageBox.Icon.Information,
             'System info exported!',
-            f'Your system info was saved {file_location}'
+            message
         ).exec()
         # Close this window so the user doesn't accidentally click "Finish" twice
         self.close()
@@ -0,0 +1,626 @@
+"""
+Runs commands elevated without asking for elevation every single time
+
+The broker is started elevated once per session and connects back to the Automator over an authenticated local
+connection (a named pipe on Windows). It then runs the commands it's sent, streams their output back and reports
+their PIDs and exit codes. Messages are JSON arrays, with stdin and output base64 encoded:
+
+    Automator -> broker: ['run', job_id, command, stdin or null], ['cancel', job_id], ['shutdown']
+    broker -> Automator: ['started', job_id, pid], ['output', job_id, data],
+                         ['exit', job_id, exit_code, ResourceUsage fields], ['error', job_id, message]
+
+Every command runs in a job object, which holds it together with everything it starts. That's used to measure
+what the command cost and to kill all of it when it's cancelled.
+
+Anything the broker runs gets admin rights, so it only runs SFC, DISM and CHKDSK from the system folder, and only
+with the arguments the Automator uses them with. The authkey is handed over in a file that the broker deletes as
+soon as it has read it, since command lines of running processes can be read by anyone. Whoever else gets hold of
+the key still can't do more than send well-formed messages: nothing that arrives is unpickled.
+
+The broker side can also be started unelevated as a stand-in:
+
+    python -m Automator.misc.broker <address> <authkey file> [--allow <program> ...]
+"""
+import argparse
+import base64
+import itertools
+import json
+import logging
+import os
+import re
+import secrets
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from subprocess import list2cmdline
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from Automator.misc.process import ProcessHandle, ResourceUsage, Win32ProcessHandle
+
+# Gets the address and the path of the authkey file, returns the started broker process
+Launcher = Callable[[str, str], Optional[ProcessHandle]]
+ArgumentCheck = Callable[[List[str]], bool]
+
+# Longer messages close the connection, a command line and the answer to its prompt are far shorter than this
+_MAX_REQUEST_SIZE = 64 * 1024
+
+_DRIVE = re.compile(r'^[A-Za-z]:$')
+# What with_repair_source() adds, e.g. '/Source:WIM:C:\\ProgramData\\24HS-Automator\\repair_sources\\install.wim:6'
+_DISM_SOURCE = re.compile(r'^/Source:(WIM|ESD):[A-Za-z]:\\[^"*?<>|]+\.(wim|esd):\d+$', re.IGNORECASE)
+
+
+def _sfc_arguments(args: List[str]) -> bool:
+    return [arg.lower() for arg in args] == ['/scannow']
+
+
+def _dism_arguments(args: List[str]) -> bool:
+    lowered = [arg.lower() for arg in args]
+    if lowered[:3] != ['/online', '/cleanup-image', '/restorehealth']:
+        return False
+    return len(args) == 3 or (len(args) == 5 and bool(_DISM_SOURCE.match(args[3])) and lowered[4] == '/limitaccess')
+
+
+def _chkdsk_arguments(args: List[str]) -> bool:
+    return len(args) >= 1 and bool(_DRIVE.match(args[0])) and [arg.lower() for arg in args[1:]] in (
+        [], ['/scan'], ['/r', '/x']
+    )
+
+
+# The only programs the broker runs, with the arguments they may get
+ALLOWED_COMMANDS: Dict[str, ArgumentCheck] = {
+    'sfc': _sfc_arguments,
+    'dism': _dism_arguments,
+    'chkdsk': _chkdsk_arguments,
+}
+
+
+class BrokerError(Exception):
+    pass
+
+
+class BrokerNotStarted(BrokerError):
+    """
+    The broker couldn't be started at all, usually because the UAC prompt was declined
+    """
+    pass
+
+
+def _encode(*message) -> bytes:
+    return json.dumps(message).encode('utf-8')
+
+
+def _is_job_id(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def parse_request(data: bytes) -> tuple:
+    """
+    Checks a message the broker got and returns it as a tuple, with stdin decoded. Anything that isn't exactly one
+    of the known messages raises ValueError
+    """
+    message = json.loads(data.decode('utf-8'))
+    if not isinstance(message, list) or not message:
+        raise ValueError('Not a message: {!r}'.format(message))
+    if message[0] == 'run' and len(message) == 4 and _is_job_id(message[1]) and isinstance(message[2], str) \
+            and (message[3] is None or isinstance(message[3], str)):
+        stdin = base64.b64decode(message[3], validate=True) if message[3] is not None else None
+        return 'run', message[1], message[2], stdin
+    if message[0] == 'cancel' and len(message) == 2 and _is_job_id(message[1]):
+        return 'cancel', message[1]
+    if message == ['shutdown']:
+        return ('shutdown',)
+    raise ValueError('Unexpected message: {!r}'.format(message))
+
+
+def _system_directory() -> str:
+    import ctypes
+    buffer = ctypes.create_unicode_buffer(260)
+    ctypes.windll.kernel32.GetWindowsDirectoryW(buffer, len(buffer))
+    # A 32 bit Python would be redirected to SysWOW64, where there's no SFC
+    sysnative = os.path.join(buffer.value, 'Sysnative')
+    return sysnative if os.path.isdir(sysnative) else os.path.join(buffer.value, 'System32')
+
+
+def system_programs(names: Iterable[str]) -> Dict[str, str]:
+    """
+    Returns the absolute paths of the given programs in the system folder. Outside of Windows (for the stand-in),
+    they're looked up in the PATH
+    """
+    if os.name == 'nt':
+        directory = _system_directory()
+        return {name: os.path.join(directory, name + '.exe') for name in names}
+    found = {name: shutil.which(name) for name in names}
+    return {name: path for name, path in found.items() if path}
+
+
+def resolve_command(command: str, programs: Dict[str, Tuple[str, Optional[ArgumentCheck]]]) -> List[str]:
+    """
+    Turns a command into the arguments to run, with the program replaced by its absolute path. `programs` maps the
+    allowed program names to their path and the check for their arguments (None allows any). Commands with a path
+    of their own, other programs or other arguments raise BrokerError
+    """
+    parts = [part.strip('"') for part in shlex.split(command, posix=False)]
+    if not parts:
+        raise BrokerError('Empty command')
+    name = parts[0].lower()
+    name = name[:-4] if name.endswith('.exe') else name
+    # A path would let anyone point the broker at a program of their own
+    if name not in programs or os.path.basename(parts[0]) != parts[0]:
+        raise BrokerError('Program is not allowed: {}'.format(parts[0]))
+    path, check = programs[name]
+    if check is not None and not check(parts[1:]):
+        raise BrokerError('Arguments are not allowed: {}'.format(command))
+    return [path] + parts[1:]
+
+
+class _ProcessGroup:
+    """
+    Keeps a process together with everything it starts, so they can be measured and killed as one
+    """
+    def __init__(self, proc: subprocess.Popen):
+        self.proc = proc
+        self.started = time.monotonic()
+        self.exited = False
+        self.logger = logging.getLogger('Broker')
+
+    @staticmethod
+    def popen_kwargs() -> dict:
+        return {}
+
+    def wait(self) -> int:
+        raise NotImplementedError
+
+    def kill(self):
+        raise NotImplementedError
+
+    def usage(self) -> ResourceUsage:
+        return ResourceUsage(time.monotonic() - self.started)
+
+    def close(self):
+        pass
+
+
+class _JobObjectGroup(_ProcessGroup):
+    """
+    Puts the process into a job object. Everything it starts ends up in there too, and the job keeps count of the
+    CPU time, memory and I/O of all of them
+    """
+    def __init__(self, proc: subprocess.Popen):
+        super(_JobObjectGroup, self).__init__(proc)
+        # pywin32 is only available on Windows, so it's imported here to keep this module usable everywhere else
+        import win32api
+        import win32con
+        import win32job
+        self.job = win32job.CreateJobObject(None, '')
+        # If the broker goes down, so does everything it started
+        limits = win32job.QueryInformationJobObject(self.job, win32job.JobObjectExtendedLimitInformation)
+        limits['BasicLimitInformation']['LimitFlags'] |= win32job.JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE
+        win32job.SetInformationJobObject(self.job, win32job.JobObjectExtendedLimitInformation, limits)
+        process = win32api.OpenProcess(win32con.PROCESS_SET_QUOTA | win32con.PROCESS_TERMINATE, False, proc.pid)
+        try:
+            win32job.AssignProcessToJobObject(self.job, process)
+        except win32api.error as e:
+            # It's only measured and killed on its own then
+            self.logger.warning('Could not put process {} into a job object: {}'.format(proc.pid, e))
+        finally:
+            process.Close()
+
+    @staticmethod
+    def popen_kwargs() -> dict:
+        return {'creationflags': subprocess.CREATE_NO_WINDOW}
+
+    def wait(self) -> int:
+        exit_code = self.proc.wait()
+        self.exited = True
+        return exit_code
+
+    def kill(self):
+        import win32job
+        win32job.TerminateJobObject(self.job, 1)
+
+    def usage(self) -> ResourceUsage:
+        import win32job
+        accounting = win32job.QueryInformationJobObject(self.job, win32job.JobObjectBasicAndIoAccountingInformation)
+        limits = win32job.QueryInformationJobObject(self.job, win32job.JobObjectExtendedLimitInformation)
+        basic, io = accounting['BasicInfo'], accounting['IoInfo']
+        return ResourceUsage(
+            wall_time=time.monotonic() - self.started,
+            # Counted in 100 ns intervals
+            cpu_time=(basic['TotalUserTime'] + basic['TotalKernelTime']) / 10 ** 7,
+            peak_memory=limits['PeakJobMemoryUsed'],
+            read_bytes=io['ReadTransferCount'],
+            write_bytes=io['WriteTransferCount']
+        )
+
+    def close(self):
+        self.job.Close()
+
+
+class _PosixProcessGroup(_ProcessGroup):
+    """
+    Stand-in for job objects when the broker runs unelevated outside of Windows: a process group for killing,
+    and the rusage of the process for measuring
+    """
+    def __init__(self, proc: subprocess.Popen):
+        super(_PosixProcessGroup, self).__init__(proc)
+        self._rusage = None
+
+    @staticmethod
+    def popen_kwargs() -> dict:
+        return {'start_new_session': True}
+
+    def wait(self) -> int:
+        _, status, self._rusage = os.wait4(self.proc.pid, 0)
+        self.exited = True
+        self.proc.returncode = os.waitstatus_to_exitcode(status)
+        return self.proc.returncode
+
+    def kill(self):
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def usage(self) -> ResourceUsage:
+        usage = super(_PosixProcessGroup, self).usage()
+        if self._rusage is None:
+            return usage
+        return usage._replace(
+            cpu_time=self._rusage.ru_utime + self._rusage.ru_stime,
+            # Kilobytes on Linux
+            peak_memory=self._rusage.ru_maxrss * 1024,
+            # Counted in 512 byte blocks
+            read_bytes=self._rusage.ru_inblock * 512,
+            write_bytes=self._rusage.ru_oublock * 512
+        )
+
+
+_GroupClass = _JobObjectGroup if os.name == 'nt' else _PosixProcessGroup
+
+
+class _BrokerServer:
+    """
+    The elevated side. Runs commands as they come in and reports back on them
+    """
+    def __init__(self, conn: Connection, programs: Dict[str, Tuple[str, Optional[ArgumentCheck]]]):
+        self.conn = conn
+        self.programs = programs
+        self.logger = logging.getLogger('Broker')
+        self._send_lock = threading.Lock()
+        self._groups: Dict[int, _ProcessGroup] = {}
+
+    def _send(self, *message):
+        with self._send_lock:
+            try:
+                self.conn.send_bytes(_encode(*message))
+            except (OSError, EOFError):
+                # The Automator is gone, the main loop will notice that too
+                pass
+
+    def _run(self, job_id: int, command: str, stdin: Optional[bytes]):
+        try:
+            args = resolve_command(command, self.programs)
+        except BrokerError as e:
+            self.logger.warning('Refused to run {}: {}'.format(command, e))
+            self._send('error', job_id, str(e))
+            return
+        try:
+            proc = subprocess.Popen(
+                args, stdin=subprocess.PIPE if stdin else subprocess.DEVNULL, stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT, **_GroupClass.popen_kwargs()
+            )
+        except OSError as e:
+            self._send('error', job_id, str(e))
+            return
+        group = self._groups[job_id] = _GroupClass(proc)
+        self._send('started', job_id, proc.pid)
+        if stdin:
+            try:
+                proc.stdin.write(stdin)
+                proc.stdin.close()
+            except OSError:
+                # It has already exited without reading its input
+                pass
+        while True:
+            data = os.read(proc.stdout.fileno(), 4096)
+            if not data:
+                break
+            self._send('output', job_id, base64.b64encode(data).decode('ascii'))
+        proc.stdout.close()
+        exit_code = group.wait()
+        usage = group.usage()
+        self._groups.pop(job_id, None)
+        group.close()
+        self._send('exit', job_id, exit_code, list(usage))
+
+    def _kill(self, job_id: int):
+        group = self._groups.get(job_id)
+        if group and not group.exited:
+            # Takes the children down with it
+            group.kill()
+
+    def serve(self):
+        while True:
+            try:
+                message = parse_request(self.conn.recv_bytes(_MAX_REQUEST_SIZE))
+            except (OSError, EOFError):
+                self.logger.info('Connection closed')
+                break
+            except ValueError as e:
+                self.logger.warning('Ignored a message: {}'.format(e))
+                continue
+            if message[0] == 'run':
+                _, job_id, command, stdin = message
+                threading.Thread(target=self._run, args=(job_id, command, stdin), daemon=True).start()
+            elif message[0] == 'cancel':
+                self._kill(message[1])
+            elif message[0] == 'shutdown':
+                break
+        # Nothing we started should outlive us
+        for job_id in list(self._groups):
+            self._kill(job_id)
+        self.conn.close()
+
+
+def read_authkey(path: str) -> bytes:
+    """
+    Reads the authkey the Automator left for the broker, and deletes it right away
+    """
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def serve(address: str, authkey: bytes, extra_programs: Iterable[str] = ()):
+    """
+    Entry point of the broker process. `extra_programs` may be run with any arguments, that's for the unelevated
+    stand-in only
+    """
+    programs = {
+        name: (path, ALLOWED_COMMANDS[name]) for name, path in system_programs(ALLOWED_COMMANDS).items()
+    }
+    programs.update({name: (path, None) for name, path in system_programs(extra_programs).items()})
+    conn = Client(address, authkey=authkey)
+    _BrokerServer(conn, programs).serve()
+
+
+class BrokerJob(ProcessHandle):
+    """
+    A command running in the broker. Behaves like any other process handle
+    """
+    def __init__(self, client: 'BrokerClient', job_id: int, on_output: Callable[[bytes], None]):
+        self.client = client
+        self.job_id = job_id
+        self.on_output = on_output
+        self.pid = 0
+        self.exit_code: Optional[int] = None
+        self.error: Optional[str] = None
+        self.started = threading.Event()
+        self._exited = threading.Event()
+
+    def _set_exit(self, exit_code: int):
+        self.exit_code = exit_code
+        self.started.set()
+        self._exited.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._exited.wait(timeout)
+
+    def poll(self) -> Optional[int]:
+        return self.exit_code if self._exited.is_set() else None
+
+    def terminate(self):
+        try:
+            self.client.cancel(self.job_id)
+        except (OSError, BrokerError):
+            # Without a connection, the broker has already killed everything it was running
+            pass
+
+
+class BrokerClient:
+    """
+    The Automator's side of the broker connection
+    """
+    def __init__(self):
+        self.logger = logging.getLogger('BrokerClient')
+        self.conn: Optional[Connection] = None
+        self._jobs: Dict[int, BrokerJob] = {}
+        self._job_ids = itertools.count(1)
+        self._send_lock = threading.Lock()
+
+    def start(self, launcher: Launcher, timeout: float = 60):
+        """
+        Starts the broker through `launcher`, which gets the address to connect back to and the path of the file with
+        the authkey, and returns the broker process, or None if it couldn't be started (if the UAC prompt was declined
+        for example). Blocks until the broker has connected, so don't call this on the GUI thread
+        """
+        authkey = secrets.token_bytes(32)
+        listener = Listener(authkey=authkey)
+        # Elevated processes don't inherit handles, so the key goes through a file in the user's own temp folder
+        fd, authkey_path = tempfile.mkstemp(prefix='automator-broker-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(authkey)
+        try:
+            self._accept(listener, launcher, authkey_path, timeout)
+        finally:
+            # The broker deletes it itself, unless it never got that far
+            if os.path.exists(authkey_path):
+                os.remove(authkey_path)
+
+    def _accept(self, listener: Listener, launcher: Launcher, authkey_path: str, timeout: float):
+        process = launcher(listener.address, authkey_path)
+        if process is None:
+            listener.close()
+            raise BrokerNotStarted('Broker could not be started')
+        # Listener.accept() has no timeout, so wait for it on the side
+        accepted = {}
+
+        def accept():
+            try:
+                accepted['conn'] = listener.accept()
+            except Exception as e:
+                accepted['error'] = e
+
+        accept_thread = threading.Thread(target=accept, daemon=True)
+        accept_thread.start()
+        deadline = time.monotonic() + timeout
+        exit_code = None
+        while accept_thread.is_alive() and time.monotonic() < deadline:
+            accept_thread.join(0.1)
+            # A broker that has already exited won't connect anymore
+            exit_code = process.poll() if 'conn' not in accepted else None
+            if exit_code is not None:
+                break
+        process.close()
+        if 'conn' not in accepted:
+            listener.close()
+            if exit_code is not None:
+                raise BrokerError('Broker exited with code {} before connecting'.format(exit_code))
+            raise BrokerError('Broker did not connect: {}'.format(accepted.get('error', 'timed out')))
+        listener.close()
+        self.conn = accepted['conn']
+        threading.Thread(target=self._read_loop, name='BrokerClient', daemon=True).start()
+        self.logger.info('Broker is connected')
+
+    @property
+    def connected(self) -> bool:
+        return self.conn is not None
+
+    def _send(self, *message):
+        with self._send_lock:
+            if self.conn is None:
+                raise BrokerError('Broker is not connected')
+            self.conn.send_bytes(_encode(*message))
+
+    def _read_loop(self):
+        while True:
+            try:
+                message = json.loads(self.conn.recv_bytes().decode('utf-8'))
+            except (OSError, EOFError):
+                break
+            except ValueError as e:
+                self.logger.warning('Ignored a message from the broker: {}'.format(e))
+                continue
+            kind, job_id = message[0], message[1]
+            job = self._jobs.get(job_id)
+            if job is None:
+                continue
+            if kind == 'started':
+                job.pid = message[2]
+                job.started.set()
+            elif kind == 'output':
+                job.on_output(base64.b64decode(message[2]))
+            elif kind == 'exit':
+                self._jobs.pop(job_id, None)
+                job.usage = ResourceUsage(*message[3])
+                job._set_exit(message[2])
+            elif kind == 'error':
+                self.logger.error('Job {} failed: {}'.format(job_id, message[2]))
+                self._jobs.pop(job_id, None)
+                job.error = message[2]
+                job._set_exit(-1)
+        self.logger.warning('Lost connection to the broker')
+        self.conn = None
+        # Whatever was still running can't be followed anymore
+        for job in list(self._jobs.values()):
+            job.error = 'Lost connection to the broker'
+            job._set_exit(-1)
+        self._jobs.clear()
+
+    def run(self, command: str, on_output: Callable[[bytes], None], stdin: Optional[bytes] = None) -> BrokerJob:
+        job = BrokerJob(self, next(self._job_ids), on_output)
+        self._jobs[job.job_id] = job
+        self._send('run', job.job_id, command, base64.b64encode(stdin).decode('ascii') if stdin is not None else None)
+        return job
+
+    def cancel(self, job_id: int):
+        self._send('cancel', job_id)
+
+    def shutdown(self):
+        if self.conn is None:
+            return
+        try:
+            self._send('shutdown')
+        except (OSError, BrokerError):
+            pass
+
+
+def elevated_launcher(address: str, authkey_path: str) -> Optional[ProcessHandle]:
+    """
+    Starts the broker as admin. That's the packaged binary or main.py, both know what to do with '--broker'
+    """
+    # Imported here since they need pywin32, while everything else in here works on any platform
+    import pywintypes
+    from win32con import SW_HIDE
+    # noinspection PyUnresolvedReferences
+    from win32com.shell.shell import ShellExecuteEx
+    # noinspection PyUnresolvedReferences
+    from win32com.shell.shellcon import SEE_MASK_NOCLOSEPROCESS
+    args = ['--broker', address, authkey_path]
+    if not getattr(sys, 'frozen', False):
+        args.insert(0, os.path.abspath(sys.argv[0]))
+    # Started directly instead of through 'cmd /c', whose quoting rules differ from everyone else's
+    try:
+        proc = ShellExecuteEx(
+            nShow=SW_HIDE, fMask=SEE_MASK_NOCLOSEPROCESS, lpVerb='runas', lpFile=sys.executable,
+            lpParameters=list2cmdline(args)
+        )
+    except pywintypes.error as e:
+        logging.getLogger('BrokerClient').error('Could not start the broker: {}'.format(e))
+        return None
+    return Win32ProcessHandle(proc['hProcess'])
+
+
+_broker: Optional[BrokerClient] = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> BrokerClient:
+    """
+    Returns the session's broker, starting it (and showing the one UAC prompt) if it isn't running yet. That can take
+    a while, see `BrokerClient.start()`
+    """
+    global _broker
+    with _broker_lock:
+        if _broker is None or not _broker.connected:
+            client = BrokerClient()
+            client.start(elevated_launcher)
+            _broker = client
+        return _broker
+
+
+def connected_broker() -> Optional[BrokerClient]:
+    """
+    Returns the session's broker if it's connected, without starting it
+    """
+    with _broker_lock:
+        return _broker if _broker is not None and _broker.connected else None
+
+
+def shutdown_broker():
+    with _broker_lock:
+        if _broker is not None:
+            _broker.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('address')
+    parser.add_argument('authkey_file')
+    parser.add_argument(
+        '--allow', nargs='*', default=[], help='Additional programs the broker may run, with any arguments'
+    )
+    args = parser.parse_args()
+    serve(args.address, read_authkey(args.authkey_file), args.allow)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+import logging
+import os
+import subprocess
+import threading
+import uuid
+from typing import Callable, List, Optional
+
+from watchdog.events import PatternMatchingEventHandler
+from watchdog.observers import Observer
+
+from Automator.misc.tail_reader import LineDecoder, TailReader
+
+LinesCallback = Callable[[List[str]], None]
+ClosedCallback = Callable[[], None]
+
+
+class OutputCapture:
+    """
+    Collects the stdout/stderr of a command started elsewhere (usually elevated) and hands it over line by line.
+    `on_lines` is called with every batch of new lines, `on_closed` once the output has ended by itself
+    """
+    def __init__(self, encoding: str, on_lines: LinesCallback, on_closed: Optional[ClosedCallback] = None,
+                 keep_partial_line: bool = False):
+        self.encoding = encoding
+        self.on_lines = on_lines
+        self.on_closed = on_closed
+        self.keep_partial_line = keep_partial_line
+        self.logger = logging.getLogger(type(self).__name__)
+
+    def redirect(self, command: str) -> str:
+        """
+        Returns `command` with its output redirected to wherever this capture reads from, in cmd's syntax
+        """
+        return command
+
+    def start(self):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def _handle_lines(self, lines: List[str]):
+        if lines:
+            self.on_lines(lines)
+
+
+class FileCapture(OutputCapture):
+    """
+    Lets the command write into a file in %TEMP% and reads new data from it whenever it is modified
+    """
+    def __init__(self, name: str, *args, **kwargs):
+        super(FileCapture, self).__init__(*args, **kwargs)
+        self.filename = name + '.log'
+        self.path = os.path.join(os.path.expandvars('%TEMP%'), self.filename)
+        self.reader = TailReader(self.path, self.encoding)
+        # The observer's thread and stop() both read, the reader's offset and decoder can only take one at a time
+        self._read_lock = threading.Lock()
+        self.observer = None
+        self.cmd_proc = None
+
+    def redirect(self, command: str) -> str:
+        # %TEMP% is in the user's folder, which often has a space in it
+        return command + ' 1>"{}" 2>&1'.format(self.path)
+
+    def _read_new_lines(self, flush: bool = False):
+        # Lines are handed over under the lock too, so batches can't overtake each other
+        with self._read_lock:
+            self._handle_lines(self.reader.read_lines())
+            if flush:
+                self._handle_lines(self.reader.flush())
+
+    def start(self):
+        self.logger.debug('File name is {}'.format(self.filename))
+        event_handler = PatternMatchingEventHandler(patterns=[self.filename])
+        event_handler.on_modified = lambda e: self._read_new_lines()
+        self.observer = Observer()
+        self.observer.schedule(event_handler, os.path.dirname(self.path), recursive=False)
+        self.observer.start()
+        # For... reasons, Windows doesn't check if a file has changed unless it's actually read out.
+        # So here we construct a small batch file to read out the file continuously
+        with open(self.path[:-4] + '.bat', 'w') as f:
+            f.write('''
+            @echo off\n
+            :start\n
+            timeout /nobreak /t 2 >nul\n
+            type "{}" 1>nul 2>&1\n
+            goto start\n
+            '''.format(self.path))
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags = subprocess.STARTF_USESHOWWINDOW
+        startupinfo.wShowWindow = 0
+        self.cmd_proc = subprocess.Popen(['cmd', '/c', self.path[:-4] + '.bat'], startupinfo=startupinfo)
+
+    def stop(self):
+        if self.observer:
+            self.observer.stop()
+            # An event that's being handled right now has to be done before the last read
+            self.observer.join()
+            self.observer = None
+        # Pick up anything written between the last event and the process exiting
+        self._read_new_lines(flush=self.keep_partial_line)
+        if self.cmd_proc:
+            self.cmd_proc.terminate()
+            self.cmd_proc = None
+        for path in [self.path, self.path[:-4] + '.bat']:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class StreamCapture(OutputCapture):
+    """
+    Reads the output from a stream on a background thread as soon as it is written.
+    Subclasses only have to provide the stream itself
+    """
+    chunk_size = 4096
+
+    def __init__(self, *args, **kwargs):
+        super(StreamCapture, self).__init__(*args, **kwargs)
+        self._decoder = LineDecoder(self.encoding)
+        self._thread = None
+        self._stopping = False
+
+    def _open_stream(self):
+        raise NotImplementedError
+
+    def _read_chunk(self) -> bytes:
+        """
+        Blocks until new data is available. Returns an empty bytes object once the stream has ended
+        """
+        raise NotImplementedError
+
+    def _close_stream(self):
+        raise NotImplementedError
+
+    def _interrupt(self):
+        """
+        Called by `stop()` to unblock a reader that is still waiting in `_open_stream()` or `_read_chunk()`
+        """
+        pass
+
+    def _read_loop(self):
+        try:
+            self._open_stream()
+            while True:
+                chunk = self._read_chunk()
+                if not chunk:
+                    break
+                self._handle_lines(self._decoder.feed(chunk))
+        except OSError as e:
+            if not self._stopping:
+                self.logger.warning('Reading output failed: {}'.format(e))
+        finally:
+            self._close_stream()
+        if self.keep_partial_line:
+            self._handle_lines(self._decoder.flush())
+        if not self._stopping and self.on_closed:
+            self.on_closed()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._read_loop, name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        if self._thread and self._thread is not threading.current_thread():
+            self._interrupt()
+            self._thread.join(5)
+
+
+class NamedPipeCapture(StreamCapture):
+    """
+    Creates a named pipe that the (elevated) command writes its output into
+    """
+    def __init__(self, name: str, *args, **kwargs):
+        super(NamedPipeCapture, self).__init__(*args, **kwargs)
+        self.pipe_name = r'\\.\pipe\24HS-Automator-{}-{}'.format(name, uuid.uuid4().hex)
+        self._handle = None
+        # pywin32 is only available on Windows, so it's imported here to keep this module usable everywhere else
+        import win32pipe
+        self._handle = win32pipe.CreateNamedPipe(
+            self.pipe_name,
+            win32pipe.PIPE_ACCESS_INBOUND,
+            win32pipe.PIPE_TYPE_BYTE | win32pipe.PIPE_READMODE_BYTE | win32pipe.PIPE_WAIT,
+            1, 0, 64 * 1024, 0, None
+        )
+
+    def redirect(self, command: str) -> str:
+        return command + ' 1>"{}" 2>&1'.format(self.pipe_name)
+
+    def _open_stream(self):
+        import win32pipe
+        import pywintypes
+        try:
+            win32pipe.ConnectNamedPipe(self._handle, None)
+        except pywintypes.error as e:
+            # ERROR_PIPE_CONNECTED, the client was faster than us
+            if e.winerror != 535:
+                raise OSError(e.winerror, e.strerror)
+
+    def _read_chunk(self) -> bytes:
+        import win32file
+        import pywintypes
+        try:
+            _, data = win32file.ReadFile(self._handle, self.chunk_size)
+        except pywintypes.error as e:
+            # ERROR_BROKEN_PIPE, the writing side was closed
+            if e.winerror == 109:
+                return b''
+            raise OSError(e.winerror, e.strerror)
+        return data
+
+    def _close_stream(self):
+        if self._handle:
+            self._handle.Close()
+            self._handle = None
+
+    def _interrupt(self):
+        import win32file
+        import pywintypes
+        # If nobody ever connected (the UAC prompt was declined for example), the reader is stuck waiting for a
+        # client. Connecting and immediately disconnecting ourselves gets it going again
+        try:
+            handle = win32file.CreateFile(
+                self.pipe_name, win32file.GENERIC_WRITE, 0, None, win32file.OPEN_EXISTING, 0, None
+            )
+        except pywintypes.error:
+            return
+        handle.Close()
+
+
+class LocalProcessCapture(StreamCapture):
+    """
+    Runs a local, unelevated process and reads its output through a regular pipe.
+    Useful as a stand-in for the elevated commands on machines without UAC
+    """
+    def __init__(self, args: List[str], *a, **kwargs):
+        super(LocalProcessCapture, self).__init__(*a, **kwargs)
+        self.args = args
+        self.proc = None
+        # Known once the output has ended
+        self.exit_code: Optional[int] = None
+
+    def _open_stream(self):
+        self.proc = subprocess.Popen(self.args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    def _read_chunk(self) -> bytes:
+        return os.read(self.proc.stdout.fileno(), self.chunk_size)
+
+    def _close_stream(self):
+        if self.proc:
+            self.proc.stdout.close()
+            self.exit_code = self.proc.wait()
+
+    def _interrupt(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.kill()
+
+
+class PushCapture(OutputCapture):
+    """
+    For output that's handed over chunk by chunk from elsewhere (the broker), instead of being read by the capture
+    """
+    def __init__(self, *args, **kwargs):
+        super(PushCapture, self).__init__(*args, **kwargs)
+        self._decoder = LineDecoder(self.encoding)
+        self._lock = threading.Lock()
+
+    def feed(self, data: bytes):
+        with self._lock:
+            self._handle_lines(self._decoder.feed(data))
+
+    def start(self):
+        pass
+
+    def stop(self):
+        with self._lock:
+            lines = self._decoder.flush()
+            if self.keep_partial_line:
+                self._handle_lines(lines)
+
+
+def create_capture(mode: str, name: str, encoding: str, on_lines: LinesCallback,
+                   on_closed: Optional[ClosedCallback] = None, keep_partial_line: bool = False,
+                   args: Optional[List[str]] = None) -> OutputCapture:
+    """
+    Creates the capture for `mode` ('pipe' or 'file'), falling back to 'file' if a pipe can't be set up. 'local' runs
+    `args` unelevated as a stand-in, the capture starts the process itself then
+    """
+    if mode == 'local':
+        return LocalProcessCapture(args, encoding, on_lines, on_closed, keep_partial_line)
+    if mode == 'pipe':
+        try:
+            return NamedPipeCapture(name, encoding, on_lines, on_closed, keep_partial_line)
+        except Exception as e:
+            logging.getLogger('OutputCapture').warning('Could not create pipe, falling back to file: {}'.format(e))
+    return FileCapture(name, encoding, on_lines, on_closed, keep_partial_line)
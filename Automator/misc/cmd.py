@@ -1,5 +1,4 @@
 import logging
-from subprocess import list2cmdline
 from typing import Union
 
 from win32con import SW_HIDE
@@ -10,10 +9,13 @@ from win32com.shell.shellcon import SEE_MASK_NOCLOSEPROCESS
 
 
 def silent_run_as_admin(command: str) -> Union[dict, bool]:
+    """
+    Runs `command` (in cmd's own syntax, quotes, pipes and redirections included) through an elevated cmd
+    """
     logger = logging.getLogger('UACHelper')
-    params = list2cmdline([
-        '/c', command
-    ])
+    # With /s, cmd only strips the outer quotes and takes everything in between as it is. Escaping the command again
+    # would turn its quotes into \", which cmd doesn't understand
+    params = '/s /c "{}"'.format(command)
     logger.debug('Trying to run command as admin: \'cmd {}\''.format(params))
     # noinspection PyBroadException
     try:
@@ -0,0 +1,121 @@
+"""
+Plans CHKDSK runs over several volumes: a quick online scan everywhere, and the slow offline repair only where the
+scan found something it couldn't fix. Volumes on different physical disks are checked at the same time
+"""
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from Automator.misc.volumes import Volume
+
+QUEUED = 'queued'
+SCANNING = 'scanning'
+CLEAN = 'clean'
+REPAIR_QUEUED = 'repair queued'
+REPAIRING = 'repairing'
+REPAIRED = 'repaired'
+# The repair runs during the next boot, since the volume can't be dismounted (the system drive, or a volume another
+# process won't let go of)
+SCHEDULED = 'scheduled for restart'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+UNSUPPORTED = 'unsupported'
+
+# Only NTFS can be scanned while in use. FAT volumes can be checked read-only, everything else (ReFS) isn't checked
+# by CHKDSK at all
+_ONLINE_SCAN_FILE_SYSTEMS = {'NTFS'}
+_READ_ONLY_FILE_SYSTEMS = {'FAT', 'FAT32', 'EXFAT'}
+
+# CHKDSK exit codes: 0 nothing found, 1 errors were fixed, 2 cleanup was done, 3 errors are left that need /f
+_EXIT_NEEDS_REPAIR = 3
+
+
+def repair_command(letter: str) -> str:
+    """
+    The offline repair, which also looks for bad sectors. /x dismounts the volume first, on the system drive CHKDSK
+    offers to run during the next boot instead
+    """
+    return 'chkdsk {} /r /x'.format(letter)
+
+
+class DiskCheckJob(NamedTuple):
+    volume: Volume
+    command: str
+    # Typed into CHKDSK to confirm dismounting the volume or scheduling the check
+    answer: Optional[str]
+    repair: bool
+
+
+class DiskCheckPlan:
+    """
+    Keeps track of the state of every volume and hands out whatever can run next
+    """
+    def __init__(self, volumes: List[Volume]):
+        self.volumes = list(volumes)
+        self.states: Dict[str, str] = {}
+        self.exit_codes: Dict[str, int] = {}
+        self._busy_disks: Set[int] = set()
+        for volume in self.volumes:
+            supported = volume.file_system.upper() in _ONLINE_SCAN_FILE_SYSTEMS | _READ_ONLY_FILE_SYSTEMS
+            self.states[volume.letter] = QUEUED if supported else UNSUPPORTED
+
+    @staticmethod
+    def _scan_command(volume: Volume) -> str:
+        if volume.file_system.upper() in _ONLINE_SCAN_FILE_SYSTEMS:
+            return 'chkdsk {} /scan'.format(volume.letter)
+        # Without any switches, CHKDSK only reports problems
+        return 'chkdsk {}'.format(volume.letter)
+
+    def next_jobs(self) -> List[DiskCheckJob]:
+        """
+        Returns the jobs that can be started now, at most one per physical disk. They're marked as running
+        """
+        jobs = []
+        for volume in self.volumes:
+            state = self.states[volume.letter]
+            if state not in (QUEUED, REPAIR_QUEUED) or self._busy_disks.intersection(volume.disk_numbers):
+                continue
+            self._busy_disks.update(volume.disk_numbers)
+            if state == QUEUED:
+                self.states[volume.letter] = SCANNING
+                jobs.append(DiskCheckJob(volume, self._scan_command(volume), None, False))
+            else:
+                self.states[volume.letter] = REPAIRING
+                jobs.append(DiskCheckJob(volume, repair_command(volume.letter), 'Y', True))
+        return jobs
+
+    def job_finished(self, job: DiskCheckJob, exit_code: Optional[int], checked: bool = True) -> str:
+        """
+        Records the result of a job and returns the new state of its volume. `checked` is False if CHKDSK never
+        reached its first stage, so for a repair it only scheduled itself for the next boot
+        """
+        self._busy_disks.difference_update(job.volume.disk_numbers)
+        if exit_code is not None:
+            self.exit_codes[job.volume.letter] = exit_code
+        if exit_code not in (0, 1, 2, _EXIT_NEEDS_REPAIR):
+            state = FAILED
+        elif not job.repair:
+            state = REPAIR_QUEUED if exit_code == _EXIT_NEEDS_REPAIR else CLEAN
+        elif job.volume.is_system or not checked:
+            # The system volume can't be dismounted, so all CHKDSK did was schedule the repair. Other volumes end up
+            # the same way if they're still in use after all
+            state = SCHEDULED
+        else:
+            state = FAILED if exit_code == _EXIT_NEEDS_REPAIR else REPAIRED
+        self.states[job.volume.letter] = state
+        return state
+
+    def cancel(self):
+        for letter, state in self.states.items():
+            if state in (QUEUED, REPAIR_QUEUED, SCANNING, REPAIRING):
+                self.states[letter] = CANCELLED
+        self._busy_disks.clear()
+
+    def is_finished(self) -> bool:
+        return all(
+            state in (CLEAN, REPAIRED, SCHEDULED, FAILED, CANCELLED, UNSUPPORTED) for state in self.states.values()
+        )
+
+    def restart_required(self) -> bool:
+        return SCHEDULED in self.states.values()
+
+    def scheduled_volumes(self) -> List[str]:
+        return [letter for letter, state in self.states.items() if state == SCHEDULED]
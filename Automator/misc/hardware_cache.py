@@ -0,0 +1,162 @@
+import ctypes
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from Automator.misc.paths import get_data_path
+from Automator.misc.platform_info import HardwareInfo, RamStick, get_hardware_info
+
+
+class SnapshotBackend:
+    """
+    Provides everything the hardware cache needs to know about the machine. `boot_id()` and `hardware_id()` are
+    called every time the cache is checked, so they have to be cheap. `collect()` does the expensive work
+    """
+    def boot_id(self) -> str:
+        raise NotImplementedError
+
+    def hardware_id(self) -> str:
+        raise NotImplementedError
+
+    def collect(self) -> HardwareInfo:
+        raise NotImplementedError
+
+
+class _SystemPowerStatus(ctypes.Structure):
+    _fields_ = [
+        ('ACLineStatus', ctypes.c_byte),
+        ('BatteryFlag', ctypes.c_byte),
+        ('BatteryLifePercent', ctypes.c_byte),
+        ('SystemStatusFlag', ctypes.c_byte),
+        ('BatteryLifeTime', ctypes.c_ulong),
+        ('BatteryFullLifeTime', ctypes.c_ulong),
+    ]
+
+
+class WindowsSnapshotBackend(SnapshotBackend):
+    """
+    Identifies the boot session and hardware through the registry and a few cheap Win32 calls, and only falls
+    back to WMI for the actual snapshot
+    """
+    def boot_id(self) -> str:
+        import winreg
+        # Windows increments this counter on every boot
+        try:
+            with winreg.OpenKey(
+                winreg.HKEY_LOCAL_MACHINE,
+                r'SYSTEM\CurrentControlSet\Control\Session Manager\Memory Management\PrefetchParameters'
+            ) as key:
+                return str(winreg.QueryValueEx(key, 'BootId')[0])
+        except OSError:
+            # Older versions don't have it, so use the boot time instead. Rounded, since it's calculated from two
+            # clocks that don't tick at exactly the same time
+            uptime = ctypes.windll.kernel32.GetTickCount64() / 1000
+            return 'boottime-{}'.format(round((time.time() - uptime) / 60))
+
+    def hardware_id(self) -> str:
+        import winreg
+        import win32api
+        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r'SOFTWARE\Microsoft\Cryptography') as key:
+            machine_guid = winreg.QueryValueEx(key, 'MachineGuid')[0]
+        power_status = _SystemPowerStatus()
+        ctypes.windll.kernel32.GetSystemPowerStatus(ctypes.byref(power_status))
+        # 128 means "No system battery"
+        has_battery = (power_status.BatteryFlag & 0xFF) != 128
+        identity = '{}|{}|{}|{}'.format(
+            machine_guid, win32api.GlobalMemoryStatusEx()['TotalPhys'], os.cpu_count(), has_battery
+        )
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    def collect(self) -> HardwareInfo:
+        return get_hardware_info()
+
+
+def _info_to_dict(info: HardwareInfo) -> dict:
+    data = info._asdict()
+    data['ram_sticks'] = [stick._asdict() for stick in info.ram_sticks]
+    return data
+
+
+def _info_from_dict(data: dict) -> HardwareInfo:
+    return HardwareInfo(
+        has_battery=data['has_battery'],
+        pc_system_type=data['pc_system_type'],
+        ram_sticks=[RamStick(**stick) for stick in data['ram_sticks']]
+    )
+
+
+class HardwareCache:
+    """
+    Keeps a snapshot of the hardware info on disk, which stays valid until the next reboot or hardware change
+    """
+    def __init__(self, backend: SnapshotBackend, path: str):
+        self.backend = backend
+        self.path = path
+        self.logger = logging.getLogger('HardwareCache')
+        self._info: Optional[HardwareInfo] = None
+        self._lock = threading.Lock()
+
+    def _load(self, boot_id: str, hardware_id: str) -> Optional[HardwareInfo]:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('boot_id') != boot_id:
+            self.logger.info('System was restarted since the last snapshot')
+            return None
+        if data.get('hardware_id') != hardware_id:
+            self.logger.info('Hardware changed since the last snapshot')
+            return None
+        try:
+            return _info_from_dict(data['info'])
+        except (KeyError, TypeError):
+            return None
+
+    def _save(self, boot_id: str, hardware_id: str, info: HardwareInfo):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'boot_id': boot_id, 'hardware_id': hardware_id, 'info': _info_to_dict(info)}, f)
+        os.replace(temp_path, self.path)
+
+    def get(self) -> HardwareInfo:
+        with self._lock:
+            # Neither the boot session nor the hardware change while we're running, so once we have an answer
+            # there's no need to go to disk again
+            if self._info is not None:
+                return self._info
+            boot_id = self.backend.boot_id()
+            hardware_id = self.backend.hardware_id()
+            info = self._load(boot_id, hardware_id)
+            if info is None:
+                self.logger.info('Collecting new hardware snapshot')
+                info = self.backend.collect()
+                try:
+                    self._save(boot_id, hardware_id, info)
+                except OSError as e:
+                    self.logger.warning('Could not save hardware snapshot: {}'.format(e))
+            self._info = info
+            return info
+
+    def invalidate(self):
+        with self._lock:
+            self._info = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+_default_cache: Optional[HardwareCache] = None
+
+
+def cached_hardware_info() -> HardwareInfo:
+    """
+    Returns the hardware info of this machine, only asking WMI if nothing is cached for the current boot yet
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = HardwareCache(WindowsSnapshotBackend(), get_data_path('hardware_cache.json'))
+    return _default_cache.get()
@@ -0,0 +1,198 @@
+"""
+Pulls the findings of SFC and DISM out of CBS.log and dism.log. Those logs easily get hundreds of MB large, so
+they're read in chunks, starting where they ended when the scan was started
+"""
+import logging
+import os
+import re
+import threading
+from collections import deque
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from Automator.misc.tail_reader import LineDecoder
+
+CBS_LOG = os.path.join(os.path.expandvars('%WINDIR%'), 'Logs', 'CBS', 'CBS.log')
+DISM_LOG = os.path.join(os.path.expandvars('%WINDIR%'), 'Logs', 'DISM', 'dism.log')
+
+# Only this many file names (the first ones) and errors (the last ones) are kept, the counts are always complete
+MAX_FILES = 200
+
+# '[SR] Cannot repair member file [l:12]"x.dll" of ...', 'Hashes for file member [l:12]"x.dll" do not match.'
+# The file name is either quoted after a length prefix or the first word
+_FILE = r'(?:\[[^\]]*\])?"?(?P<file>[^"\s;]+)"?'
+_CORRUPT = [
+    re.compile(r'Hashes for file member ' + _FILE + r' do not match'),
+    re.compile(r'\(p\)\s+CSI Payload Corrupt\s+(?:\(\w+\)\s+)?(?P<file>\S+)'),
+]
+_REPAIRED = [
+    re.compile(r'\[SR\] Repairing (?:corrupted )?file ' + _FILE + r' from store'),
+    re.compile(r'\(p\)\s+CSI Payload Corrupt\s+(?:\(\w+\)\s+)?(?P<file>\S+)\s+Repair complete'),
+]
+_UNREPAIRABLE = [
+    re.compile(r'\[SR\] Cannot repair member file ' + _FILE),
+    re.compile(r'\[SR\] Could not reproject corrupted file ' + _FILE),
+]
+# DISM's own summary, e.g. 'Total Detected Corruption:	3'
+_TOTALS = re.compile(r'Total (Detected|Repaired) Corruption:\s*(\d+)')
+# ', Error                 DISM   DISM.EXE: Failed to ... hr:0x800f081f'
+_ERROR = re.compile(r',\s+Error\s+(?P<message>.*)$')
+# Cheap substring checks, so most lines are never run through a regex
+_INTERESTING = ('[SR]', 'Hashes for file', 'CSI Payload Corrupt', 'Corruption:', 'Error')
+
+
+class LogFindings(NamedTuple):
+    corrupt: List[str]
+    repaired: List[str]
+    unrepairable: List[str]
+    errors: List[str]
+    counts: Dict[str, int]
+    lines_read: int
+    # Set if a log couldn't be read at all
+    problem: Optional[str] = None
+
+
+def log_offsets(paths: Sequence[str] = (CBS_LOG, DISM_LOG)) -> Dict[str, int]:
+    """
+    Returns the current size of every log, call this before the scan starts
+    """
+    offsets = {}
+    for path in paths:
+        try:
+            offsets[path] = os.path.getsize(path)
+        except OSError:
+            offsets[path] = 0
+    return offsets
+
+
+def iter_lines(path: str, offset: int = 0, chunk_size: int = 1024 * 1024, encoding: str = 'utf-8') \
+        -> Iterator[str]:
+    """
+    Yields the lines of `path` from `offset` on. Only one chunk is held in memory at a time
+    """
+    # Windows moves CBS.log to CbsPersist_<date>.log once it's too large. If the log is now smaller than when we
+    # started, that happened in between and the new log only contains our session
+    if os.path.getsize(path) < offset:
+        offset = 0
+    decoder = LineDecoder(encoding)
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield from decoder.feed(chunk)
+    yield from decoder.flush()
+
+
+class _Collector:
+    def __init__(self):
+        self.files = {'corrupt': [], 'repaired': [], 'unrepairable': []}
+        self.seen = {key: set() for key in self.files}
+        self.counts = {'corrupt': 0, 'repaired': 0, 'unrepairable': 0, 'errors': 0}
+        # The last error is usually the one that made the scan fail
+        self.errors = deque(maxlen=MAX_FILES)
+
+    def add(self, category: str, name: str):
+        if name in self.seen[category]:
+            return
+        self.seen[category].add(name)
+        self.counts[category] += 1
+        if len(self.files[category]) < MAX_FILES:
+            self.files[category].append(name)
+
+    def feed(self, line: str):
+        if not any(marker in line for marker in _INTERESTING):
+            return
+        for category, patterns in [('unrepairable', _UNREPAIRABLE), ('repaired', _REPAIRED), ('corrupt', _CORRUPT)]:
+            for pattern in patterns:
+                match = pattern.search(line)
+                if match and 'file' in match.groupdict():
+                    self.add(category, match.group('file'))
+                    # Anything repaired or unrepairable was corrupt in the first place
+                    if category != 'corrupt':
+                        self.add('corrupt', match.group('file'))
+                    return
+        match = _TOTALS.search(line)
+        if match:
+            key = 'dism_detected' if match.group(1) == 'Detected' else 'dism_repaired'
+            self.counts[key] = self.counts.get(key, 0) + int(match.group(2))
+            return
+        match = _ERROR.search(line)
+        if match:
+            self.counts['errors'] += 1
+            self.errors.append(match.group('message').strip())
+
+
+def analyze_logs(offsets: Dict[str, int], chunk_size: int = 1024 * 1024) -> LogFindings:
+    """
+    Reads everything written to the logs in `offsets` since those offsets were recorded
+    """
+    collector = _Collector()
+    lines_read = 0
+    problems = []
+    for path, offset in offsets.items():
+        try:
+            for line in iter_lines(path, offset, chunk_size):
+                lines_read += 1
+                collector.feed(line)
+        except FileNotFoundError:
+            continue
+        except PermissionError:
+            problems.append('{} can only be read as admin'.format(os.path.basename(path)))
+        except OSError as e:
+            problems.append('{} could not be read: {}'.format(os.path.basename(path), e))
+    return LogFindings(
+        corrupt=collector.files['corrupt'],
+        repaired=collector.files['repaired'],
+        unrepairable=collector.files['unrepairable'],
+        errors=list(collector.errors),
+        counts=collector.counts,
+        lines_read=lines_read,
+        problem='; '.join(problems) or None
+    )
+
+
+def summarize(findings: LogFindings, max_files: int = 10) -> List[str]:
+    """
+    Turns the findings into a few lines for the rescue dialog
+    """
+    counts = findings.counts
+    lines = ['Corrupt files found: {}'.format(counts['corrupt'])]
+    if 'dism_detected' in counts:
+        lines.append('Component store corruptions found / repaired: {} / {}'.format(
+            counts['dism_detected'], counts.get('dism_repaired', 0)
+        ))
+    lines.append('Repaired: {}'.format(counts['repaired']))
+    lines.append('Could not be repaired: {}'.format(counts['unrepairable']))
+    lines.extend('    ' + name for name in findings.unrepairable[:max_files])
+    if counts['unrepairable'] > max_files:
+        lines.append('    ... and {} more'.format(counts['unrepairable'] - max_files))
+    if counts['errors']:
+        lines.append('Errors logged: {}, last one: {}'.format(counts['errors'], findings.errors[-1]))
+    if findings.problem:
+        lines.append(findings.problem)
+    return lines
+
+
+class LogAnalysis(QObject):
+    """
+    Runs `analyze_logs()` on a background thread
+    """
+    analysisFinished = pyqtSignal(object)
+
+    def __init__(self, offsets: Dict[str, int], *args, **kwargs):
+        super(LogAnalysis, self).__init__(*args, **kwargs)
+        self.offsets = offsets
+
+    def _run(self):
+        findings = analyze_logs(self.offsets)
+        logging.getLogger('LogAnalyzer').info('Read {} log lines, found {}'.format(
+            findings.lines_read, findings.counts
+        ))
+        # noinspection PyUnresolvedReferences
+        self.analysisFinished.emit(findings)
+
+    def start(self):
+        threading.Thread(target=self._run, name='LogAnalysis', daemon=True).start()
@@ -0,0 +1,342 @@
+"""
+Reads msinfo32 reports (Sysinfo.txt) without decoding all of them.
+
+The reports are UTF-16 text, usually 5-50 MB. Every category starts with a `[Name]` line and holds tab-separated
+tables, which are separated by blank lines:
+
+    [Display]
+
+    Item	Value
+    Name	NVIDIA GeForce RTX 3070
+    ...
+
+Smaller reports can be made with msinfo32's /categories switch, see REPORT_PROFILES.
+
+One pass over the raw bytes finds where every category and table starts and ends, after that a single category can
+be decoded on its own. The categories aren't nested in the file, so their paths ('Components/Display') come from
+the known msinfo32 category tree. To look at a report:
+
+    python -m Automator.misc.msinfo_report <Sysinfo.txt> [<category> ...]
+"""
+import argparse
+import codecs
+import logging
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# The categories that only hold other categories, with their children in report order
+_CHILDREN = {
+    'Hardware Resources': ['Conflicts/Sharing', 'DMA', 'Forced Hardware', 'I/O', 'IRQs', 'Memory'],
+    'Components': [
+        'Multimedia', 'CD-ROM', 'Sound Device', 'Display', 'Infrared', 'Input', 'Modem', 'Network', 'Ports',
+        'Storage', 'Printing', 'Problem Devices', 'USB',
+        # Only in reports of the native collector
+        'Memory'
+    ],
+    'Multimedia': ['Audio Codecs', 'Video Codecs'],
+    'Input': ['Keyboard', 'Pointing Device'],
+    'Network': ['Adapter', 'Protocol', 'WinSock'],
+    'Ports': ['Serial', 'Parallel'],
+    'Storage': ['Drives', 'Disks', 'SCSI', 'IDE'],
+    'Software Environment': [
+        'System Drivers', 'Environment Variables', 'Print Jobs', 'Network Connections', 'Running Tasks',
+        'Loaded Modules', 'Services', 'Program Groups', 'Startup Programs', 'OLE Registration',
+        'Windows Error Reporting', 'Signed Drivers'
+    ],
+}
+_CHILDREN_LOWER = {parent.lower(): {child.lower() for child in children} for parent, children in _CHILDREN.items()}
+
+
+class ReportProfile(NamedTuple):
+    id: str
+    name: str
+    # msinfo32 /categories switches, e.g. '+SystemSummary+ComponentsDisplay'. Empty for everything
+    categories: str
+    description: str
+    # Shown in the dialog so people know what they're in for
+    expected_time: str
+    # Collected by the Automator itself (see sysinfo_collector) instead of msinfo32
+    native: bool = False
+
+    def arguments(self) -> List[str]:
+        return ['/categories', self.categories] if self.categories else []
+
+
+# Most of the time of a full report goes into the software environment (loaded modules, OLE registrations) and the
+# codecs, so leaving those out is what makes the smaller reports fast
+REPORT_PROFILES = [
+    ReportProfile(
+        'quick', 'Quick', '+SystemSummary+ComponentsDisplay+ComponentsStorageDisks+ComponentsProblemDevices',
+        'System summary, graphics, disks and devices with problems', 'a few seconds'
+    ),
+    ReportProfile(
+        'standard', 'Standard',
+        '+SystemSummary+Components-ComponentsMultimedia+SWEnvDrivers+SWEnvSignedDrivers+SWEnvWindowsError',
+        'System summary, all hardware components, drivers and Windows error reports', 'about half a minute'
+    ),
+    ReportProfile('full', 'Full', '', 'Everything msinfo32 knows about', 'one to several minutes'),
+    ReportProfile(
+        'native', 'Without msinfo32', '', 'System summary, graphics, memory, disks, devices with problems, drivers '
+        'and services, collected by the Automator itself', 'a few seconds', native=True
+    ),
+]
+DEFAULT_PROFILE = 'standard'
+
+
+def get_profile(profile_id: str) -> ReportProfile:
+    for profile in REPORT_PROFILES:
+        if profile.id == profile_id:
+            return profile
+    raise ValueError('Unknown report profile {}'.format(profile_id))
+
+
+class SectionEntry(NamedTuple):
+    name: str
+    # 'Components/Display'
+    path: str
+    # Byte offset of the `[Name]` line
+    offset: int
+    # Byte range of the content, up to the next category
+    start: int
+    end: int
+    # Byte ranges of the tables in the content
+    tables: Tuple[Tuple[int, int], ...]
+
+
+class Table(NamedTuple):
+    columns: List[str]
+    rows: List[List[str]]
+
+
+class Section(NamedTuple):
+    name: str
+    path: str
+    tables: List[Table]
+
+    def items(self) -> Dict[str, str]:
+        """
+        For 'Item / Value' categories (like the System Summary), the values by item. If an item shows up several
+        times (once per device), the first one wins
+        """
+        items = {}
+        for table in self.tables:
+            for row in table.rows:
+                if len(row) >= 2:
+                    items.setdefault(row[0], row[1])
+        return items
+
+
+def _detect_encoding(head: bytes) -> Tuple[str, int]:
+    """
+    Returns the encoding and where the text starts. msinfo32 writes UTF-16 LE with a BOM
+    """
+    if head.startswith(codecs.BOM_UTF16_LE):
+        return 'utf_16_le', len(codecs.BOM_UTF16_LE)
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8', len(codecs.BOM_UTF8)
+    # Without a BOM, every other byte of ASCII text in UTF-16 is a zero
+    if len(head) >= 2 and head[1:2] == b'\0':
+        return 'utf_16_le', 0
+    return 'utf-8', 0
+
+
+class _Encoding:
+    def __init__(self, name: str):
+        self.name = name
+        self.unit = 2 if name == 'utf_16_le' else 1
+        self.newline = '\n'.encode(name)
+        self.carriage_return = '\r'.encode(name)
+        self.open_bracket = '['.encode(name)
+        self.close_bracket = ']'.encode(name)
+
+
+def _iter_raw_lines(f, offset: int, encoding: _Encoding, chunk_size: int, end: Optional[int] = None) \
+        -> Iterator[Tuple[int, bytes]]:
+    """
+    Yields (byte offset, line without its line break) for every line up to `end` (or the end of the file), reading
+    `chunk_size` bytes at a time
+    """
+    # Chunks have to end on a character boundary, or the alignment check below breaks
+    chunk_size -= chunk_size % encoding.unit
+    f.seek(offset)
+    buffer = b''
+    buffer_offset = offset
+    read_until = offset
+    while True:
+        chunk = f.read(chunk_size if end is None else min(chunk_size, end - read_until))
+        if not chunk:
+            break
+        read_until += len(chunk)
+        buffer += chunk
+        start = 0
+        while True:
+            position = buffer.find(encoding.newline, start)
+            # In UTF-16, b'\n\0' can also show up across two characters, real line breaks are aligned
+            while position != -1 and position % encoding.unit:
+                position = buffer.find(encoding.newline, position + 1)
+            if position == -1:
+                break
+            yield buffer_offset + start, buffer[start:position]
+            start = position + len(encoding.newline)
+        buffer = buffer[start:]
+        buffer_offset += start
+    if buffer:
+        yield buffer_offset, buffer
+
+
+class MsInfoReport:
+    """
+    A msinfo32 report on disk. The index is built on first use, categories are only decoded when asked for
+    """
+    def __init__(self, path: str, chunk_size: int = 1024 * 1024):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.logger = logging.getLogger('MsInfoReport')
+        self._encoding: Optional[_Encoding] = None
+        self._sections: Optional[List[SectionEntry]] = None
+
+    def _build_index(self) -> List[SectionEntry]:
+        sections = []
+        # Parents of the current category, as (lowercase name, path)
+        stack: List[Tuple[str, str]] = []
+        current = None
+        tables: List[Tuple[int, int]] = []
+        table_start = None
+        with open(self.path, 'rb') as f:
+            encoding_name, text_start = _detect_encoding(f.read(4))
+            encoding = self._encoding = _Encoding(encoding_name)
+
+            def close_section(end: int):
+                if current is None:
+                    return
+                if table_start is not None:
+                    tables.append((table_start, end))
+                sections.append(current._replace(end=end, tables=tuple(tables)))
+
+            for offset, line in _iter_raw_lines(f, text_start, encoding, self.chunk_size):
+                if line.endswith(encoding.carriage_return):
+                    line = line[:-len(encoding.carriage_return)]
+                if line.startswith(encoding.open_bracket) and line.endswith(encoding.close_bracket):
+                    close_section(offset)
+                    name = line[encoding.unit:-encoding.unit].decode(encoding.name)
+                    while stack and name.lower() not in _CHILDREN_LOWER.get(stack[-1][0], ()):
+                        stack.pop()
+                    path = stack[-1][1] + '/' + name if stack else name
+                    if name.lower() in _CHILDREN_LOWER:
+                        stack.append((name.lower(), path))
+                    line_end = offset + len(line) + len(encoding.newline)
+                    current = SectionEntry(name, path, offset, line_end, line_end, ())
+                    tables = []
+                    table_start = None
+                elif current is None:
+                    # The 'System Information report written at' preamble
+                    continue
+                elif not line:
+                    if table_start is not None:
+                        tables.append((table_start, offset))
+                        table_start = None
+                elif table_start is None:
+                    table_start = offset
+            close_section(f.tell())
+        self.logger.debug('Indexed {} categories of {}'.format(len(sections), self.path))
+        return sections
+
+    def sections(self) -> List[SectionEntry]:
+        if self._sections is None:
+            self._sections = self._build_index()
+        return self._sections
+
+    def find(self, path: str) -> Optional[SectionEntry]:
+        """
+        Looks a category up by its path ('Components/Display'), or by its name alone if that's unique. Case doesn't
+        matter
+        """
+        path = path.strip('/').lower()
+        by_name = []
+        for entry in self.sections():
+            if entry.path.lower() == path:
+                return entry
+            if entry.name.lower() == path:
+                by_name.append(entry)
+        return by_name[0] if len(by_name) == 1 else None
+
+    def _read(self, start: int, end: int) -> str:
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start).decode(self._encoding.name, errors='replace')
+
+    def iter_rows(self, entry: SectionEntry) -> Iterator[Tuple[int, List[str]]]:
+        """
+        Yields (table index, cells) for every line of every table in a category, the column names included. Rows
+        are padded to the number of columns, so empty cells at the end still count. Only one chunk of the file is
+        held in memory at a time
+        """
+        encoding = self._encoding
+        width = None
+        with open(self.path, 'rb') as f:
+            for index, (start, end) in enumerate(entry.tables):
+                for _, line in _iter_raw_lines(f, start, encoding, self.chunk_size, end):
+                    text = line.decode(encoding.name, errors='replace').rstrip('\r')
+                    if not text:
+                        continue
+                    # Every cell is followed by a tab, the last one included
+                    cells = (text[:-1] if text.endswith('\t') else text).split('\t')
+                    if width is None:
+                        width = len(cells)
+                    elif len(cells) < width:
+                        cells.extend([''] * (width - len(cells)))
+                    yield index, cells
+
+    def read_section(self, path: str) -> Optional[Section]:
+        """
+        Decodes a single category. The first line of its first table holds the column names, later tables (one per
+        device, for example) use the same columns
+        """
+        entry = self.find(path)
+        if entry is None:
+            return None
+        tables = [Table([], []) for _ in entry.tables]
+        columns = None
+        for index, cells in self.iter_rows(entry):
+            if columns is None:
+                columns = cells
+                continue
+            tables[index].rows.append(cells)
+        return Section(entry.name, entry.path, [Table(columns or [], table.rows) for table in tables])
+
+    def read_text(self, path: str) -> Optional[str]:
+        """
+        Returns the raw text of a category, without its `[Name]` line
+        """
+        entry = self.find(path)
+        if entry is None:
+            return None
+        return self._read(entry.start, entry.end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('report')
+    parser.add_argument('categories', nargs='*', help='Categories to print, all of them are listed if there are none')
+    args = parser.parse_args()
+    report = MsInfoReport(args.report)
+    if not args.categories:
+        for entry in report.sections():
+            print('{:<60} {:>10} {:>10} {:>4} tables'.format(
+                entry.path, entry.offset, entry.end - entry.start, len(entry.tables)
+            ))
+        return
+    for path in args.categories:
+        section = report.read_section(path)
+        if section is None:
+            print('No category {}'.format(path))
+            continue
+        print('[{}]'.format(section.path))
+        for table in section.tables:
+            print('\t'.join(table.columns))
+            for row in table.rows:
+                print('\t'.join(row))
+            print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+import os
+
+
+def get_data_path(*parts: str) -> str:
+    """
+    Returns a path inside the Automator's data folder (%ProgramData%\\24HS-Automator), creating the folder if needed
+    """
+    main_path = os.path.join(os.path.expandvars('%ProgramData%'), '24HS-Automator')
+    if not os.path.isdir(main_path):
+        os.mkdir(main_path)
+    return os.path.join(main_path, *parts)
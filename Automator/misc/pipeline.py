@@ -0,0 +1,295 @@
+"""
+Runs a declared sequence of rescue tasks, remembering where it is so it can continue after a restart
+"""
+import calendar
+import json
+import logging
+import os
+import sys
+import time
+from subprocess import list2cmdline
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from xml.etree import ElementTree
+
+from Automator.misc.disk_check import repair_command
+from Automator.misc.process import ResourceUsage, format_usage
+
+# Returned by DISM (and other Windows tools) when everything worked, but a restart is needed to finish up
+EXIT_RESTART_REQUIRED = 3010
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+# The task has scheduled its work for the next boot (CHKDSK on the system drive)
+WAITING_FOR_RESTART = 'waiting_for_restart'
+
+
+class PipelineTask(NamedTuple):
+    id: str
+    name: str
+    command: str
+    encoding: str
+    # Which progress parser to use, see progress_parsers.get_parser()
+    tool: str
+    depends_on: Tuple[str, ...] = ()
+    # The task only does its actual work during the next boot
+    runs_at_boot: bool = False
+    answer: Optional[str] = None
+    skip_last_line: bool = True
+    # Exit codes that count as success
+    success_codes: Tuple[int, ...] = (0, EXIT_RESTART_REQUIRED)
+
+
+def maintenance_tasks(system_drive: Optional[str] = None) -> List[PipelineTask]:
+    system_drive = system_drive or os.environ.get('SystemDrive', 'C:')
+    return [
+        PipelineTask('dism', 'DISM', 'DISM /Online /Cleanup-Image /RestoreHealth', 'utf_8', 'dism'),
+        # SFC repairs from the component store, so it goes after DISM has repaired that
+        PipelineTask('sfc', 'SFC', 'sfc /scannow', 'utf_16_le', 'sfc', depends_on=('dism',)),
+        # The same repair DiskCheckPlan runs. The system drive is in use, so it's scheduled for the next boot
+        PipelineTask(
+            'chkdsk', 'CHKDSK', repair_command(system_drive), 'utf-8', 'chkdsk', depends_on=('sfc',),
+            runs_at_boot=True,
+            # 1 and 2 mean it found (and fixed) something
+            answer='Y', skip_last_line=False, success_codes=(0, 1, 2)
+        ),
+    ]
+
+
+def _current_boot_id() -> str:
+    from Automator.misc.hardware_cache import WindowsSnapshotBackend
+    return WindowsSnapshotBackend().boot_id()
+
+
+# What CHKDSK printed during the boot ends up in the Application log, written by Wininit
+_BOOT_CHECK_QUERY = "*[System[Provider[@Name='Wininit'] and EventID=1001]]"
+_EVENT_NAMESPACES = {'e': 'http://schemas.microsoft.com/win/2004/08/events/event'}
+
+
+def parse_boot_check_event(xml: str) -> Tuple[float, str]:
+    """
+    Returns when a Wininit event was written (as a timestamp) and its text
+    """
+    event = ElementTree.fromstring(xml)
+    # '2026-10-17T08:01:02.1234567Z', always in UTC
+    created = event.find('e:System/e:TimeCreated', _EVENT_NAMESPACES).get('SystemTime')
+    timestamp = calendar.timegm(time.strptime(created[:19], '%Y-%m-%dT%H:%M:%S'))
+    return timestamp, '\n'.join(data.text or '' for data in event.findall('e:EventData/e:Data', _EVENT_NAMESPACES))
+
+
+def _boot_check_output(task: PipelineTask, since: float) -> Optional[str]:
+    # pywin32 is only available on Windows, so it's imported here to keep this module usable everywhere else
+    import pywintypes
+    import win32evtlog
+    try:
+        events = win32evtlog.EvtQuery(
+            'Application', win32evtlog.EvtQueryChannelPath | win32evtlog.EvtQueryReverseDirection, _BOOT_CHECK_QUERY
+        )
+        # Newest first, the restart was the last one
+        for event in win32evtlog.EvtNext(events, 10):
+            created, output = parse_boot_check_event(win32evtlog.EvtRender(event, win32evtlog.EvtRenderEventXml))
+            if created >= since:
+                return output
+    except pywintypes.error as e:
+        logging.getLogger('Pipeline').warning('Could not read the result of {}: {}'.format(task.name, e))
+    return None
+
+
+def _boot_check_lines(output: str) -> List[str]:
+    # The verdict ('Windows has scanned the file system and found no problems.') comes before a page of statistics
+    lines = [line.strip() for line in output.splitlines() if line.strip()]
+    return [line for line in lines if line.startswith('Windows ')][:3] or lines[-3:]
+
+
+class Pipeline:
+    """
+    Keeps track of which tasks have run and what came out of them. The state is saved after every change, so a
+    pipeline can be picked up again by a later run of the Automator
+    """
+    def __init__(self, tasks: Sequence[PipelineTask], path: str, boot_id: Callable[[], str] = _current_boot_id,
+                 boot_check: Callable[[PipelineTask, float], Optional[str]] = _boot_check_output):
+        self.tasks = list(tasks)
+        self.path = path
+        self.boot_id = boot_id
+        # Returns what a task that ran during the boot printed, if it ran after the given time
+        self.boot_check = boot_check
+        self.logger = logging.getLogger('Pipeline')
+        self.results: Dict[str, dict] = {task.id: {'status': PENDING} for task in self.tasks}
+        self.started: Optional[float] = None
+
+    @classmethod
+    def load(cls, tasks: Sequence[PipelineTask], path: str, boot_id: Callable[[], str] = _current_boot_id,
+             boot_check: Callable[[PipelineTask, float], Optional[str]] = _boot_check_output) -> Optional['Pipeline']:
+        """
+        Returns the saved pipeline, or None if there isn't an unfinished one
+        """
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        pipeline = cls(tasks, path, boot_id, boot_check)
+        if [task.id for task in pipeline.tasks] != data.get('tasks'):
+            pipeline.logger.warning('Saved pipeline has different tasks, ignoring it')
+            return None
+        pipeline.results.update(data['results'])
+        pipeline.started = data.get('started')
+        if pipeline.is_finished():
+            return None
+        pipeline._recover()
+        return pipeline
+
+    def _recover(self):
+        current_boot = self.boot_id()
+        for task in self.tasks:
+            result = self.results[task.id]
+            if result['status'] == RUNNING:
+                # We were closed or the machine went down while it ran, so it has to run again
+                self.logger.info('{} was interrupted, running it again'.format(task.name))
+                result['status'] = PENDING
+            elif result['status'] == WAITING_FOR_RESTART and result.get('boot_id') != current_boot:
+                self._collect_boot_result(task, result)
+        self.save()
+
+    def _collect_boot_result(self, task: PipelineTask, result: dict):
+        output = self.boot_check(task, result.get('finished') or 0)
+        result['finished'] = time.time()
+        if output is None:
+            # Skipped during the boot (any key does that), or it didn't run at all
+            self.logger.warning('{} did not leave a result during the restart'.format(task.name))
+            result['status'] = FAILED
+            result['last_lines'] = ['No result from the restart, the check might have been skipped']
+            return
+        self.logger.info('{} ran during the restart'.format(task.name))
+        result['status'] = DONE
+        result['last_lines'] = _boot_check_lines(output)
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'tasks': [task.id for task in self.tasks],
+                'started': self.started,
+                'results': self.results,
+            }, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def status(self, task_id: str) -> str:
+        return self.results[task_id]['status']
+
+    def next_task(self) -> Optional[PipelineTask]:
+        """
+        Returns the next task that can run, skipping the ones whose dependencies didn't succeed
+        """
+        for task in self.tasks:
+            if self.status(task.id) != PENDING:
+                continue
+            dependencies = [self.status(dependency) for dependency in task.depends_on]
+            if any(status in (FAILED, SKIPPED) for status in dependencies):
+                self.logger.info('Skipping {}, a task it depends on did not succeed'.format(task.name))
+                self.results[task.id]['status'] = SKIPPED
+                self.save()
+                continue
+            if all(status == DONE for status in dependencies):
+                return task
+        return None
+
+    def start_task(self, task: PipelineTask):
+        if self.started is None:
+            self.started = time.time()
+        self.results[task.id] = {'status': RUNNING, 'started': time.time()}
+        self.save()
+
+    def finish_task(self, task: PipelineTask, exit_code: Optional[int], progress: int = 0,
+                    last_lines: Sequence[str] = (), usage: Optional[ResourceUsage] = None):
+        result = self.results[task.id]
+        result.update({
+            'exit_code': exit_code,
+            'progress': progress,
+            'finished': time.time(),
+            'last_lines': list(last_lines),
+            'restart_required': task.runs_at_boot or exit_code == EXIT_RESTART_REQUIRED,
+            'boot_id': self.boot_id(),
+            'usage': usage._asdict() if usage else None,
+        })
+        if exit_code not in task.success_codes:
+            result['status'] = FAILED
+        elif task.runs_at_boot:
+            result['status'] = WAITING_FOR_RESTART
+        else:
+            result['status'] = DONE
+        self.save()
+
+    def cancel(self):
+        for result in self.results.values():
+            if result['status'] in (PENDING, RUNNING):
+                result['status'] = SKIPPED
+        self.save()
+
+    def has_pending_tasks(self) -> bool:
+        return any(result['status'] == PENDING for result in self.results.values())
+
+    def is_finished(self) -> bool:
+        return all(result['status'] in (DONE, FAILED, SKIPPED) for result in self.results.values())
+
+    def waiting_for_restart(self) -> bool:
+        return any(result['status'] == WAITING_FOR_RESTART for result in self.results.values())
+
+    def restart_required(self) -> bool:
+        """
+        Whether a task asked for a restart that hasn't happened yet
+        """
+        current_boot = self.boot_id()
+        return any(
+            result.get('restart_required') and result['status'] in (DONE, WAITING_FOR_RESTART)
+            and result.get('boot_id') == current_boot
+            for result in self.results.values()
+        )
+
+    def summary(self) -> List[str]:
+        lines = []
+        for task in self.tasks:
+            result = self.results[task.id]
+            line = '{}: {}'.format(task.name, result['status'].replace('_', ' '))
+            if result.get('exit_code') is not None:
+                line += ' (exit code {})'.format(result['exit_code'])
+            if result.get('usage'):
+                line += ', ' + format_usage(ResourceUsage(**result['usage']))
+            elif result.get('started') and result.get('finished'):
+                line += ', took {:.0f} min'.format((result['finished'] - result['started']) / 60)
+            lines.append(line)
+            lines.extend('    ' + last_line for last_line in result.get('last_lines', [])[-2:])
+        return lines
+
+
+# RunOnce entries are started once at the next logon and then removed by Windows
+_RUN_ONCE_KEY = r'Software\Microsoft\Windows\CurrentVersion\RunOnce'
+_RUN_ONCE_VALUE = '24HS-Automator-pipeline'
+
+
+def schedule_resume():
+    """
+    Starts the Automator with the rescue dialog open after the next logon, which then continues the pipeline
+    """
+    import winreg
+    if getattr(sys, 'frozen', False):
+        args = [sys.executable]
+    else:
+        args = [sys.executable, os.path.abspath(sys.argv[0])]
+    with winreg.CreateKey(winreg.HKEY_CURRENT_USER, _RUN_ONCE_KEY) as key:
+        winreg.SetValueEx(key, _RUN_ONCE_VALUE, 0, winreg.REG_SZ, list2cmdline(args + ['--open', 'rescuecommands']))
+
+
+def cancel_resume():
+    import winreg
+    try:
+        with winreg.OpenKey(winreg.HKEY_CURRENT_USER, _RUN_ONCE_KEY, 0, winreg.KEY_SET_VALUE) as key:
+            winreg.DeleteValue(key, _RUN_ONCE_VALUE)
+    except OSError:
+        pass
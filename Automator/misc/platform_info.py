@@ -1,14 +1,46 @@
-import wmi
+from typing import List, NamedTuple
 
+from Automator.misc.wmi_session import get_session
+
+
+class RamStick(NamedTuple):
+    Name: str
+    Speed: int
+    DeviceLocator: str
+    PartNumber: str
+    Manufacturer: str
+    FormFactor: int
+
+
+class HardwareInfo(NamedTuple):
+    has_battery: bool
+    pc_system_type: int
+    ram_sticks: List[RamStick]
+
+
+def get_hardware_info() -> HardwareInfo:
+    # Only select what we actually need, and do it all over the same connection
+    results = get_session().batch({
+        'battery': ('Win32_Battery', ['DeviceID'], None),
+        'memory': ('Win32_PhysicalMemory', RamStick._fields, None),
+        'system': ('Win32_ComputerSystem', ['PCSystemType'], None),
+    })
+    return HardwareInfo(
+        has_battery=bool(results['battery']),
+        pc_system_type=results['system'][0]['PCSystemType'] if results['system'] else 0,
+        ram_sticks=[RamStick(**stick) for stick in results['memory']]
+    )
+
+
+def is_laptop(info: HardwareInfo = None) -> bool:
+    if info is None:
+        info = get_hardware_info()
 
-def is_laptop() -> bool:
     # If the device has a battery, it's pretty certainly a laptop
-    batteries = wmi.WMI().Win32_Battery()
-    if len(batteries):
+    if info.has_battery:
         return True
 
-    ram_sticks = wmi.WMI().Win32_PhysicalMemory()
-    for stick in ram_sticks:
+    for stick in info.ram_sticks:
         # If we have DIMM RAM, we're most likely not a laptop
         if stick.FormFactor == 8:
             return False
@@ -16,7 +48,7 @@ def is_laptop() -> bool:
         if stick.FormFactor == 12:
             return True
 
-    if wmi.WMI().Win32_ComputerSystem()[0].PCSystemType == 2:
+    if info.pc_system_type == 2:
         return True
 
     return False
@@ -0,0 +1,181 @@
+import logging
+import subprocess
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+
+class ResourceUsage(NamedTuple):
+    """
+    What a process and everything it started cost. Only the wall time is always known
+    """
+    wall_time: float
+    # User + kernel time in seconds
+    cpu_time: Optional[float] = None
+    peak_memory: Optional[int] = None
+    read_bytes: Optional[int] = None
+    write_bytes: Optional[int] = None
+
+
+def _format_bytes(size: float) -> str:
+    if size < 1024:
+        return '{} B'.format(size)
+    for unit in ['KB', 'MB', 'GB']:
+        size /= 1024
+        if size < 1024 or unit == 'GB':
+            return '{:.1f} {}'.format(size, unit)
+
+
+def _format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    return '{}:{:02}'.format(minutes, seconds)
+
+
+def format_usage(usage: ResourceUsage) -> str:
+    parts = ['took {}'.format(_format_seconds(usage.wall_time))]
+    if usage.cpu_time is not None:
+        parts.append('CPU time {}'.format(_format_seconds(usage.cpu_time)))
+    if usage.peak_memory is not None:
+        parts.append('peak memory {}'.format(_format_bytes(usage.peak_memory)))
+    if usage.read_bytes is not None:
+        parts.append('read {}, written {}'.format(_format_bytes(usage.read_bytes), _format_bytes(usage.write_bytes)))
+    return ', '.join(parts)
+
+
+class ProcessHandle:
+    """
+    Tracks one specific process (instead of any process with the same name) and lets us wait for it to exit
+    """
+    pid: int
+    # Filled in once the process has exited, if the handle can measure it
+    usage: Optional[ResourceUsage] = None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until the process has exited or `timeout` seconds have passed. Returns whether the process exited
+        """
+        raise NotImplementedError
+
+    def poll(self) -> Optional[int]:
+        """
+        Returns the exit code, or None if the process is still running
+        """
+        raise NotImplementedError
+
+    def terminate(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class Win32ProcessHandle(ProcessHandle):
+    """
+    Wraps the process handle returned by `ShellExecuteEx` (with `SEE_MASK_NOCLOSEPROCESS`)
+    """
+    def __init__(self, handle):
+        # pywin32 is only available on Windows, so it's imported here to keep this module usable everywhere else
+        import win32process
+        self.handle = handle
+        self.pid = win32process.GetProcessId(handle)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        import win32event
+        milliseconds = win32event.INFINITE if timeout is None else max(0, int(timeout * 1000))
+        return win32event.WaitForSingleObject(self.handle, milliseconds) == win32event.WAIT_OBJECT_0
+
+    def poll(self) -> Optional[int]:
+        import win32process
+        if not self.wait(0):
+            return None
+        return win32process.GetExitCodeProcess(self.handle)
+
+    def terminate(self):
+        import win32api
+        from Automator.misc.wmi_session import get_session
+        # The handle only points to the 'cmd /c' wrapper, the actual work is done by its children. Look those up
+        # by PID (and not by name, which could hit unrelated processes) and end them first
+        connection = get_session().connection
+
+        def terminate_children(pid: int):
+            for child in connection.Win32_Process(ParentProcessId=pid):
+                terminate_children(child.ProcessId)
+                # noinspection PyBroadException
+                try:
+                    child.Terminate()
+                except Exception:
+                    # The child might have exited on its own in the meantime
+                    pass
+
+        terminate_children(self.pid)
+        if self.poll() is None:
+            win32api.TerminateProcess(self.handle, 1)
+
+    def close(self):
+        if self.handle:
+            self.handle.Close()
+            self.handle = None
+
+
+class PopenProcessHandle(ProcessHandle):
+    """
+    Wraps a regular `subprocess.Popen`, mainly as a stand-in for elevated processes
+    """
+    def __init__(self, proc: subprocess.Popen):
+        self.proc = proc
+        self.pid = proc.pid
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        try:
+            self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            return False
+        return True
+
+    def poll(self) -> Optional[int]:
+        return self.proc.poll()
+
+    def terminate(self):
+        self.proc.kill()
+
+
+class ExitWatcher:
+    """
+    Waits for a process to exit on a background thread, then calls `on_exit` with its exit code.
+    If `timeout` is given and the process is still running after that many seconds, `on_timeout` is called instead
+    """
+    # How long a single wait on the handle may take before we check whether we were cancelled
+    wait_slice = 0.25
+
+    def __init__(self, handle: ProcessHandle, on_exit: Callable[[Optional[int]], None],
+                 timeout: Optional[float] = None, on_timeout: Optional[Callable[[], None]] = None):
+        self.handle = handle
+        self.on_exit = on_exit
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.logger = logging.getLogger('ExitWatcher {}'.format(handle.pid))
+        self._cancelled = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while not self._cancelled.is_set():
+            if self.handle.wait(self.wait_slice):
+                exit_code = self.handle.poll()
+                self.logger.debug('Process exited with code {}'.format(exit_code))
+                self.on_exit(exit_code)
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                self.logger.warning('Process did not exit within {} seconds'.format(self.timeout))
+                if self.on_timeout:
+                    self.on_timeout()
+                return
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='ExitWatcher {}'.format(self.handle.pid), daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
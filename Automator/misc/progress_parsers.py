@@ -0,0 +1,121 @@
+import re
+from typing import Iterable, List, NamedTuple, Optional, Pattern, Sequence, Union
+
+
+class ProgressEvent(NamedTuple):
+    # Overall progress of the scan, from 0 to 100
+    percent: float
+    line: str
+
+
+class StageEvent(NamedTuple):
+    stage: int
+    line: str
+
+
+class MessageEvent(NamedTuple):
+    line: str
+
+
+Event = Union[ProgressEvent, StageEvent, MessageEvent]
+
+# A number with a percent sign. Some languages put a (non-breaking) space in between or use a decimal comma, and
+# Turkish puts the sign first ('%45'). Either way, the number ends up in the first group that matched
+_NUMBER = r'(\d{1,3}(?:[.,]\d+)?)'
+_PERCENT = r'(?:' + _NUMBER + r'[ \u00a0\u202f]?%|%[ \u00a0\u202f]?' + _NUMBER + r')'
+
+
+def _to_percent(match: re.Match) -> float:
+    text = next(group for group in match.groups() if group is not None)
+    return min(100.0, float(text.replace(',', '.')))
+
+
+class ProgressParser:
+    """
+    Turns the output lines of a tool into progress, stage and message events.
+
+    `progress` patterns have to capture the percentage (as their only group, or use `_PERCENT`). If a tool reports
+    progress per stage, set `stages` to the number of stages and list the patterns in `stage_progress` instead,
+    they're then converted into overall progress. `stage` patterns have to capture the stage number
+    """
+    def __init__(self, name: str, progress: Sequence[str] = (), stage_progress: Sequence[str] = (),
+                 stage: Sequence[str] = (), stages: int = 1):
+        self.name = name
+        self.stages = stages
+        self._progress = [re.compile(pattern, re.IGNORECASE) for pattern in progress]
+        self._stage_progress = [re.compile(pattern, re.IGNORECASE) for pattern in stage_progress]
+        self._stage = [re.compile(pattern, re.IGNORECASE) for pattern in stage]
+        self.current_stage = 1
+
+    @staticmethod
+    def _search(patterns: List[Pattern], line: str) -> Optional[re.Match]:
+        for pattern in patterns:
+            match = pattern.search(line)
+            if match:
+                return match
+        return None
+
+    def parse_line(self, line: str) -> Event:
+        match = self._search(self._progress, line)
+        if match:
+            return ProgressEvent(_to_percent(match), line)
+        match = self._search(self._stage_progress, line)
+        if match:
+            stage_percent = _to_percent(match)
+            return ProgressEvent((self.current_stage - 1 + stage_percent / 100) / self.stages * 100, line)
+        match = self._search(self._stage, line)
+        if match:
+            self.current_stage = min(int(match.group(1)), self.stages)
+            return StageEvent(self.current_stage, line)
+        return MessageEvent(line)
+
+    def parse(self, lines: Iterable[str]) -> List[Event]:
+        return [self.parse_line(line) for line in lines]
+
+    def reset(self):
+        self.current_stage = 1
+
+
+def _sfc_parser() -> ProgressParser:
+    # 'Verification 45% complete.', 'Überprüfung 45 % abgeschlossen.', 'Vérification à 45 % terminée.',
+    # 'Doğrulama %45 tamamlandı.'
+    return ProgressParser('SFC', progress=[_PERCENT])
+
+
+def _dism_parser() -> ProgressParser:
+    # '[==========================62.3%===                       ]', the bar itself is the same in every language
+    return ProgressParser('DISM', progress=[r'\[[= ]*' + _PERCENT + r'[= ]*\]'])
+
+
+def _chkdsk_parser(command: str = '') -> ProgressParser:
+    # /r (and /b, which implies it) adds stage 4 and 5, which look for bad sectors
+    repair = re.search(r'(?:^|\s)/[rb](?:\s|$)', command, re.IGNORECASE) is not None
+    return ProgressParser(
+        'CHKDSK',
+        # 'Progress: 123 of 456 done; Stage: 26%; Total:  8%; ETA:   0:00:18 ..', the third field is the total
+        progress=[r'^[^;]+;[^;]*%[^;]*;[^;%]*?' + _PERCENT],
+        # '54 percent complete (123456 of 234567 file records processed).' is per stage. The wording depends on the
+        # language ('54 Prozent abgeschlossen (...)', 'Yüzde 54 tamamlandı (...)'), but the percentage always comes
+        # first on the line, followed by the processed records in brackets
+        stage_progress=[r'^\s*[^\d(;:]{0,15}?(\d{1,3})(?!\d)[^\d(;:]*[(\uff08]\s*\d+\D+\d+'],
+        # 'Stage 1: Examining basic file system structure ...', 'Phase 1: ...', 'Étape 1 : ...', 'Aşama 1: ...'
+        stage=[r'^\s*(?:Stage|Phase|Étape|Etapa|Fase|Fáze|Etap|Aşama)\s+(\d)\s*:'],
+        stages=5 if repair else 3
+    )
+
+
+_PARSER_FACTORIES = {
+    'sfc': _sfc_parser,
+    'dism': _dism_parser,
+    'chkdsk': _chkdsk_parser,
+}
+
+
+def get_parser(tool: str, command: str = '') -> ProgressParser:
+    """
+    Returns a fresh parser (they keep track of the current stage) for 'sfc', 'dism' or 'chkdsk'. The command is
+    needed for CHKDSK, since its switches decide how many stages there are
+    """
+    factory = _PARSER_FACTORIES[tool.lower()]
+    return factory(command) if tool.lower() == 'chkdsk' else factory()
+
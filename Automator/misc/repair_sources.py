@@ -0,0 +1,328 @@
+"""
+Keeps Windows images (install.wim / install.esd) around that DISM can repair the component store from, so
+RestoreHealth doesn't have to rely on Windows Update
+"""
+import json
+import logging
+import os
+import platform
+import struct
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from typing import Callable, List, NamedTuple, Optional
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from Automator.misc.paths import get_data_path
+
+# WIM and ESD files share the same header, pipable WIMs use a different magic
+_WIM_MAGICS = (b'MSWIM\0\0\0', b'WLPWM\0\0\0')
+# The resource header of the XML data starts at this offset: 7 bytes compressed size, 1 byte flags, 8 bytes
+# offset, 8 bytes original size. The XML itself is never compressed
+_XML_RESOURCE_OFFSET = 72
+
+# <ARCH> values in the image XML
+ARCH_X86 = 0
+ARCH_X64 = 9
+ARCH_ARM64 = 12
+_MACHINE_ARCHITECTURES = {'x86': ARCH_X86, 'amd64': ARCH_X64, 'x86_64': ARCH_X64, 'arm64': ARCH_ARM64}
+
+# Feature updates shipped as enablement packages share the component store of their base build, so an image of
+# the base build can repair them and the other way around
+_BASE_BUILDS = {
+    19042: 19041, 19043: 19041, 19044: 19041, 19045: 19041,
+    22631: 22621,
+    26200: 26100,
+}
+
+
+class WimImage(NamedTuple):
+    index: int
+    name: str
+    build: int
+    edition: str
+    architecture: int
+
+
+class RepairSource(NamedTuple):
+    path: str
+    index: int
+    name: str
+    build: int
+    edition: str
+    architecture: int
+    # Whether the file was copied into the cache (and may be deleted by it)
+    managed: bool
+    added: float
+    last_used: float
+
+
+class SystemInfo(NamedTuple):
+    build: int
+    edition: str
+    architecture: int
+
+
+def base_build(build: int) -> int:
+    return _BASE_BUILDS.get(build, build)
+
+
+def read_wim_xml(path: str) -> str:
+    """
+    Reads the XML metadata of a WIM or ESD file, which describes every image in it
+    """
+    with open(path, 'rb') as f:
+        header = f.read(_XML_RESOURCE_OFFSET + 24)
+        if len(header) < _XML_RESOURCE_OFFSET + 24 or header[:8] not in _WIM_MAGICS:
+            raise ValueError('{} is not a WIM or ESD file'.format(path))
+        size = int.from_bytes(header[_XML_RESOURCE_OFFSET:_XML_RESOURCE_OFFSET + 7], 'little')
+        offset, = struct.unpack_from('<Q', header, _XML_RESOURCE_OFFSET + 8)
+        f.seek(offset)
+        data = f.read(size)
+    if len(data) != size:
+        raise ValueError('{} is truncated'.format(path))
+    return data.decode('utf-16')
+
+
+def parse_wim_xml(xml: str) -> List[WimImage]:
+    root = ElementTree.fromstring(xml)
+    images = []
+    for image in root.findall('IMAGE'):
+        windows = image.find('WINDOWS')
+        # Images without a WINDOWS element (like the setup image in boot.wim) can't be used for repairs
+        if windows is None:
+            continue
+        images.append(WimImage(
+            index=int(image.get('INDEX')),
+            name=image.findtext('NAME') or image.findtext('DISPLAYNAME') or '',
+            build=int(windows.findtext('VERSION/BUILD') or 0),
+            edition=windows.findtext('EDITIONID') or '',
+            architecture=int(windows.findtext('ARCH') or -1)
+        ))
+    return images
+
+
+def find_install_image(path: str) -> str:
+    """
+    Accepts an image file, or the root / sources folder of a mounted ISO, and returns the path of the image file
+    """
+    if os.path.isfile(path):
+        return path
+    for folder in [os.path.join(path, 'sources'), path]:
+        for filename in ['install.wim', 'install.esd']:
+            candidate = os.path.join(folder, filename)
+            if os.path.isfile(candidate):
+                return candidate
+    raise FileNotFoundError('No install.wim or install.esd found in {}'.format(path))
+
+
+def match_source(sources: List[RepairSource], system: SystemInfo) -> Optional[RepairSource]:
+    """
+    Returns the source fitting `system` best: same edition and architecture, and the same build (or base build).
+    Sources whose file doesn't exist (anymore) are ignored
+    """
+    candidates = [
+        source for source in sources
+        if base_build(source.build) == base_build(system.build) and source.edition.lower() == system.edition.lower()
+        and source.architecture == system.architecture and os.path.isfile(source.path)
+    ]
+    if not candidates:
+        return None
+    # Prefer the exact build, then whatever was used most recently
+    return max(candidates, key=lambda source: (source.build == system.build, source.last_used))
+
+
+def current_system() -> SystemInfo:
+    import winreg
+    with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, r'SOFTWARE\Microsoft\Windows NT\CurrentVersion') as key:
+        build = int(winreg.QueryValueEx(key, 'CurrentBuildNumber')[0])
+        edition = winreg.QueryValueEx(key, 'EditionID')[0]
+    return SystemInfo(build, edition, _MACHINE_ARCHITECTURES.get(platform.machine().lower(), -1))
+
+
+def _copy_file(source: str, destination: str, progress: Optional[Callable[[int, int], None]]):
+    total = os.path.getsize(source)
+    done = 0
+    temp_path = destination + '.part'
+    with open(source, 'rb') as src, open(temp_path, 'wb') as dst:
+        while True:
+            chunk = src.read(4 * 1024 * 1024)
+            if not chunk:
+                break
+            dst.write(chunk)
+            done += len(chunk)
+            if progress:
+                progress(done, total)
+    os.replace(temp_path, destination)
+
+
+class RepairSourceCache:
+    """
+    An index of registered images, saved as JSON. Images that are copied into the cache folder are deleted again
+    once they're stale: older than the installed build, or more than `max_builds` builds are cached
+    """
+    def __init__(self, directory: str, max_builds: int = 2):
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.json')
+        self.max_builds = max_builds
+        self.logger = logging.getLogger('RepairSourceCache')
+        self._lock = threading.Lock()
+        self.sources: List[RepairSource] = self._load()
+
+    def _load(self) -> List[RepairSource]:
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                return [RepairSource(**entry) for entry in json.load(f)]
+        except (OSError, ValueError, TypeError):
+            return []
+
+    def _save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.index_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump([source._asdict() for source in self.sources], f, indent=2)
+        os.replace(temp_path, self.index_path)
+
+    def register(self, path: str, copy: bool = True,
+                 progress: Optional[Callable[[int, int], None]] = None) -> List[RepairSource]:
+        """
+        Adds every Windows image in `path` (see find_install_image()). With `copy`, the file is copied into the
+        cache first, so it stays available after an ISO is unmounted
+        """
+        image_path = find_install_image(path)
+        images = parse_wim_xml(read_wim_xml(image_path))
+        if not images:
+            raise ValueError('{} does not contain any Windows images'.format(image_path))
+        if copy:
+            os.makedirs(self.directory, exist_ok=True)
+            extension = os.path.splitext(image_path)[1].lower()
+            destination = os.path.join(self.directory, '{}-{}{}'.format(images[0].build, int(time.time()), extension))
+            self.logger.info('Copying {} to {}'.format(image_path, destination))
+            _copy_file(image_path, destination, progress)
+            image_path = destination
+        now = time.time()
+        added = [
+            RepairSource(image_path, image.index, image.name, image.build, image.edition, image.architecture,
+                         copy, now, now)
+            for image in images
+        ]
+        with self._lock:
+            # Registering the same file again replaces its old entries
+            self.sources = [source for source in self.sources if source.path != image_path] + added
+            self._save()
+        self.logger.info('Registered {} images of build {}'.format(len(added), images[0].build))
+        return added
+
+    def find(self, system: SystemInfo) -> Optional[RepairSource]:
+        with self._lock:
+            return match_source(self.sources, system)
+
+    def mark_used(self, source: RepairSource):
+        with self._lock:
+            self.sources = [
+                entry._replace(last_used=time.time()) if entry.path == source.path else entry
+                for entry in self.sources
+            ]
+            self._save()
+
+    def evict(self, current_build: int) -> List[RepairSource]:
+        """
+        Drops sources of builds older than `current_build`, sources whose file is gone, and the least recently
+        used builds beyond `max_builds`. Returns what was dropped
+        """
+        with self._lock:
+            keep = [
+                source for source in self.sources
+                if base_build(source.build) >= base_build(current_build) and os.path.isfile(source.path)
+            ]
+            last_used_by_build = {}
+            for source in keep:
+                build = base_build(source.build)
+                last_used_by_build[build] = max(last_used_by_build.get(build, 0), source.last_used)
+            kept_builds = sorted(last_used_by_build, key=last_used_by_build.get, reverse=True)[:self.max_builds]
+            keep = [source for source in keep if base_build(source.build) in kept_builds]
+            evicted = [source for source in self.sources if source not in keep]
+            self.sources = keep
+            self._save()
+        kept_paths = {source.path for source in keep}
+        for path in {source.path for source in evicted if source.managed} - kept_paths:
+            self.logger.info('Removing stale repair source {}'.format(path))
+            try:
+                os.remove(path)
+            except OSError as e:
+                self.logger.warning('Could not remove {}: {}'.format(path, e))
+        return evicted
+
+
+def source_argument(source: RepairSource) -> str:
+    kind = 'ESD' if source.path.lower().endswith('.esd') else 'WIM'
+    argument = '/Source:{}:{}:{}'.format(kind, source.path, source.index)
+    return '"{}"'.format(argument) if ' ' in argument else argument
+
+
+_default_cache: Optional[RepairSourceCache] = None
+
+
+def get_cache() -> RepairSourceCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = RepairSourceCache(get_data_path('repair_sources'))
+    return _default_cache
+
+
+def with_repair_source(command: str, cache: Optional[RepairSourceCache] = None,
+                       system: Optional[SystemInfo] = None) -> str:
+    """
+    Adds a matching repair source to a DISM RestoreHealth command, and keeps DISM away from Windows Update then.
+    Other commands, or if there's no matching source, are returned as they are
+    """
+    if '/restorehealth' not in command.lower():
+        return command
+    cache = cache or get_cache()
+    try:
+        system = system or current_system()
+    except OSError as e:
+        logging.getLogger('RepairSourceCache').warning('Could not determine the Windows build: {}'.format(e))
+        return command
+    source = cache.find(system)
+    if source is not None:
+        # Before evicting, so the source that's about to be used counts as the most recent one
+        cache.mark_used(source)
+    # Removing stale images can take a while, and this is called on the GUI thread
+    threading.Thread(target=cache.evict, args=(system.build,), name='RepairSourceEviction', daemon=True).start()
+    if source is None:
+        return command
+    logging.getLogger('RepairSourceCache').info('Repairing from {} (index {})'.format(source.path, source.index))
+    return '{} {} /LimitAccess'.format(command, source_argument(source))
+
+
+class RepairSourceImporter(QObject):
+    """
+    Registers (and copies) a repair source on a background thread, since images are several GB large
+    """
+    # Percent copied
+    importProgress = pyqtSignal(int)
+    importFinished = pyqtSignal(list)
+    importFailed = pyqtSignal(str)
+
+    def __init__(self, path: str, *args, **kwargs):
+        super(RepairSourceImporter, self).__init__(*args, **kwargs)
+        self.path = path
+
+    def _run(self):
+        try:
+            sources = get_cache().register(
+                # noinspection PyUnresolvedReferences
+                self.path, progress=lambda done, total: self.importProgress.emit(done * 100 // max(total, 1))
+            )
+        except (OSError, ValueError, ElementTree.ParseError) as e:
+            logging.getLogger('RepairSourceCache').error('Could not add {}: {}'.format(self.path, e))
+            # noinspection PyUnresolvedReferences
+            self.importFailed.emit(str(e))
+            return
+        # noinspection PyUnresolvedReferences
+        self.importFinished.emit(sources)
+
+    def start(self):
+        threading.Thread(target=self._run, name='RepairSourceImporter', daemon=True).start()
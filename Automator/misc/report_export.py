@@ -0,0 +1,192 @@
+"""
+Turns msinfo32 reports into small files that fit through chat upload limits.
+
+The report is read once, category by category and only a chunk at a time, and written gzip compressed as UTF-8,
+either as JSON Lines or as text in the original format. Categories can be left out or cut short on the way. Every
+JSON line holds (part of) one table:
+
+    {"section": "Components/Display", "table": 0, "columns": ["Item", "Value"], "rows": [["Name", "..."], ...]}
+
+Large tables are split over several lines of at most `rows_per_line` rows. To export a report by hand:
+
+    python -m Automator.misc.report_export <Sysinfo.txt> <Sysinfo.jsonl.gz> [--format text] [--drop <category> ...]
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, TextIO
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from Automator.misc.msinfo_report import MsInfoReport, SectionEntry
+
+FORMAT_JSONL = 'jsonl'
+FORMAT_TEXT = 'text'
+EXTENSIONS = {FORMAT_JSONL: '.jsonl.gz', FORMAT_TEXT: '.txt.gz'}
+
+# Large, and nobody has ever needed them to help someone
+DEFAULT_DROP = ('Software Environment/OLE Registration', 'Software Environment/Loaded Modules')
+
+
+def _is_dropped(entry: SectionEntry, drop: Iterable[str]) -> bool:
+    # Dropping a category drops everything in it as well
+    path = entry.path.lower()
+    return any(path == dropped.lower() or path.startswith(dropped.lower() + '/') for dropped in drop)
+
+
+class _JsonLinesWriter:
+    def __init__(self, f: TextIO, rows_per_line: int):
+        self.f = f
+        self.rows_per_line = rows_per_line
+        self._section: Optional[str] = None
+        self._columns: Optional[List[str]] = None
+        self._table = 0
+        self._rows: List[List[str]] = []
+        # Every table gets at least one line, even if it has no rows
+        self._table_written = False
+
+    def _write(self, line: dict):
+        self.f.write(json.dumps(line, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def _flush(self):
+        if self._section is None or (self._table_written and not self._rows):
+            return
+        self._write({
+            'section': self._section, 'table': self._table, 'columns': self._columns or [], 'rows': self._rows
+        })
+        self._rows = []
+        self._table_written = True
+
+    def section(self, entry: SectionEntry):
+        self._flush()
+        self._section, self._columns, self._table, self._table_written = entry.path, None, 0, False
+
+    def row(self, table: int, cells: List[str]):
+        if self._columns is None:
+            self._columns, self._table = cells, table
+            return
+        if table != self._table:
+            self._flush()
+            self._table, self._table_written = table, False
+        self._rows.append(cells)
+        if len(self._rows) >= self.rows_per_line:
+            self._flush()
+
+    def note(self, text: str):
+        self._flush()
+        self._write({'section': self._section, 'note': text})
+
+    def close(self):
+        self._flush()
+
+
+class _TextWriter:
+    def __init__(self, f: TextIO):
+        self.f = f
+        self._table = 0
+        self._in_table = False
+
+    def section(self, entry: SectionEntry):
+        # Tables end with a blank line, like in the original
+        self.f.write('{}[{}]\n\n'.format('\n' if self._in_table else '', entry.name))
+        self._table = 0
+        self._in_table = False
+
+    def row(self, table: int, cells: List[str]):
+        if table != self._table:
+            self.f.write('\n')
+            self._table = table
+        self.f.write('\t'.join(cells) + '\t\n')
+        self._in_table = True
+
+    def note(self, text: str):
+        self.f.write('({})\n'.format(text))
+
+    def close(self):
+        pass
+
+
+def export_report(source: str, destination: str, export_format: str = FORMAT_JSONL,
+                  drop: Sequence[str] = DEFAULT_DROP, max_rows: Optional[int] = None,
+                  rows_per_line: int = 500) -> Dict[str, int]:
+    """
+    Writes the report at `source` compressed to `destination`. Categories in `drop` are left out, and only the first
+    `max_rows` rows of every category are kept. Returns how many categories and rows were written and left out
+    """
+    report = MsInfoReport(source)
+    stats = {'sections': 0, 'rows': 0, 'dropped_sections': 0, 'dropped_rows': 0}
+    temp_path = destination + '.tmp'
+    with gzip.open(temp_path, 'wt', encoding='utf-8', newline='\n') as f:
+        writer = _JsonLinesWriter(f, rows_per_line) if export_format == FORMAT_JSONL else _TextWriter(f)
+        for entry in report.sections():
+            if _is_dropped(entry, drop):
+                stats['dropped_sections'] += 1
+                continue
+            stats['sections'] += 1
+            writer.section(entry)
+            # The column names don't count
+            rows = -1
+            for table, cells in report.iter_rows(entry):
+                rows += 1
+                if max_rows is None or rows <= max_rows:
+                    writer.row(table, cells)
+            rows = max(rows, 0)
+            if max_rows is not None and rows > max_rows:
+                writer.note('{} more rows left out'.format(rows - max_rows))
+                stats['dropped_rows'] += rows - max_rows
+                rows = max_rows
+            stats['rows'] += rows
+        writer.close()
+    os.replace(temp_path, destination)
+    return stats
+
+
+class ReportExporter(QObject):
+    """
+    Runs `export_report()` on a background thread
+    """
+    # The path of the exported file
+    exportFinished = pyqtSignal(str)
+    exportFailed = pyqtSignal(str)
+
+    def __init__(self, source: str, destination: str, export_format: str = FORMAT_JSONL, *args, **kwargs):
+        super(ReportExporter, self).__init__(*args, **kwargs)
+        self.source = source
+        self.destination = destination
+        self.export_format = export_format
+
+    def _run(self):
+        try:
+            stats = export_report(self.source, self.destination, self.export_format)
+        except (OSError, ValueError) as e:
+            logging.getLogger('ReportExport').error('Could not export {}: {}'.format(self.source, e))
+            # noinspection PyUnresolvedReferences
+            self.exportFailed.emit(str(e))
+            return
+        logging.getLogger('ReportExport').info('Exported {} to {} ({:.1f} MB -> {:.1f} MB): {}'.format(
+            self.source, self.destination, os.path.getsize(self.source) / 1024 ** 2,
+            os.path.getsize(self.destination) / 1024 ** 2, stats
+        ))
+        # noinspection PyUnresolvedReferences
+        self.exportFinished.emit(self.destination)
+
+    def start(self):
+        threading.Thread(target=self._run, name='ReportExporter', daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('report')
+    parser.add_argument('destination')
+    parser.add_argument('--format', choices=[FORMAT_JSONL, FORMAT_TEXT], default=FORMAT_JSONL)
+    parser.add_argument('--drop', nargs='*', default=list(DEFAULT_DROP), help='Categories to leave out')
+    parser.add_argument('--max-rows', type=int, help='Rows to keep per category')
+    args = parser.parse_args()
+    print(export_report(args.report, args.destination, args.format, args.drop, args.max_rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,465 @@
+"""
+Collects many Sysinfo reports in one SQLite database, to find the ones that have something in common.
+
+Reports are recognised by the hash of their content, so ingesting a folder again only adds the new ones. Besides the
+msinfo32 categories, the answers the Automator adds to the report ([Automator_additionalInfo] and
+[Automator_ramInfo]) are indexed as well. To ingest reports and look for some:
+
+    python -m Automator.misc.report_index ingest <reports.db> <Sysinfo.txt or folder> ...
+    python -m Automator.misc.report_index query <reports.db> --driver "NVIDIA GeForce" --driver-version 31.0.15 --riser
+    python -m Automator.misc.report_index sql <reports.db> "SELECT psu_model, COUNT(*) FROM reports GROUP BY 1"
+
+The drivers come from msinfo32's Signed Drivers category. Reports made with a profile that leaves it out (the quick
+one, or the standard one before it included Signed Drivers) have no drivers in the index, so `--driver` and
+`--driver-version` can't find them; `query` says how many of those there are.
+"""
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from Automator.misc.msinfo_report import MsInfoReport, Section
+
+# Every text column compares case-insensitively, which also lets `LIKE 'prefix%'` use the indexes
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL COLLATE NOCASE,
+    size INTEGER NOT NULL,
+    ingested INTEGER NOT NULL,
+    os_name TEXT COLLATE NOCASE,
+    os_version TEXT COLLATE NOCASE,
+    system_manufacturer TEXT COLLATE NOCASE,
+    system_model TEXT COLLATE NOCASE,
+    cpu TEXT COLLATE NOCASE,
+    bios TEXT COLLATE NOCASE,
+    overclocks TEXT COLLATE NOCASE,
+    install_method TEXT COLLATE NOCASE,
+    modified_windows TEXT COLLATE NOCASE,
+    system_type TEXT COLLATE NOCASE,
+    detected_system_type TEXT COLLATE NOCASE,
+    psu_model TEXT COLLATE NOCASE,
+    gpu_connection TEXT COLLATE NOCASE,
+    psu_cables TEXT COLLATE NOCASE,
+    gpu_power_connectors TEXT COLLATE NOCASE,
+    monitor_connection TEXT COLLATE NOCASE
+);
+CREATE TABLE IF NOT EXISTS gpus (
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    name TEXT COLLATE NOCASE,
+    driver_version TEXT COLLATE NOCASE
+);
+CREATE TABLE IF NOT EXISTS drivers (
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    device TEXT COLLATE NOCASE,
+    version TEXT COLLATE NOCASE,
+    manufacturer TEXT COLLATE NOCASE,
+    inf TEXT COLLATE NOCASE
+);
+CREATE TABLE IF NOT EXISTS ram_sticks (
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    part_number TEXT COLLATE NOCASE,
+    manufacturer TEXT COLLATE NOCASE,
+    speed TEXT COLLATE NOCASE,
+    locator TEXT COLLATE NOCASE
+);
+CREATE INDEX IF NOT EXISTS reports_cpu ON reports(cpu);
+CREATE INDEX IF NOT EXISTS reports_psu_model ON reports(psu_model);
+CREATE INDEX IF NOT EXISTS gpus_name ON gpus(name);
+CREATE INDEX IF NOT EXISTS gpus_driver_version ON gpus(driver_version);
+CREATE INDEX IF NOT EXISTS gpus_report ON gpus(report_id);
+CREATE INDEX IF NOT EXISTS drivers_device ON drivers(device);
+CREATE INDEX IF NOT EXISTS drivers_version ON drivers(version);
+CREATE INDEX IF NOT EXISTS drivers_inf ON drivers(inf);
+CREATE INDEX IF NOT EXISTS drivers_report ON drivers(report_id);
+CREATE INDEX IF NOT EXISTS ram_sticks_part_number ON ram_sticks(part_number);
+CREATE INDEX IF NOT EXISTS ram_sticks_report ON ram_sticks(report_id);
+'''
+
+# Column in `reports` -> item in the System Summary
+_SUMMARY_COLUMNS = {
+    'os_name': 'OS Name',
+    'os_version': 'Version',
+    'system_manufacturer': 'System Manufacturer',
+    'system_model': 'System Model',
+    'cpu': 'Processor',
+    'bios': 'BIOS Version/Date',
+}
+# Column in `reports` -> item in [Automator_additionalInfo]
+_ADDITIONAL_COLUMNS = {
+    'overclocks': 'Overclocks',
+    'install_method': 'InstallMethod',
+    'modified_windows': 'ModifiedWindows',
+    'system_type': 'UserSpecifiedSystemType',
+    'detected_system_type': 'AutodetectedSystemType',
+    'psu_model': 'PSUModel',
+    'gpu_connection': 'GPUConnectionMethod',
+    'psu_cables': 'PSUCables',
+    'gpu_power_connectors': 'GPUPowerConnectors',
+    'monitor_connection': 'MonitorConnection',
+}
+_REPORT_COLUMNS = ['hash', 'path', 'size', 'ingested'] + list(_SUMMARY_COLUMNS) + list(_ADDITIONAL_COLUMNS)
+
+# What SysInfoWindow writes for the PCIe riser question
+RISER_ANSWER = 'Using PCIe riser cables'
+
+
+def hash_report(path: str, chunk_size: int = 1024 * 1024) -> Tuple[str, str, int]:
+    """
+    Returns the path, the SHA-256 of the content and the size of a report
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return path, digest.hexdigest(), size
+
+
+def _hash_report(path: str) -> Tuple[str, Optional[str], int, Optional[str]]:
+    # A report that can't be read (locked, deleted meanwhile) shouldn't stop the others
+    try:
+        return hash_report(path) + (None,)
+    except OSError as e:
+        return path, None, 0, '{}: {}'.format(type(e).__name__, e)
+
+
+def _like_pattern(text: str, prefix: str = '', suffix: str = '%') -> str:
+    # Wildcards in the search term are meant literally, with `ESCAPE '\'`
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return prefix + escaped + suffix
+
+
+def _table_rows(section: Optional[Section]) -> Iterator[Dict[str, str]]:
+    # Rows of column tables (Signed Drivers, RAM info) by column name
+    if section is None:
+        return
+    for table in section.tables:
+        for row in table.rows:
+            yield dict(zip(table.columns, row))
+
+
+def _devices(section: Optional[Section]) -> Iterator[Dict[str, str]]:
+    # 'Item / Value' categories with one table per device (Display)
+    if section is None:
+        return
+    for table in section.tables:
+        items = {}
+        for row in table.rows:
+            if len(row) >= 2:
+                items.setdefault(row[0], row[1])
+        if items:
+            yield items
+
+
+def read_report(path: str) -> Dict[str, Any]:
+    """
+    Reads the indexed fields of a report. Runs in a worker process, so the result only holds plain values
+    """
+    report = MsInfoReport(path)
+    summary = report.read_section('System Summary')
+    summary_items = summary.items() if summary else {}
+    additional = report.read_section('Automator_additionalInfo')
+    additional_items = additional.items() if additional else {}
+    fields = {column: summary_items.get(item) for column, item in _SUMMARY_COLUMNS.items()}
+    fields.update({column: additional_items.get(item) for column, item in _ADDITIONAL_COLUMNS.items()})
+
+    gpus = [(device.get('Name'), device.get('Driver Version')) for device in _devices(
+        report.read_section('Components/Display')
+    )]
+    drivers = [
+        (row.get('Device Name'), row.get('Driver Version'), row.get('Manufacturer'), row.get('INF Name'))
+        for row in _table_rows(report.read_section('Software Environment/Signed Drivers'))
+    ]
+    ram_info = report.read_section('Automator_ramInfo')
+    if ram_info is not None:
+        ram_sticks = [
+            (row.get('PartNumber'), row.get('Manufacturer'), row.get('Speed'), row.get('DeviceLocator'))
+            for row in _table_rows(ram_info)
+        ]
+    else:
+        # Reports of the native collector have the sticks in a category of their own
+        ram_sticks = [
+            (row.get('Part Number'), row.get('Manufacturer'), row.get('Speed'), row.get('Device Locator'))
+            for row in _table_rows(report.read_section('Components/Memory'))
+        ]
+    return {'fields': fields, 'gpus': gpus, 'drivers': drivers, 'ram_sticks': ram_sticks}
+
+
+def _read_report(job: Tuple[str, str, int]) -> Tuple[str, str, int, Optional[Dict[str, Any]], Optional[str]]:
+    path, content_hash, size = job
+    try:
+        return path, content_hash, size, read_report(path), None
+    except (OSError, UnicodeError, ValueError) as e:
+        return path, content_hash, size, None, '{}: {}'.format(type(e).__name__, e)
+
+
+def find_reports(paths: Iterable[str]) -> Iterator[str]:
+    """
+    Yields the given files, and the .txt files in the given folders and their subfolders
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for folder, _, files in os.walk(path):
+            for name in sorted(files):
+                if name.lower().endswith('.txt'):
+                    yield os.path.join(folder, name)
+
+
+class ReportIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self.logger = logging.getLogger('ReportIndex')
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> 'ReportIndex':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def known_hashes(self) -> set:
+        return {row[0] for row in self.connection.execute('SELECT hash FROM reports')}
+
+    def _insert(self, path: str, content_hash: str, size: int, report: Dict[str, Any]):
+        values = dict(report['fields'], hash=content_hash, path=os.path.abspath(path), size=size,
+                      ingested=int(time.time()))
+        cursor = self.connection.execute(
+            'INSERT INTO reports ({}) VALUES ({})'.format(
+                ', '.join(_REPORT_COLUMNS), ', '.join('?' * len(_REPORT_COLUMNS))
+            ),
+            [values[column] for column in _REPORT_COLUMNS]
+        )
+        report_id = cursor.lastrowid
+        self.connection.executemany(
+            'INSERT INTO gpus VALUES (?, ?, ?)', [(report_id,) + gpu for gpu in report['gpus']]
+        )
+        self.connection.executemany(
+            'INSERT INTO drivers VALUES (?, ?, ?, ?, ?)', [(report_id,) + driver for driver in report['drivers']]
+        )
+        self.connection.executemany(
+            'INSERT INTO ram_sticks VALUES (?, ?, ?, ?, ?)', [(report_id,) + stick for stick in report['ram_sticks']]
+        )
+
+    def ingest(self, paths: Iterable[str], workers: Optional[int] = None, batch_size: int = 200,
+               on_progress: Optional[Callable[[str, str], None]] = None) -> Dict[str, int]:
+        """
+        Adds the reports that aren't in the index yet. The files are hashed on threads and parsed in `workers`
+        processes, while this thread writes the results, `batch_size` reports per transaction.
+
+        `on_progress` is called with the path and 'added', 'known', 'skipped' (couldn't be opened) or 'failed'
+        (couldn't be parsed) for every report
+        """
+        stats = {'added': 0, 'known': 0, 'skipped': 0, 'failed': 0}
+
+        def progress(path: str, status: str):
+            stats[status] += 1
+            if on_progress:
+                on_progress(path, status)
+
+        known = self.known_hashes()
+        new = []
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for path, content_hash, size, error in executor.map(_hash_report, find_reports(paths)):
+                if content_hash is None:
+                    self.logger.warning('Skipped {}: {}'.format(path, error))
+                    progress(path, 'skipped')
+                    continue
+                # The same report can also show up twice in one go
+                if content_hash in known:
+                    progress(path, 'known')
+                    continue
+                known.add(content_hash)
+                new.append((path, content_hash, size))
+        if not new:
+            self._log_stats(stats)
+            return stats
+
+        pending = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            try:
+                for path, content_hash, size, report, error in executor.map(_read_report, new, chunksize=4):
+                    if report is None:
+                        self.logger.warning('Could not read {}: {}'.format(path, error))
+                        progress(path, 'failed')
+                        continue
+                    self._insert(path, content_hash, size, report)
+                    progress(path, 'added')
+                    pending += 1
+                    if pending >= batch_size:
+                        self.connection.commit()
+                        pending = 0
+            finally:
+                # What was read until then is kept, even if something went wrong
+                self.connection.commit()
+        self.connection.execute('ANALYZE')
+        self._log_stats(stats)
+        return stats
+
+    def _log_stats(self, stats: Dict[str, int]):
+        self.logger.info('Ingested {} reports, {} were known already, {} were skipped, {} failed'.format(
+            stats['added'], stats['known'], stats['skipped'], stats['failed']
+        ))
+
+    def reports_without_drivers(self) -> int:
+        """
+        Counts the reports without Signed Drivers, which driver queries can't match
+        """
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM reports r WHERE NOT EXISTS (SELECT 1 FROM drivers d WHERE d.report_id = r.id)'
+        ).fetchone()[0]
+
+    def query(self, cpu: str = None, gpu: str = None, gpu_driver: str = None, driver: str = None,
+              driver_version: str = None, psu: str = None, ram_part: str = None, overclocks: str = None,
+              install_method: str = None, riser: Optional[bool] = None,
+              limit: Optional[int] = None) -> List[Tuple[str, str, str]]:
+        """
+        Returns the path, CPU and GPUs of the reports that match all the given filters, newest first. Case doesn't
+        matter. CPU, GPU and PSU match anywhere in the name; drivers, versions and RAM part numbers match from the
+        start, which lets them use the indexes. `driver` and `driver_version` have to match the same driver. `%` and
+        `_` in the filters match themselves
+        """
+        conditions: List[str] = []
+        parameters: List[Any] = []
+
+        def contains(text: str) -> str:
+            return _like_pattern(text, prefix='%')
+
+        def starts_with(text: str) -> str:
+            return _like_pattern(text)
+
+        if cpu is not None:
+            conditions.append("r.cpu LIKE ? ESCAPE '\\'")
+            parameters.append(contains(cpu))
+        if psu is not None:
+            conditions.append("r.psu_model LIKE ? ESCAPE '\\'")
+            parameters.append(contains(psu))
+        if overclocks is not None:
+            conditions.append('r.overclocks = ?')
+            parameters.append(overclocks)
+        if install_method is not None:
+            conditions.append('r.install_method = ?')
+            parameters.append(install_method)
+        if riser is not None:
+            conditions.append('r.gpu_connection {} ?'.format('=' if riser else 'IS NOT'))
+            parameters.append(RISER_ANSWER)
+        if gpu is not None or gpu_driver is not None:
+            gpu_conditions = []
+            if gpu is not None:
+                gpu_conditions.append("g.name LIKE ? ESCAPE '\\'")
+                parameters.append(contains(gpu))
+            if gpu_driver is not None:
+                gpu_conditions.append("g.driver_version LIKE ? ESCAPE '\\'")
+                parameters.append(starts_with(gpu_driver))
+            conditions.append('r.id IN (SELECT g.report_id FROM gpus g WHERE {})'.format(
+                ' AND '.join(gpu_conditions)
+            ))
+        if driver is not None or driver_version is not None:
+            driver_conditions = []
+            if driver is not None:
+                driver_conditions.append("(d.device LIKE ? ESCAPE '\\' OR d.inf LIKE ? ESCAPE '\\')")
+                parameters.extend([starts_with(driver)] * 2)
+            if driver_version is not None:
+                driver_conditions.append("d.version LIKE ? ESCAPE '\\'")
+                parameters.append(starts_with(driver_version))
+            conditions.append('r.id IN (SELECT d.report_id FROM drivers d WHERE {})'.format(
+                ' AND '.join(driver_conditions)
+            ))
+        if ram_part is not None:
+            conditions.append(
+                "r.id IN (SELECT s.report_id FROM ram_sticks s WHERE s.part_number LIKE ? ESCAPE '\\')"
+            )
+            parameters.append(starts_with(ram_part))
+
+        sql = '''
+            SELECT r.path, r.cpu, (SELECT group_concat(g.name, ', ') FROM gpus g WHERE g.report_id = r.id)
+            FROM reports r
+        '''
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY r.id DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            parameters.append(limit)
+        return self.connection.execute(sql, parameters).fetchall()
+
+    def execute(self, sql: str, parameters: Sequence[Any] = ()) -> Tuple[List[str], List[tuple]]:
+        """
+        Runs a query of your own, returns the column names and the rows
+        """
+        cursor = self.connection.execute(sql, parameters)
+        columns = [column[0] for column in cursor.description or ()]
+        return columns, cursor.fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help='Add reports to the index')
+    ingest_parser.add_argument('database')
+    ingest_parser.add_argument('reports', nargs='+', help='Reports, or folders with reports')
+    ingest_parser.add_argument('--workers', type=int, help='Processes that read reports, one per CPU by default')
+    ingest_parser.add_argument('--batch-size', type=int, default=200, help='Reports per transaction')
+
+    query_parser = subparsers.add_parser('query', help='Find reports')
+    query_parser.add_argument('database')
+    query_parser.add_argument('--cpu')
+    query_parser.add_argument('--gpu')
+    query_parser.add_argument('--gpu-driver', help='Version of the graphics driver')
+    query_parser.add_argument('--driver', help='Device name or INF of a signed driver')
+    query_parser.add_argument('--driver-version')
+    query_parser.add_argument('--psu')
+    query_parser.add_argument('--ram-part')
+    query_parser.add_argument('--overclocks', choices=['Yes', 'No'])
+    query_parser.add_argument('--install-method', help='1-5, as numbered in the questionnaire')
+    query_parser.add_argument('--riser', action='store_true', default=None, help='Only GPUs on a PCIe riser cable')
+    query_parser.add_argument('--no-riser', dest='riser', action='store_false')
+    query_parser.add_argument('--limit', type=int)
+
+    sql_parser = subparsers.add_parser('sql', help='Run a query of your own')
+    sql_parser.add_argument('database')
+    sql_parser.add_argument('sql')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    with ReportIndex(args.database) as index:
+        if args.command == 'ingest':
+            index.ingest(args.reports, args.workers, args.batch_size)
+        elif args.command == 'query':
+            started = time.perf_counter()
+            rows = index.query(
+                args.cpu, args.gpu, args.gpu_driver, args.driver, args.driver_version, args.psu, args.ram_part,
+                args.overclocks, args.install_method, args.riser, args.limit
+            )
+            for path, cpu, gpus in rows:
+                print('{}\t{}\t{}'.format(path, cpu or '', gpus or ''))
+            print('{} reports in {:.0f} ms'.format(len(rows), (time.perf_counter() - started) * 1000))
+            if args.driver is not None or args.driver_version is not None:
+                without_drivers = index.reports_without_drivers()
+                if without_drivers:
+                    print('{} reports have no Signed Drivers and could not match'.format(without_drivers))
+        else:
+            columns, rows = index.execute(args.sql)
+            print('\t'.join(columns))
+            for row in rows:
+                print('\t'.join('' if value is None else str(value) for value in row))
+
+
+if __name__ == '__main__':
+    main()
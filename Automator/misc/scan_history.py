@@ -0,0 +1,216 @@
+"""
+Remembers how long past scans took to reach every percent, to estimate how long a running scan has left.
+
+The history is an append-only file of fixed-size records, one per finished scan. Once it grows past `max_size`,
+it's rewritten with only the newest records of every kind of scan
+"""
+import logging
+import math
+import os
+import statistics
+import struct
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+_MAGIC = b'AHS1'
+# tool, media type, size of the volume in bytes, finished (unix time), seconds it took to reach 0% ... 100%
+_RECORD = struct.Struct('<8sBQI101I')
+
+# MSFT_PhysicalDisk.MediaType
+MEDIA_UNKNOWN = 0
+MEDIA_HDD = 3
+MEDIA_SSD = 4
+MEDIA_SCM = 5
+
+
+class ScanKey(NamedTuple):
+    # 'sfc', 'dism', 'chkdsk' or 'chkdsk/r', at most 8 characters
+    tool: str
+    volume_size: int
+    media_type: int = MEDIA_UNKNOWN
+
+    def size_class(self) -> int:
+        # Volumes count as similar if they're within a factor of two of each other
+        return int(math.log2(self.volume_size)) if self.volume_size > 0 else -1
+
+
+class ScanRecord(NamedTuple):
+    key: ScanKey
+    finished: int
+    # Seconds since the start at which every percent from 0 to 100 was reached
+    times: Tuple[int, ...]
+
+    @property
+    def duration(self) -> int:
+        return self.times[-1]
+
+
+def _pack(record: ScanRecord) -> bytes:
+    return _RECORD.pack(
+        record.key.tool.encode('ascii')[:8], record.key.media_type, record.key.volume_size, record.finished,
+        *record.times
+    )
+
+
+def _unpack(data: bytes) -> ScanRecord:
+    tool, media_type, volume_size, finished, *times = _RECORD.unpack(data)
+    return ScanRecord(ScanKey(tool.rstrip(b'\0').decode('ascii'), volume_size, media_type), finished, tuple(times))
+
+
+class ScanTimeline:
+    """
+    Notes when a running scan reaches every percent
+    """
+    def __init__(self, key: ScanKey, clock: Callable[[], float] = time.monotonic):
+        self.key = key
+        self.clock = clock
+        self.started = clock()
+        # Seconds at which 0%, 1%, ... were first reached
+        self.times = [0]
+
+    def elapsed(self) -> float:
+        return self.clock() - self.started
+
+    @property
+    def percent(self) -> int:
+        return len(self.times) - 1
+
+    def remaining(self, estimator: 'EtaEstimator') -> Optional[float]:
+        return estimator.remaining(self.percent, self.times[-1], self.elapsed())
+
+    def update(self, percent: int):
+        if percent <= self.percent:
+            return
+        now = round(self.elapsed())
+        # Skipped percents count as reached right now
+        self.times.extend([now] * (min(percent, 100) - self.percent))
+
+    def finish(self) -> ScanRecord:
+        """
+        Returns the record of the scan, for a scan that finished successfully
+        """
+        self.update(100)
+        return ScanRecord(self.key, int(time.time()), tuple(self.times))
+
+
+class ScanHistory:
+    def __init__(self, path: str, max_per_key: int = 20, max_size: int = 256 * 1024):
+        self.path = path
+        self.max_per_key = max_per_key
+        self.max_size = max_size
+        self.logger = logging.getLogger('ScanHistory')
+
+    def records(self) -> List[ScanRecord]:
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        if data[:len(_MAGIC)] != _MAGIC:
+            self.logger.warning('{} is not a scan history, ignoring it'.format(self.path))
+            return []
+        records = []
+        # A record cut short by a crash while appending is left out, and cut off by the next `add()`
+        for offset in range(len(_MAGIC), len(data) - _RECORD.size + 1, _RECORD.size):
+            records.append(_unpack(data[offset:offset + _RECORD.size]))
+        return records
+
+    def add(self, record: ScanRecord):
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = 0
+        with open(self.path, 'r+b' if size else 'wb') as f:
+            header = f.read(len(_MAGIC)) if size else b''
+            if header == _MAGIC:
+                # Appending after a partial record would shift every record after it
+                f.truncate(size - (size - len(_MAGIC)) % _RECORD.size)
+                f.seek(0, os.SEEK_END)
+            else:
+                # New, cut short before even the header was written, or a file `records()` won't read. Appending to
+                # the latter would lose this record too, so start over
+                if len(header) == len(_MAGIC):
+                    self.logger.warning('{} is not a scan history, replacing it'.format(self.path))
+                f.seek(0)
+                f.truncate()
+                f.write(_MAGIC)
+            f.write(_pack(record))
+        if os.path.getsize(self.path) > self.max_size:
+            self.compact()
+
+    def compact(self):
+        """
+        Only keeps the newest `max_per_key` records of every tool, media type and volume size class
+        """
+        groups: Dict[Tuple[str, int, int], List[ScanRecord]] = {}
+        for record in self.records():
+            key = (record.key.tool, record.key.media_type, record.key.size_class())
+            groups.setdefault(key, []).append(record)
+        kept = sorted(
+            (record for records in groups.values() for record in records[-self.max_per_key:]),
+            key=lambda record: record.finished
+        )
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(b''.join(_pack(record) for record in kept))
+        os.replace(temp_path, self.path)
+        self.logger.info('Compacted the scan history to {} records'.format(len(kept)))
+
+    def similar(self, key: ScanKey, limit: int = 20) -> List[ScanRecord]:
+        """
+        Returns the newest records of the same tool, preferring the same kind of disk and a similar volume size
+        """
+        records = [record for record in self.records() if record.key.tool == key.tool]
+
+        def closeness(record: ScanRecord) -> Tuple[bool, bool, int]:
+            return record.key.media_type == key.media_type, record.key.size_class() == key.size_class(), \
+                record.finished
+
+        return sorted(records, key=closeness, reverse=True)[:limit]
+
+
+class EtaEstimator:
+    """
+    Estimates the remaining time of a scan from how long similar scans took from the same percent to the end, scaled
+    by how fast this scan has been so far. Without any history, the progress so far is extrapolated
+    """
+    # Don't extrapolate from the first few percents, they're mostly startup time
+    min_percent_without_history = 5
+    # How far a scan may be slower or faster than the ones before it
+    max_speed_factor = 3.0
+
+    def __init__(self, records: Iterable[ScanRecord]):
+        self.records = [record for record in records if record.duration > 0]
+
+    def remaining(self, percent: int, reached_at: float, elapsed: float) -> Optional[float]:
+        """
+        `reached_at` is when the scan reached `percent`, `elapsed` is now. Both are seconds since the scan started
+        """
+        percent = max(0, min(percent, 100))
+        if percent == 100:
+            return 0.0
+        # Time spent since the last percent is already used up
+        waited = elapsed - reached_at
+        if not self.records:
+            if percent < self.min_percent_without_history:
+                return None
+            return max(0.0, reached_at * (100 - percent) / percent - waited)
+        estimates = []
+        for record in self.records:
+            reached = record.times[percent]
+            speed = reached_at / reached if reached > 0 and reached_at > 0 else 1.0
+            speed = max(1 / self.max_speed_factor, min(speed, self.max_speed_factor))
+            estimates.append(max(0.0, (record.duration - reached) * speed - waited))
+        return statistics.median(estimates)
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return ''
+    if seconds < 60:
+        return 'Less than a minute left'
+    minutes = round(seconds / 60)
+    if minutes < 60:
+        return 'About {} min left'.format(minutes)
+    return 'About {}:{:02} h left'.format(*divmod(minutes, 60))
@@ -0,0 +1,69 @@
+import getpass
+from logging import getLogger
+
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtNetwork import QLocalServer, QLocalSocket
+
+
+class SingleInstance(QObject):
+    """
+    Makes sure only one Automator runs per user. Later launches hand their request over to the running instance
+    (which emits `messageReceived`) instead of starting up themselves
+    """
+    messageReceived = pyqtSignal(str)
+
+    def __init__(self, name: str = None, *args, **kwargs):
+        super(SingleInstance, self).__init__(*args, **kwargs)
+        self.name = name or '24hs.automator-{}'.format(getpass.getuser())
+        self.logger = getLogger('SingleInstance')
+        self.server = None
+
+    def forward(self, message: str, timeout: int = 250) -> bool:
+        """
+        Sends `message` to an already running instance. Returns False if there is none
+        """
+        socket = QLocalSocket()
+        socket.connectToServer(self.name)
+        if not socket.waitForConnected(timeout):
+            return False
+        socket.write((message + '\n').encode('utf-8'))
+        socket.flush()
+        socket.waitForBytesWritten(timeout)
+        socket.disconnectFromServer()
+        self.logger.info('Handed "{}" over to the running instance'.format(message))
+        return True
+
+    def listen(self) -> bool:
+        self.server = QLocalServer(self)
+        if not self.server.listen(self.name):
+            # Another instance might have started at the same time as us
+            socket = QLocalSocket()
+            socket.connectToServer(self.name)
+            if socket.waitForConnected(250):
+                socket.disconnectFromServer()
+                return False
+            # Otherwise it's left over from an instance that crashed
+            QLocalServer.removeServer(self.name)
+            if not self.server.listen(self.name):
+                self.logger.warning('Could not listen for other instances: {}'.format(self.server.errorString()))
+                return False
+        # noinspection PyUnresolvedReferences
+        self.server.newConnection.connect(self._new_connection)
+        return True
+
+    def _new_connection(self):
+        socket = self.server.nextPendingConnection()
+
+        def read_messages():
+            while socket.canReadLine():
+                message = bytes(socket.readLine()).decode('utf-8').strip()
+                if message:
+                    # noinspection PyUnresolvedReferences
+                    self.messageReceived.emit(message)
+
+        # noinspection PyUnresolvedReferences
+        socket.readyRead.connect(read_messages)
+        # noinspection PyUnresolvedReferences
+        socket.disconnected.connect(socket.deleteLater)
+        # The message may well have arrived before we got here
+        read_messages()
@@ -0,0 +1,333 @@
+"""
+Collects system information ourselves instead of waiting for msinfo32.
+
+Every category comes from its own provider, and the providers run in parallel with a timeout each, so one slow
+category can't hold up the whole report. The result is written in the same format as an msinfo32 report (UTF-16,
+`[Category]` lines followed by tab-separated tables), so everything that reads those reads these as well:
+
+    python -m Automator.misc.sysinfo_collector <Sysinfo.txt>
+"""
+import argparse
+import codecs
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from Automator.misc.msinfo_report import Table
+from Automator.misc.wmi_session import close_session, get_session
+
+DONE = 'done'
+FAILED = 'failed'
+TIMED_OUT = 'timed out'
+CANCELLED = 'cancelled'
+
+
+class InfoProvider:
+    """
+    Collects one category of the report. `collect()` runs on a worker thread of its own
+    """
+    # Path of the category in the report, like 'Components/Display'
+    category: str = ''
+    # Seconds after which the category is given up on
+    timeout: float = 30
+
+    def collect(self) -> List[Table]:
+        raise NotImplementedError
+
+
+class CategoryResult(NamedTuple):
+    category: str
+    status: str
+    tables: List[Table]
+    error: Optional[str]
+    duration: float
+
+
+def _format_value(value: Any) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'Yes' if value else 'No'
+    if isinstance(value, (list, tuple)):
+        return ', '.join(_format_value(item) for item in value)
+    # Tabs and line breaks would break the table
+    return ' '.join(str(value).split())
+
+
+class WmiProvider(InfoProvider):
+    """
+    Reads one WMI class. With `per_instance`, every instance becomes an Item / Value table of its own, like msinfo32
+    shows devices. Otherwise all instances end up as rows of one table
+    """
+    def __init__(self, category: str, class_name: str, columns: Sequence[Tuple[str, str]],
+                 where: Optional[str] = None, per_instance: bool = False, timeout: float = 30):
+        self.category = category
+        self.class_name = class_name
+        # (column title, WMI property)
+        self.columns = list(columns)
+        self.where = where
+        self.per_instance = per_instance
+        self.timeout = timeout
+
+    def collect(self) -> List[Table]:
+        rows = get_session().query(self.class_name, [prop for _, prop in self.columns], self.where)
+        titles = [title for title, _ in self.columns]
+        if self.per_instance:
+            return [
+                Table(['Item', 'Value'], [[title, _format_value(row[prop])] for title, prop in self.columns])
+                for row in rows
+            ]
+        return [Table(titles, [[_format_value(row[prop]) for _, prop in self.columns] for row in rows])]
+
+
+class SystemSummaryProvider(InfoProvider):
+    """
+    The most important parts of msinfo32's System Summary, with the same item names
+    """
+    category = 'System Summary'
+    timeout = 20
+
+    def collect(self) -> List[Table]:
+        results = get_session().batch({
+            'os': ('Win32_OperatingSystem', [
+                'Caption', 'Version', 'BuildNumber', 'OSArchitecture', 'WindowsDirectory', 'Locale',
+                'TotalVisibleMemorySize', 'FreePhysicalMemory', 'InstallDate', 'LastBootUpTime'
+            ], None),
+            'system': ('Win32_ComputerSystem', ['Name', 'Manufacturer', 'Model', 'SystemType',
+                                                'TotalPhysicalMemory'], None),
+            'processor': ('Win32_Processor', ['Name', 'NumberOfCores', 'NumberOfLogicalProcessors',
+                                              'MaxClockSpeed'], None),
+            'bios': ('Win32_BIOS', ['Manufacturer', 'SMBIOSBIOSVersion', 'ReleaseDate'], None),
+            'board': ('Win32_BaseBoard', ['Manufacturer', 'Product', 'Version'], None),
+        })
+        first = {key: rows[0] if rows else {} for key, rows in results.items()}
+        os_info, system, bios, board = first['os'], first['system'], first['bios'], first['board']
+
+        def gigabytes(value, unit: int) -> str:
+            return '{:.1f} GB'.format(int(value or 0) * unit / 1024 ** 3)
+
+        items = [
+            ('OS Name', os_info.get('Caption')),
+            ('Version', '{} Build {}'.format(os_info.get('Version'), os_info.get('BuildNumber'))),
+            ('System Name', system.get('Name')),
+            ('System Manufacturer', system.get('Manufacturer')),
+            ('System Model', system.get('Model')),
+            ('System Type', system.get('SystemType')),
+        ]
+        items.extend(
+            ('Processor', '{}, {} Mhz, {} Core(s), {} Logical Processor(s)'.format(
+                processor['Name'], processor['MaxClockSpeed'], processor['NumberOfCores'],
+                processor['NumberOfLogicalProcessors']
+            ))
+            for processor in results['processor']
+        )
+        items.extend([
+            ('BIOS Version/Date', '{} {}, {}'.format(
+                bios.get('Manufacturer'), bios.get('SMBIOSBIOSVersion'), bios.get('ReleaseDate')
+            )),
+            ('BaseBoard Manufacturer', board.get('Manufacturer')),
+            ('BaseBoard Product', board.get('Product')),
+            ('BaseBoard Version', board.get('Version')),
+            ('Windows Directory', os_info.get('WindowsDirectory')),
+            ('Locale', os_info.get('Locale')),
+            ('Installed Physical Memory (RAM)', gigabytes(system.get('TotalPhysicalMemory'), 1)),
+            # Both in KB
+            ('Total Physical Memory', gigabytes(os_info.get('TotalVisibleMemorySize'), 1024)),
+            ('Available Physical Memory', gigabytes(os_info.get('FreePhysicalMemory'), 1024)),
+            ('Install Date', os_info.get('InstallDate')),
+            ('Last Boot Up Time', os_info.get('LastBootUpTime')),
+        ])
+        return [Table(['Item', 'Value'], [[item, _format_value(value)] for item, value in items])]
+
+
+def default_providers() -> List[InfoProvider]:
+    """
+    The categories triage looks at, in the order msinfo32 reports them
+    """
+    return [
+        SystemSummaryProvider(),
+        WmiProvider('Components/Display', 'Win32_VideoController', [
+            ('Name', 'Name'), ('PNP Device ID', 'PNPDeviceID'), ('Adapter RAM', 'AdapterRAM'),
+            ('Driver Version', 'DriverVersion'), ('Driver Date', 'DriverDate'), ('Resolution', 'VideoModeDescription'),
+            ('Refresh Rate', 'CurrentRefreshRate'), ('Status', 'Status'),
+        ], per_instance=True),
+        WmiProvider('Components/Memory', 'Win32_PhysicalMemory', [
+            ('Bank Label', 'BankLabel'), ('Device Locator', 'DeviceLocator'), ('Capacity', 'Capacity'),
+            ('Speed', 'Speed'), ('Configured Speed', 'ConfiguredClockSpeed'), ('Manufacturer', 'Manufacturer'),
+            ('Part Number', 'PartNumber'), ('Form Factor', 'FormFactor'),
+        ]),
+        WmiProvider('Components/Storage/Drives', 'Win32_LogicalDisk', [
+            ('Drive', 'DeviceID'), ('Description', 'Description'), ('File System', 'FileSystem'), ('Size', 'Size'),
+            ('Free Space', 'FreeSpace'), ('Volume Name', 'VolumeName'), ('Volume Serial Number', 'VolumeSerialNumber'),
+        ], per_instance=True),
+        WmiProvider('Components/Storage/Disks', 'Win32_DiskDrive', [
+            ('Description', 'Description'), ('Manufacturer', 'Manufacturer'), ('Model', 'Model'),
+            ('Media Type', 'MediaType'), ('Partitions', 'Partitions'), ('Size', 'Size'),
+            ('Interface Type', 'InterfaceType'), ('Serial Number', 'SerialNumber'), ('Status', 'Status'),
+        ], per_instance=True),
+        WmiProvider('Components/Problem Devices', 'Win32_PnPEntity', [
+            ('Device', 'Name'), ('PNP Device ID', 'PNPDeviceID'), ('Error Code', 'ConfigManagerErrorCode'),
+        ], where='ConfigManagerErrorCode <> 0'),
+        WmiProvider('Software Environment/System Drivers', 'Win32_SystemDriver', [
+            ('Name', 'Name'), ('Description', 'Description'), ('File', 'PathName'), ('Type', 'ServiceType'),
+            ('Started', 'Started'), ('Start Mode', 'StartMode'), ('State', 'State'), ('Status', 'Status'),
+        ]),
+        WmiProvider('Software Environment/Services', 'Win32_Service', [
+            ('Display Name', 'DisplayName'), ('Name', 'Name'), ('State', 'State'), ('Start Mode', 'StartMode'),
+            ('Service Type', 'ServiceType'), ('Path', 'PathName'), ('Start Name', 'StartName'),
+        ]),
+        WmiProvider('Software Environment/Startup Programs', 'Win32_StartupCommand', [
+            ('Program', 'Caption'), ('Command', 'Command'), ('User Name', 'User'), ('Location', 'Location'),
+        ]),
+        # The report index looks up drivers here, with msinfo32's column names
+        WmiProvider('Software Environment/Signed Drivers', 'Win32_PnPSignedDriver', [
+            ('Device Name', 'DeviceName'), ('Signed', 'IsSigned'), ('Device Class', 'DeviceClass'),
+            ('Driver Version', 'DriverVersion'), ('Driver Date', 'DriverDate'), ('Manufacturer', 'Manufacturer'),
+            ('INF Name', 'InfName'), ('Signer', 'Signer'),
+        ], where='DeviceName IS NOT NULL'),
+    ]
+
+
+class SysInfoCollector:
+    """
+    Runs the providers on up to `max_workers` threads at once. A provider that runs past its timeout is given up on:
+    its thread is left to finish in the background (a stuck WMI call can't be interrupted), and its slot goes to the
+    next provider. The threads are daemon threads, so a stuck one doesn't keep the Automator from exiting either.
+
+    `on_progress` is called with every finished result, on the thread that called `collect()`. `cancel()` makes
+    `collect()` return right away, without starting the providers that are still pending
+    """
+    def __init__(self, providers: Sequence[InfoProvider], max_workers: int = 4,
+                 on_progress: Optional[Callable[[CategoryResult], None]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.providers = list(providers)
+        self.max_workers = max_workers
+        self.on_progress = on_progress
+        self.clock = clock
+        self.logger = logging.getLogger('SysInfoCollector')
+        self._finished = queue.Queue()
+        self._cancelled = threading.Event()
+
+    @staticmethod
+    def _work(index: int, provider: InfoProvider, results: queue.Queue):
+        try:
+            tables = provider.collect()
+        except Exception as e:
+            results.put((index, FAILED, [], '{}: {}'.format(type(e).__name__, e)))
+        else:
+            results.put((index, DONE, tables, None))
+        finally:
+            # WMI sessions belong to this thread, which ends now
+            close_session()
+
+    def _report(self, results: Dict[int, CategoryResult], index: int, result: CategoryResult):
+        results[index] = result
+        if result.status != DONE:
+            self.logger.warning('{} {}: {}'.format(result.category, result.status, result.error))
+        if self.on_progress:
+            self.on_progress(result)
+
+    def cancel(self):
+        self._cancelled.set()
+        # Wakes up collect()
+        self._finished.put((None, None, None, None))
+
+    def collect(self) -> List[CategoryResult]:
+        """
+        Returns the results in the order of the providers, once every provider has finished or timed out. After
+        `cancel()`, whatever hadn't finished yet is CANCELLED
+        """
+        pending = list(enumerate(self.providers))
+        # index -> when it started
+        running: Dict[int, float] = {}
+        finished = self._finished
+        results: Dict[int, CategoryResult] = {}
+        while (pending or running) and not self._cancelled.is_set():
+            while pending and len(running) < self.max_workers:
+                index, provider = pending.pop(0)
+                running[index] = self.clock()
+                threading.Thread(
+                    target=self._work, args=(index, provider, finished), daemon=True,
+                    name='SysInfo {}'.format(provider.category)
+                ).start()
+            deadline = min(started + self.providers[index].timeout for index, started in running.items())
+            try:
+                index, status, tables, error = finished.get(timeout=max(0.0, deadline - self.clock()))
+            except queue.Empty:
+                index, status, tables, error = None, None, None, None
+            if index in running:
+                self._report(results, index, CategoryResult(
+                    self.providers[index].category, status, tables, error, self.clock() - running.pop(index)
+                ))
+            # Results of providers that were given up on already are dropped
+            now = self.clock()
+            for index, started in list(running.items()):
+                provider = self.providers[index]
+                if now - started >= provider.timeout:
+                    del running[index]
+                    self._report(results, index, CategoryResult(
+                        provider.category, TIMED_OUT, [], 'No result after {:.0f} seconds'.format(provider.timeout),
+                        now - started
+                    ))
+        return [
+            results.get(index) or CategoryResult(provider.category, CANCELLED, [], 'Cancelled', 0)
+            for index, provider in enumerate(self.providers)
+        ]
+
+
+def _format_table(table: Table) -> List[str]:
+    return ['\t'.join(table.columns) + '\t'] + ['\t'.join(row) + '\t' for row in table.rows]
+
+
+def format_report(results: Sequence[CategoryResult]) -> List[str]:
+    """
+    Turns the results into the lines of an msinfo32 report. Parent categories get a `[Name]` line of their own, like
+    msinfo32 writes them, and categories that couldn't be collected say why
+    """
+    lines = ['System Information report written at: {}'.format(time.strftime('%x %X')), '']
+    parents: List[str] = []
+    for result in results:
+        # 'Hardware Resources/Conflicts/Sharing' has a slash in its name, but none of ours do
+        *category_parents, name = result.category.split('/')
+        shared = 0
+        while shared < min(len(parents), len(category_parents)) and parents[shared] == category_parents[shared]:
+            shared += 1
+        for parent in category_parents[shared:]:
+            lines.extend(['[{}]'.format(parent), ''])
+        parents = category_parents
+        lines.extend(['[{}]'.format(name), ''])
+        if result.status != DONE:
+            tables = [Table(['Item', 'Value'], [['Collection Error', '{} ({})'.format(result.status, result.error)]])]
+        else:
+            tables = result.tables
+        for table in tables:
+            lines.extend(_format_table(table))
+            lines.append('')
+    return lines
+
+
+def write_report(path: str, results: Sequence[CategoryResult]):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(codecs.BOM_UTF16_LE)
+        f.write('\r\n'.join(format_report(results)).encode('utf_16_le'))
+    os.replace(temp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('report')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    collector = SysInfoCollector(default_providers(), args.workers, lambda result: print(
+        '{:<45} {:<10} {:.1f} s'.format(result.category, result.status, result.duration)
+    ))
+    write_report(args.report, collector.collect())
+
+
+if __name__ == '__main__':
+    main()
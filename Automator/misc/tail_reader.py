@@ -0,0 +1,79 @@
+import codecs
+import os
+import re
+from typing import List
+
+# Same line endings that universal newline mode (what `open()` uses by default) splits on
+_LINE_END = re.compile(r'\r\n|\r|\n')
+
+
+class LineDecoder:
+    """
+    Incrementally decodes raw bytes into complete lines, keeping partial lines and split code units around
+    """
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self._pending = ''
+
+    def feed(self, data: bytes) -> List[str]:
+        text = self._pending + self._decoder.decode(data)
+        # A '\r' at the very end might be the first half of a '\r\n', so wait for the next chunk before deciding
+        hold_back_cr = text.endswith('\r')
+        if hold_back_cr:
+            text = text[:-1]
+        lines = _LINE_END.split(text)
+        self._pending = lines.pop(-1)
+        if hold_back_cr:
+            self._pending += '\r'
+        return lines
+
+    def flush(self) -> List[str]:
+        """
+        Returns whatever is left over once no more data is going to arrive
+        """
+        text = self._pending + self._decoder.decode(b'', final=True)
+        self._pending = ''
+        self._decoder.reset()
+        return [line for line in _LINE_END.split(text) if line]
+
+    @property
+    def has_pending(self) -> bool:
+        return bool(self._pending)
+
+
+class TailReader:
+    """
+    Reads only the data appended to a file since the last call, without re-reading what was already seen
+    """
+    def __init__(self, path: str, encoding: str, chunk_size: int = 64 * 1024):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.offset = 0
+        self._encoding = encoding
+        self._decoder = LineDecoder(encoding)
+
+    def read_lines(self) -> List[str]:
+        lines = []
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return lines
+        # The file was replaced or truncated, start from the beginning again
+        if size < self.offset:
+            self.offset = 0
+            self._decoder = LineDecoder(self._encoding)
+        if size == self.offset:
+            return lines
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                self.offset += len(chunk)
+                lines.extend(self._decoder.feed(chunk))
+        return lines
+
+    def flush(self) -> List[str]:
+        return self._decoder.flush()
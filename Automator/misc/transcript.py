@@ -0,0 +1,86 @@
+"""
+Records the output of scans with timestamps and plays it back again
+
+Playing back is done by a separate process that writes the recorded lines to stdout with the original timing, so
+it can stand in for the real (elevated, Windows-only) scan:
+
+    python -m Automator.misc.transcript <transcript.jsonl> [--speed 10]
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import List, Tuple
+
+
+class TranscriptRecorder:
+    """
+    Writes every line of a scan's output into a JSON Lines file, together with the seconds since the scan started
+    """
+    def __init__(self, path: str, tool: str, encoding: str):
+        self.path = path
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write(json.dumps({'tool': tool, 'encoding': encoding, 'started': datetime.now().isoformat()}))
+        self._file.write('\n')
+
+    def record(self, lines: List[str]):
+        elapsed = round(time.monotonic() - self._start, 4)
+        with self._lock:
+            if self._file is None:
+                return
+            for line in lines:
+                self._file.write(json.dumps({'t': elapsed, 'line': line}))
+                self._file.write('\n')
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def load_transcript(path: str) -> Tuple[dict, List[Tuple[float, str]]]:
+    """
+    Returns the header of a transcript (tool, encoding, start time) and its (seconds, line) entries
+    """
+    with open(path, encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        entries = []
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entries.append((entry['t'], entry['line']))
+    return header, entries
+
+
+def play(path: str, speed: float = 1.0):
+    """
+    Writes a transcript to stdout the same way the tool originally did, `speed` times as fast
+    """
+    header, entries = load_transcript(path)
+    out = sys.stdout.buffer
+    start = time.monotonic()
+    for elapsed, line in entries:
+        if speed > 0:
+            delay = elapsed / speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+        out.write((line + '\r\n').encode(header['encoding']))
+        out.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('transcript')
+    parser.add_argument('--speed', type=float, default=1.0, help='Playback speed, 0 plays everything at once')
+    args = parser.parse_args()
+    play(args.transcript, args.speed)
+
+
+if __name__ == '__main__':
+    main()
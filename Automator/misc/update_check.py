@@ -1,24 +1,110 @@
+import json
+import os
+import threading
+import time
+import webbrowser
 from logging import getLogger
+from typing import Optional
 
+from PyQt6.QtCore import QObject, pyqtSignal
 from PyQt6.QtWidgets import QMessageBox, QWidget
-from packaging import version
-from requests import get
-from webbrowser import open
 
 from Automator import __version__
+from Automator.misc.paths import get_data_path
 
+RELEASES_URL = 'https://api.github.com/repos/24HourSupport/Automator/releases/latest'
+DOWNLOAD_URL = 'https://github.com/24HourSupport/Automator/releases/latest/download/24HS-Automator.exe'
 
-def run_update_check(parent: QWidget):
+
+def fetch_latest_release(url: str = RELEASES_URL, cache_path: Optional[str] = None, ttl: float = 6 * 60 * 60,
+                         timeout: float = 5) -> dict:
+    """
+    Returns the latest release data from the GitHub API. Responses are cached in `cache_path` for `ttl` seconds,
+    after which they're revalidated with their ETag (which doesn't count against the rate limit if nothing changed)
+    """
+    # requests and packaging take a while to import, and the update check only ever needs them in the background
+    from requests import RequestException, get
     logger = getLogger('UpdateCheck')
-    latest_release_data = get(
-        'https://api.github.com/repos/24HourSupport/Automator/releases/latest'
-    ).json()
-    latest_version = latest_release_data['tag_name']
-    logger.debug(f'Latest version is {latest_version}')
-    if version.parse(latest_version) <= version.parse(__version__):
-        logger.info('No updates found')
-        return
-    logger.warning('We\'re not up to date, displaying update dialog')
+    cached = None
+    if cache_path:
+        try:
+            with open(cache_path, encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = None
+    if cached and cached.get('url') == url and time.time() - cached.get('fetched_at', 0) < ttl:
+        logger.debug('Using cached release data')
+        return cached['data']
+
+    headers = {'Accept': 'application/vnd.github.v3+json'}
+    if cached and cached.get('url') == url and cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    try:
+        response = get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            logger.debug('Cached release data is still up to date')
+            data, etag = cached['data'], cached['etag']
+        else:
+            response.raise_for_status()
+            data, etag = response.json(), response.headers.get('ETag')
+    except (RequestException, ValueError):
+        # Better a slightly outdated answer than none at all
+        if cached and cached.get('url') == url:
+            logger.warning('Could not reach GitHub, using cached release data')
+            return cached['data']
+        raise
+
+    if cache_path:
+        temp_path = cache_path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'url': url, 'etag': etag, 'fetched_at': time.time(), 'data': data}, f)
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            logger.warning(f'Could not cache release data: {e}')
+    return data
+
+
+class UpdateChecker(QObject):
+    """
+    Checks for updates on a background thread and emits `updateAvailable` with the release data if there is one
+    """
+    updateAvailable = pyqtSignal(dict)
+    checkFailed = pyqtSignal(str)
+
+    def __init__(self, url: str = RELEASES_URL, cache_path: Optional[str] = None, *args, **kwargs):
+        super(UpdateChecker, self).__init__(*args, **kwargs)
+        self.url = url
+        self.cache_path = cache_path if cache_path is not None else get_data_path('latest_release.json')
+        self.logger = getLogger('UpdateCheck')
+
+    def _run(self):
+        from packaging import version
+        from requests import RequestException
+        try:
+            latest_release_data = fetch_latest_release(self.url, self.cache_path)
+            latest_version = latest_release_data['tag_name']
+            self.logger.debug(f'Latest version is {latest_version}')
+            # Raises InvalidVersion (a ValueError) for tags that aren't version numbers
+            up_to_date = version.parse(latest_version) <= version.parse(__version__)
+        except (RequestException, ValueError, KeyError, TypeError) as e:
+            self.logger.warning(f'Update check failed: {e}')
+            # noinspection PyUnresolvedReferences
+            self.checkFailed.emit(str(e))
+            return
+        if up_to_date:
+            self.logger.info('No updates found')
+            return
+        self.logger.warning('We\'re not up to date')
+        # noinspection PyUnresolvedReferences
+        self.updateAvailable.emit(latest_release_data)
+
+    def start(self):
+        threading.Thread(target=self._run, name='UpdateCheck', daemon=True).start()
+
+
+def show_update_dialog(parent: QWidget):
+    getLogger('UpdateCheck').warning('Displaying update dialog')
     update_msg = QMessageBox(
         QMessageBox.Icon.Warning,
         'Update available',
@@ -28,8 +114,16 @@ def run_update_check(parent: QWidget):
         parent
     )
     update_msg.exec()
-    open(
-        'https://github.com/24HourSupport/Automator/releases/latest/download/24HS-Automator.exe',
-        2
-    )
+    webbrowser.open(DOWNLOAD_URL, 2)
     exit(0)
+
+
+def show_update_ready_dialog(parent: QWidget, new_version: str):
+    QMessageBox(
+        QMessageBox.Icon.Information,
+        'Update downloaded',
+        f'Version {new_version} of the Automator was downloaded\n'
+        'It will be installed the next time the Automator is started',
+        QMessageBox.StandardButton.Ok,
+        parent
+    ).exec()
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from logging import getLogger
+from typing import Callable, Optional
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from Automator.misc.paths import get_data_path
+
+ASSET_NAME = '24HS-Automator.exe'
+
+ProgressCallback = Callable[[int, int], None]
+
+
+class VerificationError(Exception):
+    pass
+
+
+def find_asset_url(release_data: dict, name: str) -> Optional[str]:
+    for asset in release_data.get('assets', []):
+        if asset.get('name') == name:
+            return asset.get('browser_download_url')
+    return None
+
+
+def is_onefile_build() -> bool:
+    """
+    Whether we're running as the single-file binary that releases are published as.
+    The unpacked (onedir) build and running from source can't be updated by swapping out one file
+    """
+    if not getattr(sys, 'frozen', False):
+        return False
+    # The onefile build unpacks itself into a temporary folder, the onedir build runs right next to its binary
+    bundle_path = os.path.normcase(os.path.abspath(getattr(sys, '_MEIPASS', '')))
+    exe_folder = os.path.normcase(os.path.dirname(os.path.abspath(sys.executable)))
+    return not bundle_path.startswith(exe_folder)
+
+
+def find_expected_sha256(release_data: dict, name: str = ASSET_NAME, timeout: float = 10) -> Optional[str]:
+    """
+    Looks up the published SHA-256 of an asset, either from the digest GitHub lists for it or from a
+    '<name>.sha256' file uploaded next to it
+    """
+    # requests takes a while to import, and the update only ever needs it in the background
+    from requests import get
+    for asset in release_data.get('assets', []):
+        digest = asset.get('digest') or ''
+        if asset.get('name') == name and digest.startswith('sha256:'):
+            return digest[len('sha256:'):].lower()
+    checksum_url = find_asset_url(release_data, name + '.sha256')
+    if not checksum_url:
+        return None
+    response = get(checksum_url, timeout=timeout)
+    response.raise_for_status()
+    # Usually formatted like sha256sum's output ('<hash>  <file name>')
+    return response.text.split()[0].lower()
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def download_file(url: str, path: str, expected_sha256: str, progress: Optional[ProgressCallback] = None,
+                  cancelled: Optional[threading.Event] = None, retries: int = 5, timeout: float = 15,
+                  chunk_size: int = 64 * 1024):
+    """
+    Downloads `url` to `path`, hashing it while it's written. Data is kept in '<path>.part' until it's complete and
+    verified, so an interrupted download (even from a previous run) is resumed with a Range request
+    """
+    from requests import RequestException, get
+    logger = getLogger('Updater')
+    part_path = path + '.part'
+    attempt = 0
+    while True:
+        # Whatever is already on disk has to go into the hash first
+        file_hash = hashlib.sha256()
+        done = 0
+        if os.path.exists(part_path):
+            with open(part_path, 'rb') as f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+                    file_hash.update(chunk)
+                    done += len(chunk)
+        headers = {'Range': f'bytes={done}-'} if done else {}
+        try:
+            with get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416:
+                    # We already have everything the server has to offer
+                    logger.debug('Download was already complete')
+                    break
+                response.raise_for_status()
+                if done and response.status_code != 206:
+                    # The server ignored the Range header, so we get the whole file again
+                    logger.info('Server does not support resuming, starting over')
+                    file_hash = hashlib.sha256()
+                    done = 0
+                elif done:
+                    logger.info(f'Resuming download at {done} bytes')
+                total = done + int(response.headers.get('Content-Length', 0))
+                with open(part_path, 'ab' if done else 'wb') as f:
+                    for chunk in response.iter_content(chunk_size):
+                        if cancelled and cancelled.is_set():
+                            logger.info('Download cancelled')
+                            return
+                        f.write(chunk)
+                        file_hash.update(chunk)
+                        done += len(chunk)
+                        if progress:
+                            progress(done, total)
+            break
+        except RequestException as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            logger.warning(f'Download interrupted ({e}), retrying ({attempt}/{retries})')
+            time.sleep(min(2 ** attempt, 30))
+
+    if file_hash.hexdigest() != expected_sha256.lower():
+        os.remove(part_path)
+        raise VerificationError(f'Checksum mismatch, expected {expected_sha256} but got {file_hash.hexdigest()}')
+    os.replace(part_path, path)
+
+
+def _pending_info_path() -> str:
+    return get_data_path('update', 'pending.json')
+
+
+def stage_update(release_data: dict, progress: Optional[ProgressCallback] = None,
+                 cancelled: Optional[threading.Event] = None) -> bool:
+    """
+    Downloads and verifies the new binary so it can be swapped in on the next launch.
+    Returns False if the release doesn't publish what we need to do that safely
+    """
+    logger = getLogger('Updater')
+    url = find_asset_url(release_data, ASSET_NAME)
+    expected_sha256 = find_expected_sha256(release_data)
+    if not url or not expected_sha256:
+        logger.warning('Release has no binary or no checksum, can\'t update automatically')
+        return False
+    update_dir = get_data_path('update')
+    if not os.path.isdir(update_dir):
+        os.mkdir(update_dir)
+    staged_path = os.path.join(update_dir, ASSET_NAME)
+    if os.path.exists(staged_path) and hash_file(staged_path) == expected_sha256:
+        logger.info('Update was already downloaded')
+    else:
+        download_file(url, staged_path, expected_sha256, progress, cancelled)
+        if cancelled and cancelled.is_set():
+            return False
+    with open(_pending_info_path(), 'w', encoding='utf-8') as f:
+        json.dump({'version': release_data['tag_name'], 'sha256': expected_sha256}, f)
+    logger.info('Update {} is ready to be installed'.format(release_data['tag_name']))
+    return True
+
+
+def apply_pending_update() -> bool:
+    """
+    Swaps a staged update in place of the running binary and starts it. Returns True if the caller should exit
+    so the new version can take over. Only does anything for the onefile build
+    """
+    logger = getLogger('Updater')
+    if not is_onefile_build():
+        return False
+    current_path = sys.executable
+    old_path = current_path + '.old'
+    # Left over from the last update, the old binary can only be deleted once it isn't running anymore
+    if os.path.exists(old_path):
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+    info_path = _pending_info_path()
+    if not os.path.exists(info_path):
+        return False
+    with open(info_path, encoding='utf-8') as f:
+        info = json.load(f)
+    os.remove(info_path)
+    staged_path = get_data_path('update', ASSET_NAME)
+    if not os.path.exists(staged_path) or hash_file(staged_path) != info['sha256']:
+        logger.error('Staged update is missing or damaged, not installing it')
+        return False
+
+    # Get the new binary onto the same volume first, so the actual swap is a rename
+    new_path = current_path + '.new'
+    try:
+        with open(staged_path, 'rb') as src, open(new_path, 'wb') as dst:
+            while True:
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                dst.write(chunk)
+        # Windows doesn't let us overwrite a running executable, but it does let us rename it
+        os.replace(current_path, old_path)
+        try:
+            os.replace(new_path, current_path)
+        except OSError:
+            os.replace(old_path, current_path)
+            raise
+    except OSError as e:
+        logger.error(f'Could not install update: {e}')
+        if os.path.exists(new_path):
+            os.remove(new_path)
+        return False
+    os.remove(staged_path)
+    logger.info('Installed update {}, restarting'.format(info['version']))
+    subprocess.Popen([current_path] + sys.argv[1:])
+    return True
+
+
+class UpdateDownloader(QObject):
+    """
+    Stages an update on a background thread
+    """
+    downloadProgress = pyqtSignal(int, int)
+    downloadFinished = pyqtSignal(str)
+    downloadFailed = pyqtSignal(str)
+
+    def __init__(self, release_data: dict, *args, **kwargs):
+        super(UpdateDownloader, self).__init__(*args, **kwargs)
+        self.release_data = release_data
+        self.logger = getLogger('Updater')
+        self._cancelled = threading.Event()
+
+    def _run(self):
+        from requests import RequestException
+        try:
+            # noinspection PyUnresolvedReferences
+            staged = stage_update(self.release_data, self.downloadProgress.emit, self._cancelled)
+        except (RequestException, VerificationError, OSError) as e:
+            self.logger.error(f'Downloading the update failed: {e}')
+            # noinspection PyUnresolvedReferences
+            self.downloadFailed.emit(str(e))
+            return
+        if staged:
+            # noinspection PyUnresolvedReferences
+            self.downloadFinished.emit(self.release_data['tag_name'])
+        elif not self._cancelled.is_set():
+            # noinspection PyUnresolvedReferences
+            self.downloadFailed.emit('Release can\'t be installed automatically')
+
+    def start(self):
+        threading.Thread(target=self._run, name='UpdateDownloader', daemon=True).start()
+
+    def cancel(self):
+        self._cancelled.set()
@@ -0,0 +1,97 @@
+import os
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from Automator.misc.wmi_session import get_session
+
+# MSFT_Volume.DriveType for local disks, as opposed to removable, network or optical drives
+_DRIVE_TYPE_FIXED = 3
+
+
+class Volume(NamedTuple):
+    # 'C:'
+    letter: str
+    label: str
+    file_system: str
+    size: int
+    # Physical disks the volume sits on, more than one for spanned or striped volumes
+    disk_numbers: Tuple[int, ...]
+    is_system: bool
+    # MSFT_PhysicalDisk.MediaType of the disks, 0 if unknown or if they're of different types
+    media_type: int = 0
+
+
+def _drive_letter(value) -> str:
+    # The storage namespace returns drive letters as char16, which sometimes arrives as a number
+    if isinstance(value, int):
+        return chr(value) if value else ''
+    return (value or '').strip('\x00')
+
+
+def _media_types(disk_rows: List[dict], physical_disk_rows: List[dict]) -> Dict[int, int]:
+    # MSFT_Partition.DiskNumber is MSFT_Disk.Number, which isn't always MSFT_PhysicalDisk.DeviceId (Storage Spaces,
+    # some USB and RAID controllers), so the disks are matched by their unique ID, or their serial number without one
+    by_unique_id = {disk['UniqueId']: disk for disk in physical_disk_rows if disk.get('UniqueId')}
+    by_serial_number = {
+        disk['SerialNumber'].strip(): disk for disk in physical_disk_rows if (disk.get('SerialNumber') or '').strip()
+    }
+    media_types = {}
+    for disk in disk_rows:
+        physical_disk = by_unique_id.get(disk.get('UniqueId')) or by_serial_number.get(
+            (disk.get('SerialNumber') or '').strip()
+        )
+        if physical_disk is not None:
+            media_types[int(disk['Number'])] = int(physical_disk['MediaType'] or 0)
+    return media_types
+
+
+def group_volumes(volume_rows: List[dict], partition_rows: List[dict], system_drive: str,
+                  disk_rows: Optional[List[dict]] = None,
+                  physical_disk_rows: Optional[List[dict]] = None) -> List[Volume]:
+    """
+    Combines MSFT_Volume and MSFT_Partition rows into volumes with the disks they're on. With the MSFT_Disk and
+    MSFT_PhysicalDisk rows, the media type of the disks is filled in as well
+    """
+    media_types = _media_types(disk_rows or [], physical_disk_rows or [])
+    disks: Dict[str, set] = {}
+    for partition in partition_rows:
+        letter = _drive_letter(partition['DriveLetter'])
+        if letter:
+            disks.setdefault(letter.upper(), set()).add(int(partition['DiskNumber']))
+    volumes = []
+    for row in volume_rows:
+        letter = _drive_letter(row['DriveLetter']).upper()
+        if not letter or row['DriveType'] != _DRIVE_TYPE_FIXED or letter not in disks:
+            continue
+        volume_media_types = {media_types.get(number, 0) for number in disks[letter]}
+        volumes.append(Volume(
+            letter=letter + ':',
+            label=row['FileSystemLabel'] or '',
+            file_system=row['FileSystem'] or '',
+            size=int(row['Size'] or 0),
+            disk_numbers=tuple(sorted(disks[letter])),
+            is_system=letter + ':' == system_drive.upper(),
+            media_type=volume_media_types.pop() if len(volume_media_types) == 1 else 0
+        ))
+    return sorted(volumes, key=lambda volume: volume.letter)
+
+
+def get_volumes() -> List[Volume]:
+    """
+    Returns the fixed volumes that have a drive letter, along with the physical disks they're on
+    """
+    storage = get_session('root/Microsoft/Windows/Storage')
+    rows = storage.batch({
+        'volumes': ('MSFT_Volume', ['DriveLetter', 'FileSystemLabel', 'FileSystem', 'Size', 'DriveType'], None),
+        'partitions': ('MSFT_Partition', ['DiskNumber', 'DriveLetter'], None),
+        'disks': ('MSFT_Disk', ['Number', 'UniqueId', 'SerialNumber'], None),
+        'physical_disks': ('MSFT_PhysicalDisk', ['UniqueId', 'SerialNumber', 'MediaType'], None),
+    })
+    return group_volumes(rows['volumes'], rows['partitions'], os.environ.get('SystemDrive', 'C:'), rows['disks'],
+                         rows['physical_disks'])
+
+
+def get_system_volume() -> Optional[Volume]:
+    for volume in get_volumes():
+        if volume.is_system:
+            return volume
+    return None
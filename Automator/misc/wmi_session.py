@@ -0,0 +1,72 @@
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# (class name, properties to select, optional WHERE clause)
+Query = Tuple[str, Iterable[str], Optional[str]]
+
+_thread_sessions = threading.local()
+
+
+class WMISession:
+    """
+    A WMI connection bound to the thread that created it. COM objects can't be shared between threads, so use
+    `get_session()` to get the one belonging to the current thread instead of creating these directly
+    """
+    def __init__(self, namespace: str = 'root/cimv2'):
+        self.namespace = namespace
+        self.thread_id = threading.get_ident()
+        self.logger = logging.getLogger('WMISession')
+        # pywin32 and WMI are only available on Windows. Importing them here keeps everything that merely imports
+        # this module (like the hardware cache) usable without them
+        import pythoncom
+        import wmi
+        # Every thread has to initialize COM before using it. Doing it again on a thread that already did is fine
+        pythoncom.CoInitialize()
+        self.connection = wmi.WMI(namespace=namespace)
+        self.logger.debug('Connected to {} on thread {}'.format(namespace, self.thread_id))
+
+    def query(self, class_name: str, properties: Iterable[str], where: Optional[str] = None) -> List[dict]:
+        """
+        Runs a WQL query that only selects `properties` and returns the results as a list of dicts
+        """
+        if threading.get_ident() != self.thread_id:
+            raise RuntimeError('WMI sessions can only be used on the thread that created them')
+        properties = list(properties)
+        wql = 'SELECT {} FROM {}'.format(', '.join(properties), class_name)
+        if where:
+            wql += ' WHERE ' + where
+        return [{prop: getattr(obj, prop) for prop in properties} for obj in self.connection.query(wql)]
+
+    def batch(self, queries: Dict[str, Query]) -> Dict[str, List[dict]]:
+        """
+        Runs several queries over this connection at once, e.g. `{'battery': ('Win32_Battery', ['Status'], None)}`
+        """
+        return {key: self.query(*query) for key, query in queries.items()}
+
+    def close(self):
+        import pythoncom
+        self.connection = None
+        pythoncom.CoUninitialize()
+
+
+def get_session(namespace: str = 'root/cimv2') -> WMISession:
+    """
+    Returns the WMI session of the current thread, connecting first if there isn't one yet
+    """
+    sessions = getattr(_thread_sessions, 'sessions', None)
+    if sessions is None:
+        sessions = _thread_sessions.sessions = {}
+    if namespace not in sessions:
+        sessions[namespace] = WMISession(namespace)
+    return sessions[namespace]
+
+
+def close_session():
+    """
+    Closes all WMI sessions of the current thread. Worker threads should call this before they exit
+    """
+    sessions = getattr(_thread_sessions, 'sessions', None) or {}
+    for session in sessions.values():
+        session.close()
+    sessions.clear()
@@ -0,0 +1,174 @@
+"""
+Replays recorded scan transcripts through the same capture -> parse -> UI path the rescue dialog uses
+
+Transcripts are recorded by starting the Automator with AUTOMATOR_RECORD_TRANSCRIPTS=1 set, they end up in
+%ProgramData%\\24HS-Automator\\transcripts. The stand-in process (python -m Automator.misc.transcript) runs anywhere,
+on Linux use QT_QPA_PLATFORM=offscreen if there's no display:
+
+    python benchmarks/replay.py <transcript.jsonl> [<transcript.jsonl> ...] [--speed 50] [--tool sfc]
+
+Reports how long lines take from being written to showing up on screen, CPU time, Python allocations and peak memory
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtWidgets import QApplication, QProgressBar
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from Automator.gui.output import BufferedOutput, OutputView, ProgressTracker, ScanOutput  # noqa: E402
+from Automator.gui.rescuecommands import ProcessWatcher  # noqa: E402
+from Automator.misc.capture import LocalProcessCapture  # noqa: E402
+from Automator.misc.progress_parsers import get_parser  # noqa: E402
+from Automator.misc.transcript import load_transcript  # noqa: E402
+
+
+def _percentile(values: list, percent: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class _Relay(QObject):
+    """
+    Tells the GUI thread that the stand-in has exited
+    """
+    finished = pyqtSignal()
+
+
+class _LatencyMeter:
+    """
+    Follows every line from when the stand-in wrote it until it's on screen. ScanOutput.feed() puts progress into the
+    progress bar right away and hands everything else to BufferedOutput, so a batch is on screen once it has been fed
+    if nothing is waiting for a flush, and with the next flush otherwise
+    """
+    def __init__(self, output: BufferedOutput, expected_times: deque):
+        self.output = output
+        # Seconds after `start`
+        self.expected_times = expected_times
+        self.start = 0.0
+        self.waiting = []
+        self.latencies = []
+        self.line_count = 0
+
+    def fed(self, lines: list):
+        # Connected after ScanOutput.feed(), so this runs once the batch went through it
+        now = time.perf_counter()
+        self.line_count += len(lines)
+        times = [self.start + self.expected_times.popleft() if self.expected_times else now for _ in lines]
+        if self.output.pending():
+            self.waiting.extend(times)
+        else:
+            self.latencies.extend(now - written for written in times)
+
+    def flushed(self, _count: int):
+        now = time.perf_counter()
+        self.latencies.extend(now - written for written in self.waiting)
+        self.waiting = []
+
+
+def replay(app: QApplication, path: str, speed: float, tool: str, max_lines: int) -> dict:
+    header, entries = load_transcript(path)
+    tool = tool or os.path.basename(header['tool'].split(' ')[0]).lower()
+    if tool not in ('sfc', 'dism', 'chkdsk'):
+        tool = 'chkdsk'
+
+    view = OutputView(max_lines)
+    progress_bar = QProgressBar()
+    progress_bar.setMaximum(100)
+    output = BufferedOutput(view)
+    scan_output = ScanOutput(output, ProgressTracker(progress_bar), get_parser(tool, header['tool']))
+
+    # The watcher isn't started, the stand-in takes the place of the scan. Its lines take the same way from the
+    # capture thread to the dialog as those of a real scan, and are wired up like in RescueCommandsWindow
+    watcher = ProcessWatcher(header['tool'], header['encoding'], skip_last_line=False)
+    # The stand-in writes line n at start + t(n) / speed, that's what latencies are measured against
+    expected = deque(entry[0] / speed if speed > 0 else 0 for entry in entries if entry[1])
+    meter = _LatencyMeter(output, expected)
+    # noinspection PyUnresolvedReferences
+    watcher.newLines.connect(scan_output.feed)
+    # noinspection PyUnresolvedReferences
+    watcher.newLines.connect(meter.fed)
+    # noinspection PyUnresolvedReferences
+    output.flushed.connect(meter.flushed)
+    relay = _Relay()
+    # noinspection PyUnresolvedReferences
+    relay.finished.connect(app.quit)
+    capture = LocalProcessCapture(
+        [sys.executable, '-m', 'Automator.misc.transcript', path, '--speed', str(speed)],
+        header['encoding'],
+        # noinspection PyProtectedMember
+        watcher._new_lines,
+        # noinspection PyUnresolvedReferences
+        relay.finished.emit
+    )
+
+    tracemalloc.start()
+    cpu_start = time.process_time()
+    start = meter.start = time.perf_counter()
+    capture.start()
+    app.exec()
+    output.flush()
+    wall_time = time.perf_counter() - start
+    cpu_time = time.process_time() - cpu_start
+    _, peak_traced = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    return {
+        'transcript': os.path.basename(path),
+        'tool': tool,
+        'lines': meter.line_count,
+        'wall_time': wall_time,
+        'cpu_time': cpu_time,
+        'latencies': meter.latencies,
+        'allocated_blocks': sum(stat.count for stat in snapshot.statistics('filename')),
+        'peak_traced': peak_traced,
+    }
+
+
+def peak_rss() -> int:
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('transcripts', nargs='+')
+    parser.add_argument('--speed', type=float, default=1.0, help='Playback speed, 0 plays everything at once')
+    parser.add_argument('--tool', choices=['sfc', 'dism', 'chkdsk'], help='Parser to use, guessed if not given')
+    parser.add_argument('--max-lines', type=int, default=10000, help='Lines kept in the output view')
+    args = parser.parse_args()
+
+    # The stand-in is started as 'python -m Automator.misc.transcript', so it has to run from the repository root
+    paths = [os.path.abspath(path) for path in args.transcripts]
+    os.chdir(REPO_ROOT)
+    app = QApplication(sys.argv[:1])
+    for path in paths:
+        result = replay(app, path, args.speed, args.tool, args.max_lines)
+        latencies = result['latencies'] or [0]
+        print('{transcript} ({tool}, {lines} lines)'.format(**result))
+        print('  wall time:           {:.3f}s'.format(result['wall_time']))
+        print('  CPU time:            {:.3f}s'.format(result['cpu_time']))
+        print('  line-to-screen:      median {:.1f}ms, p95 {:.1f}ms, max {:.1f}ms'.format(
+            statistics.median(latencies) * 1000, _percentile(latencies, 95) * 1000, max(latencies) * 1000
+        ))
+        print('  live allocations:    {} blocks at the end'.format(result['allocated_blocks']))
+        print('  peak traced memory:  {:.1f} MiB'.format(result['peak_traced'] / 1024 / 1024))
+    rss = peak_rss()
+    if rss:
+        print('Peak RSS of this process: {:.1f} MiB'.format(rss / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
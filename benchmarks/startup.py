@@ -0,0 +1,87 @@
+"""
+Measures how long the Automator takes to start up
+
+Reports the time until the main window is shown (from launching the process, and from inside the process) and
+the import cost of every module loaded on the way there. Run from the repository root:
+
+    python benchmarks/startup.py [--runs 5] [--command dist\\main\\main.exe]
+
+Without --command, main.py is started with the current interpreter. Either way it's started with
+--no-single-instance, so an Automator that's already running doesn't take over the request
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_FIRST_WINDOW = re.compile(r'STARTUP_BENCHMARK first_window=([\d.]+)')
+# Lines from -X importtime look like 'import time:       123 |       4567 |   some.module'
+_IMPORT_TIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def time_to_first_window(command: list, runs: int) -> tuple:
+    env = dict(os.environ, AUTOMATOR_STARTUP_BENCHMARK='1', PYTHONPATH=REPO_ROOT)
+    wall_times = []
+    in_process_times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.PIPE, text=True)
+        for line in proc.stdout:
+            match = _FIRST_WINDOW.search(line)
+            if match:
+                wall_times.append(time.perf_counter() - start)
+                in_process_times.append(float(match.group(1)))
+                break
+        proc.stdout.close()
+        proc.wait()
+    return wall_times, in_process_times
+
+
+def import_costs(top: int) -> list:
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=REPO_ROOT, env=dict(os.environ, PYTHONPATH=REPO_ROOT), stderr=subprocess.PIPE, text=True
+    )
+    costs = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match:
+            costs.append((int(match.group(2)), int(match.group(1)), match.group(4)))
+    # Only top-level packages and our own modules, otherwise this list is mostly noise
+    costs = [cost for cost in costs if '.' not in cost[2] or cost[2].startswith('Automator')]
+    return sorted(costs, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--command', help='Packaged binary to start instead of main.py')
+    parser.add_argument('--top', type=int, default=25, help='How many modules to list import costs for')
+    args = parser.parse_args()
+
+    command = [args.command] if args.command else [sys.executable, os.path.join(REPO_ROOT, 'main.py')]
+    command.append('--no-single-instance')
+    wall_times, in_process_times = time_to_first_window(command, args.runs)
+    if not wall_times:
+        print('The Automator never reported its first window')
+    else:
+        print('Time to first window over {} runs:'.format(len(wall_times)))
+        print('  from launch:      median {:.3f}s, min {:.3f}s'.format(
+            statistics.median(wall_times), min(wall_times)
+        ))
+        print('  inside main.py:   median {:.3f}s, min {:.3f}s'.format(
+            statistics.median(in_process_times), min(in_process_times)
+        ))
+
+    if not args.command:
+        print('\nImport cost while starting up (cumulative / self):')
+        for cumulative, self_time, module in import_costs(args.top):
+            print('  {:>8.1f}ms {:>8.1f}ms  {}'.format(cumulative / 1000, self_time / 1000, module))
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,8 @@
-@pyinstaller --onefile --add-data 24hs.png;. main.py
+@echo off
+rem Pass "onedir" to get an unpacked build that starts faster, since it doesn't have to extract itself on
+rem every launch. The default single file build is what gets published as a release
+if "%1"=="onedir" (
+    pyinstaller --noconfirm --onedir --add-data 24hs.png;. main.py
+) else (
+    pyinstaller --onefile --add-data 24hs.png;. main.py
+)
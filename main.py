@@ -1,36 +1,86 @@
+import time
+_import_start = time.perf_counter()
+
+from sys import argv, exit
+
+# The elevated broker is the same binary, see Automator/misc/broker.py. It has no UI, so it's started before Qt and
+# the windows are imported, and gets to read (and delete) its authkey file right away
+if __name__ == '__main__' and argv[1:2] == ['--broker']:
+    from Automator.misc.broker import read_authkey, serve
+    serve(argv[2], read_authkey(argv[3]))
+    exit(0)
+
 import ctypes
 import logging
 import os
-from sys import argv, exit, stdout
+import sys
 
+from PyQt6.QtCore import QTimer
 from PyQt6.QtGui import QIcon
 from PyQt6.QtWidgets import QApplication
 
 from Automator.gui.main import MainWindow
+from Automator.misc.paths import get_data_path
 
 
 def main():
-    main_path = os.path.join(os.path.expandvars('%ProgramData%'), '24HS-Automator')
-    if not os.path.isdir(main_path):
-        os.mkdir(main_path)
+    # '--open <button id>' opens one of the tools right away, e.g. '--open rescuecommands'
+    message = 'activate'
+    if '--open' in argv[1:-1]:
+        message = 'open ' + argv[argv.index('--open') + 1]
+
+    # If the Automator is already running, let that instance handle this instead of starting up a second time.
+    # '--no-single-instance' starts up anyway, benchmarks/startup.py uses it so a running Automator doesn't skew it
+    instance = None
+    if '--no-single-instance' not in argv[1:]:
+        from Automator.misc.single_instance import SingleInstance
+        instance = SingleInstance()
+        if instance.forward(message):
+            exit(0)
 
     logging.basicConfig(
         level=logging.INFO,
         format='[%(asctime)s] [%(name)s/%(levelname)s] %(message)s',
         datefmt='%H:%M:%S',
         handlers=[
-            logging.StreamHandler(stdout),
-            logging.FileHandler(os.path.join(main_path, 'log.txt'))
+            logging.StreamHandler(sys.stdout),
+            logging.FileHandler(get_data_path('log.txt'))
         ]
     )
 
+    # A previous run may have downloaded an update, install it before anything else happens. Only the packaged
+    # binary can be updated
+    if getattr(sys, 'frozen', False):
+        from Automator.misc.updater import apply_pending_update
+        if apply_pending_update():
+            exit(0)
+
     app = QApplication(argv)
+    if instance is not None and not instance.listen() and instance.forward(message):
+        exit(0)
     app.setWindowIcon(QIcon(os.path.join(os.path.dirname(__file__), '24hs.png')))
     app_id = '24hs.automator'
     ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(app_id)
     window = MainWindow()
+    if instance is not None:
+        # noinspection PyUnresolvedReferences
+        instance.messageReceived.connect(window.handle_instance_message)
     window.show()
-    exit(app.exec())
+    if message != 'activate':
+        QTimer.singleShot(0, lambda: window.handle_instance_message(message))
+    # Used by benchmarks/startup.py. Single-shot timers only fire once the event loop runs, so by then the window
+    # has been shown
+    if os.environ.get('AUTOMATOR_STARTUP_BENCHMARK'):
+        def report_first_window():
+            print('STARTUP_BENCHMARK first_window={:.4f}'.format(time.perf_counter() - _import_start), flush=True)
+            app.quit()
+        QTimer.singleShot(0, report_first_window)
+    exit_code = app.exec()
+    # The broker module is only loaded once one of the tools used it
+    broker = sys.modules.get('Automator.misc.broker')
+    if broker is not None:
+        broker.shutdown_broker()
+    exit(exit_code)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,117 @@
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+from Automator.misc.broker import ALLOWED_COMMANDS, BrokerClient, BrokerError, BrokerNotStarted, parse_request, \
+    resolve_command
+from Automator.misc.process import PopenProcessHandle
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROGRAMS = {name: (r'C:\Windows\System32\{}.exe'.format(name), check) for name, check in ALLOWED_COMMANDS.items()}
+
+
+@pytest.mark.parametrize('command', [
+    'sfc /scannow',
+    'SFC.exe /SCANNOW',
+    'DISM /Online /Cleanup-Image /RestoreHealth',
+    r'DISM /Online /Cleanup-Image /RestoreHealth /Source:WIM:C:\ProgramData\cache\install.wim:6 /LimitAccess',
+    r'DISM /Online /Cleanup-Image /RestoreHealth "/Source:ESD:D:\my images\install.esd:1" /LimitAccess',
+    'chkdsk C:',
+    'chkdsk D: /scan',
+    'chkdsk C: /r /x',
+])
+def test_commands_of_the_automator_are_allowed(command):
+    args = resolve_command(command, _PROGRAMS)
+    assert args[0].startswith('C:\\Windows\\System32\\')
+
+
+def test_program_is_replaced_by_its_absolute_path():
+    assert resolve_command('chkdsk C: /r /x', _PROGRAMS) == [r'C:\Windows\System32\chkdsk.exe', 'C:', '/r', '/x']
+
+
+@pytest.mark.parametrize('command', [
+    r'X:\anywhere\sfc.exe /scannow',
+    r'"C:\Windows\System32\sfc.exe" /scannow',
+    './sfc /scannow',
+    'cmd /c whoami',
+    'sfc /scannow /offbootdir=C:\\',
+    'DISM /Online /Cleanup-Image /RestoreHealth /Source:WIM:\\\\server\\share\\install.wim:1 /LimitAccess',
+    'DISM /Online /Add-Package /PackagePath:C:\\evil.cab',
+    'chkdsk C: /f',
+    'chkdsk C: /r /x & whoami',
+    '',
+])
+def test_everything_else_is_refused(command):
+    with pytest.raises(BrokerError):
+        resolve_command(command, _PROGRAMS)
+
+
+@pytest.mark.parametrize('data', [
+    b'\x80\x04\x95',
+    b'{"run": 1}',
+    b'[]',
+    b'["run", 1, "sfc /scannow"]',
+    b'["run", "1", "sfc /scannow", null]',
+    b'["run", true, "sfc /scannow", null]',
+    b'["run", 1, ["sfc", "/scannow"], null]',
+    b'["run", 1, "sfc /scannow", "not base64!"]',
+    b'["cancel", -1]',
+    b'["shutdown", 1]',
+    b'["exec", "whoami"]',
+])
+def test_malformed_requests_are_refused(data):
+    with pytest.raises(ValueError):
+        parse_request(data)
+
+
+def test_requests():
+    assert parse_request(b'["run", 1, "chkdsk C: /r /x", "WQ0K"]') == ('run', 1, 'chkdsk C: /r /x', b'Y\r\n')
+    assert parse_request(b'["run", 2, "sfc /scannow", null]') == ('run', 2, 'sfc /scannow', None)
+    assert parse_request(b'["cancel", 2]') == ('cancel', 2)
+    assert parse_request(b'["shutdown"]') == ('shutdown',)
+
+
+def _stand_in(*extra_args):
+    def launch(address, authkey_path):
+        return PopenProcessHandle(subprocess.Popen(
+            [sys.executable, '-m', 'Automator.misc.broker', address, authkey_path] + list(extra_args), cwd=_ROOT
+        ))
+    return launch
+
+
+@pytest.mark.skipif(os.name == 'nt' or not shutil.which('echo'), reason='Needs the unelevated stand-in')
+def test_stand_in_runs_commands():
+    client = BrokerClient()
+    client.start(_stand_in('--allow', 'echo'), timeout=30)
+    try:
+        output = []
+        job = client.run('echo hello', output.append)
+        assert job.wait(10)
+        assert job.exit_code == 0
+        assert b''.join(output) == b'hello\n'
+        assert job.usage.wall_time >= 0
+        refused = client.run('sh -c whoami', output.append)
+        assert refused.wait(10)
+        assert refused.exit_code == -1 and 'not allowed' in refused.error
+    finally:
+        client.shutdown()
+
+
+def test_broker_that_exits_early_fails_right_away(tmp_path):
+    def launch(address, authkey_path):
+        return PopenProcessHandle(subprocess.Popen([sys.executable, '-c', 'raise SystemExit(3)']))
+
+    started = time.monotonic()
+    with pytest.raises(BrokerError, match='exited with code 3'):
+        BrokerClient().start(launch, timeout=30)
+    assert time.monotonic() - started < 10
+
+
+def test_declined_launch():
+    with pytest.raises(BrokerNotStarted):
+        BrokerClient().start(lambda address, authkey_path: None)
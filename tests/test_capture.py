@@ -0,0 +1,49 @@
+import sys
+import threading
+
+from Automator.misc.capture import FileCapture, create_capture
+
+# Writes in pieces, with a line split in the middle of a multi-byte character and no line break at the end
+_CHILD = '''
+import sys, time
+data = 'Verification 1% complete.\\r\\nVerification 45% complete.\\r\\nÜberprüfung\\r\\nVerification 100% complete.'
+data = data.encode('utf-8')
+middle_of_u = data.index('Ü'.encode('utf-8')) + 1
+for start, end in [(0, 32), (32, middle_of_u), (middle_of_u, len(data))]:
+    sys.stdout.buffer.write(data[start:end])
+    sys.stdout.buffer.flush()
+    time.sleep(0.05)
+sys.exit(3)
+'''
+
+
+def test_local_process_streams_lines_and_exit_code():
+    lines = []
+    closed = threading.Event()
+    capture = create_capture(
+        'local', 'test', 'utf-8', lines.extend, closed.set, keep_partial_line=True, args=[sys.executable, '-c', _CHILD]
+    )
+    capture.start()
+    assert closed.wait(30)
+    capture.stop()
+    assert lines == [
+        'Verification 1% complete.', 'Verification 45% complete.', 'Überprüfung', 'Verification 100% complete.'
+    ]
+    assert capture.exit_code == 3
+
+
+def test_partial_last_line_is_dropped_by_default():
+    lines = []
+    closed = threading.Event()
+    capture = create_capture('local', 'test', 'utf-8', lines.extend, closed.set, args=[sys.executable, '-c', _CHILD])
+    capture.start()
+    assert closed.wait(30)
+    capture.stop()
+    assert lines[-1] == 'Überprüfung'
+
+
+def test_redirect_keeps_quotes_and_spaces(tmp_path):
+    capture = FileCapture('sfc', 'utf-8', lambda lines: None)
+    capture.path = r'C:\Users\First Last\AppData\Local\Temp\sfc.log'
+    command = r'DISM /Online /Cleanup-Image /RestoreHealth "/Source:WIM:D:\My Images\install.wim:1" /LimitAccess'
+    assert capture.redirect(command) == command + r' 1>"C:\Users\First Last\AppData\Local\Temp\sfc.log" 2>&1'
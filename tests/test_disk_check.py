@@ -0,0 +1,47 @@
+from Automator.misc.disk_check import CLEAN, FAILED, REPAIR_QUEUED, REPAIRED, SCHEDULED, DiskCheckPlan
+from Automator.misc.volumes import Volume
+
+_SYSTEM = Volume('C:', '', 'NTFS', 500 * 1000 ** 3, (0,), True)
+_DATA = Volume('D:', 'Data', 'NTFS', 2000 * 1000 ** 3, (1,), False)
+
+
+def _repair_jobs(plan: DiskCheckPlan):
+    # The scans find something on every volume
+    for job in plan.next_jobs():
+        assert plan.job_finished(job, 3) == REPAIR_QUEUED
+    jobs = plan.next_jobs()
+    assert all(job.repair for job in jobs)
+    return {job.volume.letter: job for job in jobs}
+
+
+def test_repair_of_a_data_volume():
+    plan = DiskCheckPlan([_SYSTEM, _DATA])
+    jobs = _repair_jobs(plan)
+    assert jobs['D:'].command == 'chkdsk D: /r /x'
+    assert plan.job_finished(jobs['D:'], 1) == REPAIRED
+    assert plan.job_finished(jobs['C:'], 0) == SCHEDULED
+    assert plan.scheduled_volumes() == ['C:']
+
+
+def test_data_volume_in_use_is_scheduled():
+    plan = DiskCheckPlan([_DATA])
+    job = _repair_jobs(plan)['D:']
+    assert plan.job_finished(job, 0, checked=False) == SCHEDULED
+    assert plan.is_finished() and plan.restart_required()
+    assert plan.scheduled_volumes() == ['D:']
+
+
+def test_repair_that_leaves_errors_fails():
+    plan = DiskCheckPlan([_DATA])
+    job = _repair_jobs(plan)['D:']
+    assert plan.job_finished(job, 3) == FAILED
+    assert not plan.restart_required()
+
+
+def test_clean_scan_needs_no_repair():
+    plan = DiskCheckPlan([_DATA])
+    job, = plan.next_jobs()
+    assert job.command == 'chkdsk D: /scan'
+    # Scans never schedule anything, whatever they printed
+    assert plan.job_finished(job, 0, checked=False) == CLEAN
+    assert plan.next_jobs() == []
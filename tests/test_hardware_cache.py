@@ -0,0 +1,64 @@
+from Automator.misc.hardware_cache import HardwareCache, SnapshotBackend
+from Automator.misc.platform_info import HardwareInfo, RamStick
+
+
+class _FakeBackend(SnapshotBackend):
+    def __init__(self):
+        self.boot = 'boot-1'
+        self.ram = 16 * 1024 ** 3
+        self.collected = 0
+
+    def boot_id(self) -> str:
+        return self.boot
+
+    def hardware_id(self) -> str:
+        return 'machine|{}'.format(self.ram)
+
+    def collect(self) -> HardwareInfo:
+        self.collected += 1
+        stick = RamStick('Physical Memory', 3200, 'DIMM1', 'KF3200C16D4/8GX', 'Kingston', 8)
+        return HardwareInfo(has_battery=True, pc_system_type=2, ram_sticks=[stick] * (self.ram // 8 // 1024 ** 3))
+
+
+def test_snapshot_is_reused_until_the_next_boot(tmp_path):
+    backend = _FakeBackend()
+    path = str(tmp_path / 'hardware_cache.json')
+    first = HardwareCache(backend, path).get()
+    # A new cache stands in for the next start of the program
+    assert HardwareCache(backend, path).get() == first
+    assert backend.collected == 1
+    backend.boot = 'boot-2'
+    assert HardwareCache(backend, path).get() == first
+    assert backend.collected == 2
+
+
+def test_ram_change_invalidates_the_snapshot(tmp_path):
+    backend = _FakeBackend()
+    path = str(tmp_path / 'hardware_cache.json')
+    assert len(HardwareCache(backend, path).get().ram_sticks) == 2
+    backend.ram = 32 * 1024 ** 3
+    assert len(HardwareCache(backend, path).get().ram_sticks) == 4
+    assert backend.collected == 2
+
+
+def test_corrupt_file_is_replaced(tmp_path):
+    backend = _FakeBackend()
+    path = tmp_path / 'hardware_cache.json'
+    path.write_text('{"boot_id": "boot-1", "hardware_id": ', encoding='utf-8')
+    info = HardwareCache(backend, str(path)).get()
+    assert backend.collected == 1
+    assert HardwareCache(backend, str(path)).get() == info
+    assert backend.collected == 1
+
+
+def test_invalidate_removes_the_snapshot(tmp_path):
+    backend = _FakeBackend()
+    path = tmp_path / 'hardware_cache.json'
+    cache = HardwareCache(backend, str(path))
+    cache.get()
+    cache.get()
+    assert backend.collected == 1
+    cache.invalidate()
+    assert not path.exists()
+    cache.get()
+    assert backend.collected == 2
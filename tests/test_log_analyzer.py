@@ -0,0 +1,74 @@
+import os
+
+from Automator.misc.log_analyzer import MAX_FILES, analyze_logs, log_offsets, summarize
+
+LOGS = os.path.join(os.path.dirname(__file__), 'logs')
+
+# What the logs held before the scan, none of it may show up in the findings
+_EARLIER_SESSION = (
+    '2026-10-16 18:00:00, Info                  CSI    00000001 [SR] Repairing corrupted file \\??\\C:\\old.dll '
+    'from store\r\n'
+    '2026-10-16 18:00:01, Error                 DISM   DISM.EXE: An earlier failure. hr:0x80070005\r\n'
+)
+
+
+def _read(name: str) -> bytes:
+    with open(os.path.join(LOGS, name), 'rb') as f:
+        return f.read()
+
+
+def _logs_with_earlier_session(tmp_path):
+    paths = []
+    for name in ['CBS.log', 'dism.log']:
+        path = str(tmp_path / name)
+        with open(path, 'wb') as f:
+            f.write(_EARLIER_SESSION.encode())
+        paths.append(path)
+    return paths
+
+
+def _append_sample(paths):
+    for path in paths:
+        with open(path, 'ab') as f:
+            f.write(_read(os.path.basename(path)))
+
+
+def test_only_the_new_part_is_read(tmp_path):
+    paths = _logs_with_earlier_session(tmp_path)
+    offsets = log_offsets(paths)
+    _append_sample(paths)
+    findings = analyze_logs(offsets, chunk_size=64)
+    assert findings.lines_read == 18
+    assert findings.repaired == ['\\??\\C:\\WINDOWS\\System32\\audiosrv.dll']
+    assert findings.unrepairable == ['Amd64\\CNBJ2530.DPB']
+    assert findings.counts == {
+        'corrupt': 3, 'repaired': 1, 'unrepairable': 1, 'errors': 3, 'dism_detected': 2, 'dism_repaired': 1
+    }
+    assert 'An earlier failure' not in ' '.join(findings.errors)
+    assert findings.problem is None
+
+
+def test_rotated_log_is_read_from_the_start(tmp_path):
+    paths = _logs_with_earlier_session(tmp_path)
+    offsets = {path: 10 ** 6 for path in paths}
+    for path in paths:
+        with open(path, 'wb') as f:
+            f.write(_read(os.path.basename(path)))
+    assert analyze_logs(offsets).lines_read == 18
+
+
+def test_missing_log_is_skipped(tmp_path):
+    findings = analyze_logs({str(tmp_path / 'CBS.log'): 0})
+    assert findings.lines_read == 0
+    assert findings.problem is None
+
+
+def test_summary_shows_the_last_error(tmp_path):
+    path = str(tmp_path / 'dism.log')
+    with open(path, 'w') as f:
+        for i in range(MAX_FILES + 50):
+            f.write('2026-10-17 09:25:02, Error                 DISM   Failure {}\n'.format(i))
+    findings = analyze_logs({path: 0})
+    assert findings.counts['errors'] == MAX_FILES + 50
+    assert len(findings.errors) == MAX_FILES
+    assert 'Errors logged: {}, last one: DISM   Failure {}'.format(MAX_FILES + 50, MAX_FILES + 49) in summarize(findings)
@@ -0,0 +1,81 @@
+import codecs
+
+from Automator.misc.msinfo_report import MsInfoReport
+
+_LINES = [
+    'System Information report written at: 10/17/26 10:00:00',
+    '[System Summary]',
+    '',
+    'Item\tValue\t',
+    'OS Name\tMicrosoft Windows 11 Pro\t',
+    'Processor\tAMD Ryzen 7 5800X\t',
+    '',
+    '[Components]',
+    '',
+    '[Display]',
+    '',
+    'Item\tValue\t',
+    'Name\tNVIDIA GeForce RTX 3070\t',
+    'Driver Version\t31.0.15.4601\t',
+    '',
+    'Name\tIntel UHD\t',
+    'Driver Version\t\t',
+    '',
+    '[Software Environment]',
+    '',
+    '[Signed Drivers]',
+    '',
+    'Device Name\tSigned\tDriver Version\tManufacturer\tINF Name\t',
+    'NVIDIA GeForce RTX 3070\tYes\t31.0.15.4601\tNVIDIA\toem12.inf\t',
+    'Generic volume\tYes\t10.0.1\t\t\t',
+    '\t\t\t\t\t',
+]
+
+
+def _write_report(path, lines=_LINES):
+    with open(path, 'wb') as f:
+        f.write(codecs.BOM_UTF16_LE + '\r\n'.join(lines).encode('utf_16_le'))
+
+
+def test_paths_follow_the_category_tree(tmp_path):
+    path = tmp_path / 'Sysinfo.txt'
+    _write_report(path)
+    report = MsInfoReport(str(path), chunk_size=64)
+    assert [entry.path for entry in report.sections()] == [
+        'System Summary', 'Components', 'Components/Display', 'Software Environment',
+        'Software Environment/Signed Drivers',
+    ]
+
+
+def test_read_section(tmp_path):
+    path = tmp_path / 'Sysinfo.txt'
+    _write_report(path)
+    report = MsInfoReport(str(path), chunk_size=64)
+    assert report.read_section('System Summary').items() == {
+        'OS Name': 'Microsoft Windows 11 Pro', 'Processor': 'AMD Ryzen 7 5800X'
+    }
+    display = report.read_section('display')
+    assert [table.rows for table in display.tables] == [
+        [['Name', 'NVIDIA GeForce RTX 3070'], ['Driver Version', '31.0.15.4601']],
+        [['Name', 'Intel UHD'], ['Driver Version', '']],
+    ]
+
+
+def test_empty_cells_at_the_end_are_kept(tmp_path):
+    path = tmp_path / 'Sysinfo.txt'
+    _write_report(path)
+    section = MsInfoReport(str(path)).read_section('Software Environment/Signed Drivers')
+    columns = section.tables[0].columns
+    assert columns == ['Device Name', 'Signed', 'Driver Version', 'Manufacturer', 'INF Name']
+    assert section.tables[0].rows == [
+        ['NVIDIA GeForce RTX 3070', 'Yes', '31.0.15.4601', 'NVIDIA', 'oem12.inf'],
+        ['Generic volume', 'Yes', '10.0.1', '', ''],
+        ['', '', '', '', ''],
+    ]
+
+
+def test_short_rows_are_padded(tmp_path):
+    path = tmp_path / 'Sysinfo.txt'
+    _write_report(path, _LINES[:-3] + ['Generic volume\tYes\t'])
+    rows = MsInfoReport(str(path)).read_section('Signed Drivers').tables[0].rows
+    assert rows == [['Generic volume', 'Yes', '', '', '']]
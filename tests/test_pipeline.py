@@ -0,0 +1,76 @@
+from Automator.misc.pipeline import DONE, FAILED, PENDING, WAITING_FOR_RESTART, Pipeline, maintenance_tasks, \
+    parse_boot_check_event
+
+_EVENT = '''<Event xmlns="http://schemas.microsoft.com/win/2004/08/events/event">
+  <System>
+    <Provider Name="Wininit"/>
+    <EventID Qualifiers="16384">1001</EventID>
+    <TimeCreated SystemTime="2026-10-17T08:01:02.1234567Z"/>
+  </System>
+  <EventData>
+    <Data>
+
+Checking file system on C:
+The type of the file system is NTFS.
+
+Stage 1: Examining basic file system structure ...
+Windows has scanned the file system and found no problems.
+No further action is required.
+
+ 498439167 KB total disk space.
+Windows has finished checking your disk.
+Please wait while your computer restarts.
+</Data>
+  </EventData>
+</Event>'''
+
+
+def test_chkdsk_runs_on_the_system_drive():
+    tasks = {task.id: task for task in maintenance_tasks('D:')}
+    assert tasks['chkdsk'].command == 'chkdsk D: /r /x'
+
+
+def test_parse_boot_check_event():
+    created, output = parse_boot_check_event(_EVENT)
+    assert created == 1792224062
+    assert 'Checking file system on C:' in output
+
+
+def _waiting_pipeline(tmp_path, boot_check):
+    tasks = maintenance_tasks('C:')
+    pipeline = Pipeline(tasks, str(tmp_path / 'pipeline.json'), boot_id=lambda: 'before')
+    for task in tasks:
+        pipeline.start_task(task)
+        pipeline.finish_task(task, 0)
+    assert pipeline.status('chkdsk') == WAITING_FOR_RESTART
+    return Pipeline.load(tasks, pipeline.path, boot_id=lambda: 'after', boot_check=boot_check)
+
+
+def test_boot_result_is_collected_after_the_restart(tmp_path):
+    checked = []
+
+    def boot_check(task, since):
+        checked.append((task.id, since))
+        return parse_boot_check_event(_EVENT)[1]
+
+    pipeline = _waiting_pipeline(tmp_path, boot_check)
+    assert [task_id for task_id, _ in checked] == ['chkdsk']
+    assert pipeline.status('chkdsk') == DONE
+    assert pipeline.results['chkdsk']['last_lines'] == [
+        'Windows has scanned the file system and found no problems.', 'Windows has finished checking your disk.'
+    ]
+    assert not pipeline.has_pending_tasks()
+
+
+def test_missing_boot_result_fails_the_task(tmp_path):
+    pipeline = _waiting_pipeline(tmp_path, lambda task, since: None)
+    assert pipeline.status('chkdsk') == FAILED
+
+
+def test_interrupted_task_is_pending_again(tmp_path):
+    tasks = maintenance_tasks('C:')
+    pipeline = Pipeline(tasks, str(tmp_path / 'pipeline.json'), boot_id=lambda: 'boot')
+    pipeline.start_task(tasks[0])
+    loaded = Pipeline.load(tasks, pipeline.path, boot_id=lambda: 'boot')
+    assert loaded.status('dism') == PENDING
+    assert loaded.has_pending_tasks()
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from Automator.misc.progress_parsers import MessageEvent, ProgressEvent, StageEvent, get_parser
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'corpus')
+
+# Corpus file, tool, command, the progress it reports and the stages it goes through
+CASES = [
+    ('sfc_en.txt', 'sfc', 'sfc /scannow', [1, 45, 100], []),
+    ('sfc_de.txt', 'sfc', 'sfc /scannow', [1, 45, 100], []),
+    ('sfc_fr.txt', 'sfc', 'sfc /scannow', [1, 45, 100], []),
+    ('sfc_tr.txt', 'sfc', 'sfc /scannow', [1, 45, 100], []),
+    ('dism_en.txt', 'dism', 'DISM /Online /Cleanup-Image /RestoreHealth', [1, 62.3, 100], []),
+    ('dism_fr.txt', 'dism', 'DISM /Online /Cleanup-Image /RestoreHealth', [1, 62.3, 100], []),
+    ('dism_tr.txt', 'dism', 'DISM /Online /Cleanup-Image /RestoreHealth', [1, 62.3, 100], []),
+    ('chkdsk_scan_en.txt', 'chkdsk', 'chkdsk C: /scan', [8, 44, 100], [1, 2, 3]),
+    ('chkdsk_scan_de.txt', 'chkdsk', 'chkdsk C: /scan', [8, 44, 100], [1, 2, 3]),
+    ('chkdsk_scan_tr.txt', 'chkdsk', 'chkdsk C: /scan', [8, 44, 100], [1, 2, 3]),
+    # Per stage progress only, spread over all five stages of /r
+    ('chkdsk_repair_en.txt', 'chkdsk', 'chkdsk D: /r /x', [10, 30, 70, 90], [1, 2, 3, 4, 5]),
+    ('chkdsk_repair_fr.txt', 'chkdsk', 'chkdsk D: /r /x', [10, 30, 70, 90], [1, 2, 3, 4, 5]),
+    ('chkdsk_repair_de.txt', 'chkdsk', 'chkdsk D: /r /x', [10, 30, 70, 90], [1, 2, 3, 4, 5]),
+    ('chkdsk_repair_tr.txt', 'chkdsk', 'chkdsk D: /r /x', [10, 30, 70, 90], [1, 2, 3, 4, 5]),
+]
+
+
+def _events(name: str, tool: str, command: str):
+    with open(os.path.join(CORPUS, name), encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    return get_parser(tool, command).parse(lines)
+
+
+@pytest.mark.parametrize('name, tool, command, progress, stages', CASES)
+def test_corpus(name, tool, command, progress, stages):
+    events = _events(name, tool, command)
+    assert [round(event.percent, 1) for event in events if isinstance(event, ProgressEvent)] == progress
+    assert [event.stage for event in events if isinstance(event, StageEvent)] == stages
+    # Everything else is shown as it is
+    assert any(isinstance(event, MessageEvent) and event.line for event in events)
+
+
+def test_chkdsk_without_repair_has_three_stages():
+    parser = get_parser('chkdsk', 'chkdsk C:')
+    assert parser.stages == 3
+    assert parser.parse(['Stage 3: Examining security descriptors ...', '  50 percent complete (1 of 2).'])[-1] \
+        == ProgressEvent(pytest.approx(100 * 2.5 / 3), '  50 percent complete (1 of 2).')
+
+
+def test_chkdsk_repair_does_not_finish_early():
+    parser = get_parser('chkdsk', 'chkdsk C: /r /x')
+    assert parser.stages == 5
+    events = parser.parse(['Stage 3: Examining security descriptors ...', '  100 percent complete (2 of 2).'])
+    assert events[-1].percent == pytest.approx(60)
+
+
+@pytest.mark.parametrize('line', [
+    '  50 percent complete (1 of 2 file records processed).',
+    '  50 Prozent abgeschlossen (1 von 2 Dateidatensätzen verarbeitet).',
+    '  50 pour cent effectués (1 enregistrements de fichier traités sur 2).',
+    '  Yüzde 50 tamamlandı (2 dosya kaydından 1 tanesi işlendi).',
+    '  50 % completado (1 de 2 registros de archivo procesados).',
+])
+def test_chkdsk_stage_progress_in_other_languages(line):
+    parser = get_parser('chkdsk', 'chkdsk C:')
+    parser.parse(['Stage 2: Examining file name linkage ...'])
+    assert parser.parse_line(line) == ProgressEvent(pytest.approx(100 * 1.5 / 3), line)
+
+
+def test_chkdsk_counts_are_not_stage_progress():
+    parser = get_parser('chkdsk', 'chkdsk C:')
+    for line in ['  456 file records processed.', '  12345 KB in 67 files.', '  4096 bytes in each allocation unit.']:
+        assert isinstance(parser.parse_line(line), MessageEvent)
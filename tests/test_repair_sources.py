@@ -0,0 +1,105 @@
+import os
+import struct
+import threading
+import time
+
+from Automator.misc.repair_sources import ARCH_X64, ARCH_X86, RepairSource, RepairSourceCache, SystemInfo, \
+    match_source, parse_wim_xml, with_repair_source
+
+IMAGES = os.path.join(os.path.dirname(__file__), 'images')
+_XML_OFFSET = 208
+
+
+def _read_xml() -> str:
+    with open(os.path.join(IMAGES, 'install.xml'), encoding='utf-8') as f:
+        return f.read()
+
+
+def _write_wim(path: str, build: int) -> str:
+    """
+    Writes a WIM file that only has a header and the XML data, which is all the cache reads
+    """
+    xml = _read_xml().replace('<BUILD>19041</BUILD>', '<BUILD>{}</BUILD>'.format(build)).encode('utf-16')
+    header = bytearray(_XML_OFFSET)
+    header[:8] = b'MSWIM\0\0\0'
+    header[72:79] = len(xml).to_bytes(7, 'little')
+    struct.pack_into('<QQ', header, 80, _XML_OFFSET, len(xml))
+    with open(path, 'wb') as f:
+        f.write(bytes(header) + xml)
+    return path
+
+
+def _source(path: str, build: int, edition: str = 'Professional', architecture: int = ARCH_X64,
+            last_used: float = 0, managed: bool = True) -> RepairSource:
+    return RepairSource(path, 2, 'Windows 10 Pro', build, edition, architecture, managed, 0, last_used)
+
+
+def test_parse_wim_xml_skips_images_without_windows():
+    images = parse_wim_xml(_read_xml())
+    assert [(image.index, image.name, image.edition) for image in images] == [
+        (1, 'Windows 10 Home', 'Core'), (2, 'Windows 10 Pro', 'Professional')
+    ]
+    assert images[1].build == 19041 and images[1].architecture == ARCH_X64
+
+
+def test_match_source_prefers_the_exact_build(tmp_path):
+    base = _write_wim(str(tmp_path / 'base.wim'), 19041)
+    exact = _write_wim(str(tmp_path / 'exact.wim'), 19045)
+    sources = [
+        _source(base, 19041, last_used=200),
+        _source(exact, 19045, last_used=100),
+        _source(base, 19045, edition='Core', last_used=300),
+        _source(base, 19045, architecture=ARCH_X86, last_used=300),
+    ]
+    assert match_source(sources, SystemInfo(19045, 'professional', ARCH_X64)).path == exact
+    os.remove(exact)
+    # Enablement packages share the component store of their base build
+    assert match_source(sources, SystemInfo(19045, 'Professional', ARCH_X64)).path == base
+    assert match_source(sources, SystemInfo(22631, 'Professional', ARCH_X64)) is None
+
+
+def test_evict_drops_older_and_least_recently_used_builds(tmp_path):
+    cache = RepairSourceCache(str(tmp_path / 'cache'), max_builds=2)
+    old = _write_wim(str(tmp_path / 'old.wim'), 18363)
+    current = _write_wim(str(tmp_path / 'current.wim'), 19041)
+    newer = _write_wim(str(tmp_path / 'newer.wim'), 22621)
+    newest = _write_wim(str(tmp_path / 'newest.wim'), 26100)
+    unmanaged = _write_wim(str(tmp_path / 'unmanaged.wim'), 22000)
+    cache.sources = [
+        _source(old, 18363, last_used=400),
+        _source(current, 19041, last_used=300),
+        _source(newer, 22621, last_used=100),
+        _source(newest, 26100, last_used=200),
+        _source(unmanaged, 22000, last_used=50, managed=False),
+        _source(str(tmp_path / 'gone.wim'), 19041, last_used=500),
+    ]
+    evicted = cache.evict(19045)
+    assert sorted(os.path.basename(source.path) for source in evicted) == [
+        'gone.wim', 'newer.wim', 'old.wim', 'unmanaged.wim'
+    ]
+    assert [source.build for source in RepairSourceCache(cache.directory).sources] == [19041, 26100]
+    assert not os.path.exists(old) and not os.path.exists(newer)
+    # Files that were only registered belong to the user
+    assert os.path.exists(unmanaged)
+
+
+def test_with_repair_source_evicts_in_the_background(tmp_path):
+    cache = RepairSourceCache(str(tmp_path / 'cache'), max_builds=1)
+    cache.register(_write_wim(str(tmp_path / 'install.wim'), 19041))
+    stale = _write_wim(str(tmp_path / 'stale.wim'), 18363)
+    cache.sources.append(_source(stale, 18363, last_used=time.time() + 60))
+    command = with_repair_source('DISM /Online /Cleanup-Image /RestoreHealth', cache,
+                                 SystemInfo(19045, 'Professional', ARCH_X64))
+    assert command.endswith(':2 /LimitAccess')
+    assert '/Source:WIM:' + cache.directory in command
+    for thread in threading.enumerate():
+        if thread.name == 'RepairSourceEviction':
+            thread.join(5)
+    assert not os.path.exists(stale)
+    assert [source.build for source in cache.sources] == [19041, 19041]
+
+
+def test_other_commands_are_left_alone(tmp_path):
+    cache = RepairSourceCache(str(tmp_path / 'cache'))
+    assert with_repair_source('DISM /Online /Cleanup-Image /ScanHealth', cache) == \
+        'DISM /Online /Cleanup-Image /ScanHealth'
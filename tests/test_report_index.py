@@ -0,0 +1,64 @@
+import codecs
+
+from Automator.misc.report_index import ReportIndex
+
+_SUMMARY = [
+    'System Information report written at: 10/17/26 10:00:00',
+    '[System Summary]',
+    '',
+    'Item\tValue\t',
+    'Processor\t{}\t',
+    '',
+]
+_DRIVERS = [
+    '[Software Environment]',
+    '',
+    '[Signed Drivers]',
+    '',
+    'Device Name\tSigned\tDriver Version\tManufacturer\tINF Name\t',
+    'NVIDIA GeForce RTX 3070\tYes\t{}\tNVIDIA\toem12.inf\t',
+]
+
+
+def _write_report(path, cpu, driver_version=None):
+    lines = [line.format(cpu) for line in _SUMMARY]
+    if driver_version is not None:
+        lines += [line.format(driver_version) for line in _DRIVERS]
+    with open(path, 'wb') as f:
+        f.write(codecs.BOM_UTF16_LE + '\r\n'.join(lines).encode('utf_16_le'))
+    return str(path)
+
+
+def test_unreadable_reports_are_skipped(tmp_path):
+    report = _write_report(tmp_path / 'Sysinfo.txt', 'AMD Ryzen 7 5800X', '31.0.15.4601')
+    with ReportIndex(str(tmp_path / 'reports.db')) as index:
+        stats = index.ingest([str(tmp_path / 'missing.txt'), report], workers=1)
+        assert stats == {'added': 1, 'known': 0, 'skipped': 1, 'failed': 0}
+        assert [row[0] for row in index.query(cpu='ryzen')] == [report]
+
+
+def test_wildcards_match_themselves(tmp_path):
+    dotted = _write_report(tmp_path / 'a.txt', 'AMD Ryzen 7 5800X', '31.0.15.4601')
+    underscored = _write_report(tmp_path / 'b.txt', 'Intel 100% Core', '31.0_15.4601')
+    with ReportIndex(str(tmp_path / 'reports.db')) as index:
+        index.ingest([dotted, underscored], workers=1)
+        assert [row[0] for row in index.query(driver_version='31.0_15')] == [underscored]
+        assert [row[0] for row in index.query(driver_version='31.0.')] == [dotted]
+        assert [row[0] for row in index.query(cpu='100%')] == [underscored]
+        assert index.query(cpu='0%C') == []
+
+
+def test_escaped_prefixes_use_the_indexes(tmp_path):
+    with ReportIndex(str(tmp_path / 'reports.db')) as index:
+        plan = index.connection.execute(
+            "EXPLAIN QUERY PLAN SELECT report_id FROM drivers WHERE version LIKE ? ESCAPE '\\'", ['31.0\\_15%']
+        ).fetchall()
+    assert any('drivers_version' in row[-1] for row in plan)
+
+
+def test_reports_without_drivers(tmp_path):
+    with_drivers = _write_report(tmp_path / 'a.txt', 'AMD Ryzen 7 5800X', '31.0.15.4601')
+    without_drivers = _write_report(tmp_path / 'b.txt', 'Intel Core i7')
+    with ReportIndex(str(tmp_path / 'reports.db')) as index:
+        index.ingest([with_drivers, without_drivers], workers=1)
+        assert index.reports_without_drivers() == 1
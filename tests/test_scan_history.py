@@ -0,0 +1,52 @@
+from Automator.misc.scan_history import ScanHistory, ScanKey, ScanRecord
+
+
+def _record(tool: str, finished: int) -> ScanRecord:
+    return ScanRecord(ScanKey(tool, 256 * 1024 ** 3, 4), finished, tuple(range(101)))
+
+
+def test_records_round_trip(tmp_path):
+    history = ScanHistory(str(tmp_path / 'history.bin'))
+    history.add(_record('sfc', 1))
+    history.add(_record('dism', 2))
+    assert history.records() == [_record('sfc', 1), _record('dism', 2)]
+
+
+def test_partial_record_is_cut_off_before_appending(tmp_path):
+    path = tmp_path / 'history.bin'
+    history = ScanHistory(str(path))
+    history.add(_record('sfc', 1))
+    # A crash in the middle of appending the next record
+    with open(path, 'ab') as f:
+        f.write(b'\x01' * 50)
+    assert history.records() == [_record('sfc', 1)]
+    history.add(_record('dism', 2))
+    history.add(_record('chkdsk', 3))
+    assert history.records() == [_record('sfc', 1), _record('dism', 2), _record('chkdsk', 3)]
+
+
+def test_file_without_header_is_started_over(tmp_path):
+    path = tmp_path / 'history.bin'
+    path.write_bytes(b'AH')
+    history = ScanHistory(str(path))
+    history.add(_record('sfc', 1))
+    assert history.records() == [_record('sfc', 1)]
+
+
+def test_file_with_foreign_header_is_started_over(tmp_path):
+    path = tmp_path / 'history.bin'
+    # An older format, or something else entirely that happens to be at this path
+    path.write_bytes(b'AHS0' + b'\x02' * 1000)
+    history = ScanHistory(str(path))
+    assert history.records() == []
+    history.add(_record('sfc', 1))
+    history.add(_record('dism', 2))
+    assert history.records() == [_record('sfc', 1), _record('dism', 2)]
+
+
+def test_compact_keeps_newest_per_key(tmp_path):
+    history = ScanHistory(str(tmp_path / 'history.bin'), max_per_key=2)
+    for finished in range(5):
+        history.add(_record('sfc', finished))
+    history.compact()
+    assert [record.finished for record in history.records()] == [3, 4]
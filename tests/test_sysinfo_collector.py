@@ -0,0 +1,131 @@
+import threading
+import time
+
+from Automator.misc.msinfo_report import Table
+from Automator.misc.sysinfo_collector import CANCELLED, DONE, FAILED, TIMED_OUT, InfoProvider, SysInfoCollector
+
+
+class _Provider(InfoProvider):
+    def __init__(self, category: str, collect=None, timeout: float = 30):
+        self.category = category
+        self.timeout = timeout
+        self._collect = collect
+        self.started = threading.Event()
+
+    def collect(self):
+        self.started.set()
+        if self._collect is not None:
+            return self._collect()
+        return [Table(['Item', 'Value'], [['Name', self.category]])]
+
+
+def test_cancel_stops_collecting():
+    release = threading.Event()
+    blocking = _Provider('Blocking', lambda: release.wait(30) and [])
+    pending = _Provider('Pending')
+    collector = SysInfoCollector([blocking, pending], max_workers=1)
+    threading.Timer(0.1, collector.cancel).start()
+    started = time.monotonic()
+    try:
+        results = collector.collect()
+    finally:
+        release.set()
+    assert time.monotonic() - started < 5
+    assert [result.status for result in results] == [CANCELLED, CANCELLED]
+    assert not pending.started.is_set()
+
+
+def test_cancel_keeps_what_was_collected():
+    release = threading.Event()
+    fast = _Provider('Fast')
+    results = []
+
+    def on_progress(result):
+        results.append(result)
+        collector.cancel()
+
+    blocking = _Provider('Blocking', lambda: release.wait(30) and [])
+    collector = SysInfoCollector([fast, blocking], max_workers=1, on_progress=on_progress)
+    try:
+        collected = collector.collect()
+    finally:
+        release.set()
+    assert [result.status for result in collected] == [DONE, CANCELLED]
+    assert not blocking.started.is_set()
+
+
+def test_results_keep_the_order_of_the_providers():
+    slow = _Provider('Slow', lambda: time.sleep(0.2) or [Table(['Item'], [['slow']])])
+    fast = _Provider('Fast')
+    reported = []
+    results = SysInfoCollector([slow, fast], max_workers=2, on_progress=reported.append).collect()
+    assert [result.category for result in results] == ['Slow', 'Fast']
+    assert [result.status for result in results] == [DONE, DONE]
+    assert results[0].tables == [Table(['Item'], [['slow']])]
+    # Progress comes in as the providers finish
+    assert [result.category for result in reported] == ['Fast', 'Slow']
+
+
+def test_failing_provider_does_not_stop_the_others():
+    def fail():
+        raise ValueError('WMI said no')
+
+    results = SysInfoCollector([_Provider('Broken', fail), _Provider('Fine')]).collect()
+    assert [result.status for result in results] == [FAILED, DONE]
+    assert results[0].error == 'ValueError: WMI said no'
+    assert results[0].tables == []
+
+
+def test_blocking_provider_times_out_and_its_late_result_is_dropped():
+    release = threading.Event()
+    finished_late = threading.Event()
+
+    def block():
+        release.wait(30)
+        finished_late.set()
+        return [Table(['Item'], [['too late']])]
+
+    def release_and_wait():
+        # Lets the timed out provider finish while this one still runs
+        release.set()
+        finished_late.wait(5)
+        time.sleep(0.2)
+        return []
+
+    blocking = _Provider('Blocking', block, timeout=0.2)
+    after = _Provider('After', release_and_wait)
+    reported = []
+    started = time.monotonic()
+    try:
+        results = SysInfoCollector([blocking, after], max_workers=1, on_progress=reported.append).collect()
+    finally:
+        release.set()
+    assert time.monotonic() - started < 5
+    assert [result.status for result in results] == [TIMED_OUT, DONE]
+    assert results[0].tables == [] and results[0].error == 'No result after 0 seconds'
+    # The late result didn't count a second time
+    assert [result.category for result in reported] == ['Blocking', 'After']
+    assert after.started.is_set()
+
+
+def test_timeouts_follow_the_clock():
+    now = [0.0]
+    release = threading.Event()
+
+    def block():
+        release.wait(30)
+        return []
+
+    def tick():
+        now[0] += 100
+        return []
+
+    collector = SysInfoCollector(
+        [_Provider('Blocking', block, timeout=50), _Provider('Tick', tick)], max_workers=2, clock=lambda: now[0]
+    )
+    try:
+        results = collector.collect()
+    finally:
+        release.set()
+    assert [result.status for result in results] == [TIMED_OUT, DONE]
+    assert results[0].duration == 100
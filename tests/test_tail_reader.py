@@ -0,0 +1,50 @@
+from Automator.misc.tail_reader import LineDecoder, TailReader
+
+
+def test_partial_line_waits_for_its_end():
+    decoder = LineDecoder('utf-8')
+    assert decoder.feed(b'Verification 5% complete.\r\nVerifica') == ['Verification 5% complete.']
+    assert decoder.has_pending
+    assert decoder.feed(b'tion 6% complete.\r') == []
+    # The '\r' from the last chunk and this '\n' are a single line break
+    assert decoder.feed(b'\nDone') == ['Verification 6% complete.']
+    assert decoder.flush() == ['Done']
+    assert not decoder.has_pending
+
+
+def test_utf16_code_units_split_across_reads():
+    data = 'Überprüfung 1 %\r\n\U0001F50D Phase 2\r\n'.encode('utf-16-le')
+    decoder = LineDecoder('utf-16-le')
+    lines = []
+    # Odd sizes split code units, and the surrogate pair of the emoji too
+    for start in range(0, len(data), 3):
+        lines.extend(decoder.feed(data[start:start + 3]))
+    assert lines == ['Überprüfung 1 %', '\U0001F50D Phase 2']
+    assert decoder.flush() == []
+
+
+def test_tail_reader_reads_only_what_was_appended(tmp_path):
+    path = tmp_path / 'sfc.log'
+    path.write_bytes('Beginning system scan.\r\nVeri'.encode('utf-16-le'))
+    reader = TailReader(str(path), 'utf-16-le', chunk_size=5)
+    assert reader.read_lines() == ['Beginning system scan.']
+    assert reader.read_lines() == []
+    with open(str(path), 'ab') as f:
+        f.write('fication 1% complete.\r\nVerification 2'.encode('utf-16-le'))
+    assert reader.read_lines() == ['Verification 1% complete.']
+    assert reader.flush() == ['Verification 2']
+
+
+def test_tail_reader_starts_over_when_the_file_is_replaced(tmp_path):
+    path = tmp_path / 'dism.log'
+    path.write_bytes(b'first run, line 1\nfirst run, line 2\nfirst run, partial')
+    reader = TailReader(str(path), 'utf-8')
+    assert reader.read_lines() == ['first run, line 1', 'first run, line 2']
+    # A new, shorter file; the partial line of the old one must not leak into it
+    path.write_bytes(b'second run\n')
+    assert reader.read_lines() == ['second run']
+    path.write_bytes(b'')
+    assert reader.read_lines() == []
+    assert reader.offset == 0
+    path.unlink()
+    assert reader.read_lines() == []
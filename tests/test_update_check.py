@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from Automator.misc.update_check import UpdateChecker, fetch_latest_release
+
+_RELEASE = {'tag_name': '9.9.9', 'name': 'Automator 9.9.9'}
+_ETAG = '"release-etag"'
+
+
+class _GitHub:
+    """
+    Stands in for the releases endpoint, answering with the ETag and 304 once the client sends it back
+    """
+    def __init__(self):
+        self.requests = []
+        self.delay = 0
+        self.release = threading.Event()
+        github = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                github.requests.append(self.headers.get('If-None-Match'))
+                if github.delay:
+                    github.release.wait(github.delay)
+                if self.headers.get('If-None-Match') == _ETAG:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = json.dumps(_RELEASE).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', _ETAG)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}/releases/latest'.format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def github():
+    server = _GitHub()
+    yield server
+    server.close()
+
+
+def test_release_is_revalidated_with_its_etag(github, tmp_path):
+    cache_path = str(tmp_path / 'latest_release.json')
+    assert fetch_latest_release(github.url, cache_path, ttl=0) == _RELEASE
+    assert fetch_latest_release(github.url, cache_path, ttl=0) == _RELEASE
+    assert github.requests == [None, _ETAG]
+    with open(cache_path, encoding='utf-8') as f:
+        assert json.load(f)['etag'] == _ETAG
+
+
+def test_cached_release_is_used_until_the_ttl_expires(github, tmp_path):
+    cache_path = str(tmp_path / 'latest_release.json')
+    fetch_latest_release(github.url, cache_path, ttl=60)
+    assert fetch_latest_release(github.url, cache_path, ttl=60) == _RELEASE
+    assert len(github.requests) == 1
+    with open(cache_path, encoding='utf-8') as f:
+        cached = json.load(f)
+    cached['fetched_at'] = time.time() - 61
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(cached, f)
+    assert fetch_latest_release(github.url, cache_path, ttl=60) == _RELEASE
+    assert github.requests == [None, _ETAG]
+
+
+def test_timeout_falls_back_to_the_cache(github, tmp_path):
+    cache_path = str(tmp_path / 'latest_release.json')
+    fetch_latest_release(github.url, cache_path, ttl=0)
+    github.delay = 5
+    started = time.monotonic()
+    assert fetch_latest_release(github.url, cache_path, ttl=0, timeout=0.2) == _RELEASE
+    assert time.monotonic() - started < 3
+
+
+def test_timeout_without_cache_raises(github, tmp_path):
+    from requests import RequestException
+    github.delay = 5
+    with pytest.raises(RequestException):
+        fetch_latest_release(github.url, str(tmp_path / 'latest_release.json'), timeout=0.2)
+
+
+def test_tag_that_is_not_a_version_fails_the_check(tmp_path):
+    cache_path = str(tmp_path / 'latest_release.json')
+    url = 'http://127.0.0.1:9/releases/latest'
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump({'url': url, 'etag': None, 'fetched_at': time.time(), 'data': {'tag_name': 'nightly'}}, f)
+    checker = UpdateChecker(url, cache_path)
+    failures, updates = [], []
+    # noinspection PyUnresolvedReferences
+    checker.checkFailed.connect(failures.append)
+    # noinspection PyUnresolvedReferences
+    checker.updateAvailable.connect(updates.append)
+    checker._run()
+    assert len(failures) == 1 and 'nightly' in failures[0]
+    assert updates == []
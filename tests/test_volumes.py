@@ -0,0 +1,35 @@
+from Automator.misc.volumes import group_volumes
+
+_VOLUMES = [
+    {'DriveLetter': 'C', 'FileSystemLabel': '', 'FileSystem': 'NTFS', 'Size': 500, 'DriveType': 3},
+    {'DriveLetter': 'D', 'FileSystemLabel': 'Games', 'FileSystem': 'NTFS', 'Size': 2000, 'DriveType': 3},
+    {'DriveLetter': 'E', 'FileSystemLabel': 'USB', 'FileSystem': 'FAT32', 'Size': 16, 'DriveType': 2},
+]
+_PARTITIONS = [
+    {'DiskNumber': 1, 'DriveLetter': 'C'},
+    {'DiskNumber': 0, 'DriveLetter': 'D'},
+    {'DiskNumber': 2, 'DriveLetter': 'E'},
+]
+
+
+def test_media_types_follow_the_disk_numbers():
+    # The disk numbers and the physical disks' device IDs are in a different order
+    disks = [
+        {'Number': 0, 'UniqueId': 'HDD-ID', 'SerialNumber': 'HDD'},
+        {'Number': 1, 'UniqueId': 'NVME-ID', 'SerialNumber': 'NVME'},
+    ]
+    physical_disks = [
+        {'DeviceId': '0', 'UniqueId': 'NVME-ID', 'SerialNumber': 'NVME', 'MediaType': 4},
+        {'DeviceId': '1', 'UniqueId': 'HDD-ID', 'SerialNumber': 'HDD', 'MediaType': 3},
+    ]
+    volumes = group_volumes(_VOLUMES, _PARTITIONS, 'c:', disks, physical_disks)
+    assert [(volume.letter, volume.disk_numbers, volume.is_system, volume.media_type) for volume in volumes] == [
+        ('C:', (1,), True, 4), ('D:', (0,), False, 3),
+    ]
+
+
+def test_serial_number_without_unique_id():
+    disks = [{'Number': 1, 'UniqueId': None, 'SerialNumber': ' NVME '}]
+    physical_disks = [{'DeviceId': '0', 'UniqueId': None, 'SerialNumber': 'NVME', 'MediaType': 4}]
+    volumes = group_volumes(_VOLUMES, _PARTITIONS, 'C:', disks, physical_disks)
+    assert [volume.media_type for volume in volumes] == [4, 0]